@@ -1,12 +1,122 @@
-from django.contrib import admin
+import csv
 
-from .models import Client, Invoice, Payment, SiteConfiguration, Subscription, SubscriptionPlan
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .models import (
+    ApiToken,
+    Client,
+    Invoice,
+    JobRun,
+    Payment,
+    SiteConfiguration,
+    Subscription,
+    SubscriptionPlan,
+    WebhookDelivery,
+    WebhookEndpoint,
+)
+from .utils import INVOICE_BULK_ACTIONS, prefix_filter, run_invoice_bulk_action
+
+# Below this many rows the planner's estimate is not worth being wrong about.
+ESTIMATED_COUNT_MIN_ROWS = 10000
+EXPORT_CHUNK_SIZE = 2000
+
+
+def estimated_count(queryset):
+    """
+    The PostgreSQL planner's row estimate for an unfiltered ``queryset``,
+    or None where an exact COUNT(*) should be run instead: other databases,
+    filtered querysets, small or never-analyzed tables.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql" or queryset.query.where:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < ESTIMATED_COUNT_MIN_ROWS:
+        return None
+    return int(row[0])
+
+
+class Echo:
+    """File-like object for csv.writer that hands each line back instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that counts a whole large table from the planner's statistics."""
+
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        return super().count if estimate is None else estimate
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist settings for tables too big to count or scan per page view.
+
+    Counts come from ``EstimatedCountPaginator``, and the unfiltered total
+    is not counted again next to filtered results. Search fields support
+    ``^field``, a case-insensitive prefix matched through ``prefix_filter``
+    so an UPPER() index can serve it, and ``=field``, an exact match; either
+    avoids the ``LIKE '%term%'`` scan of a plain search field.
+    ``export_fields`` are the columns of the CSV export action.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ("export_csv",)
+    export_fields = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        condition = Q()
+        for field in self.get_search_fields(request):
+            if field.startswith("^"):
+                condition |= prefix_filter(field[1:], term)
+            elif field.startswith("="):
+                condition |= Q(**{field[1:]: term})
+            else:
+                condition |= Q(**{f"{field}__icontains": term})
+        # Only forward relations are searched, so no row is repeated.
+        return queryset.filter(condition), False
+
+    @admin.action(description="Export selected rows as CSV")
+    def export_csv(self, request, queryset):
+        writer = csv.writer(Echo())
+        rows = queryset.order_by("pk").values_list(*self.export_fields)
+        response = StreamingHttpResponse(
+            (
+                writer.writerow(row)
+                for rows in ([self.export_fields], rows.iterator(chunk_size=EXPORT_CHUNK_SIZE))
+                for row in rows
+            ),
+            content_type="text/csv",
+        )
+        filename = self.model._meta.verbose_name_plural.replace(" ", "-")
+        response["Content-Disposition"] = f'attachment; filename="{filename}.csv"'
+        return response
 
 
 @admin.register(Client)
-class ClientAdmin(admin.ModelAdmin):
+class ClientAdmin(LargeTableAdmin):
     list_display = ("company_name", "contact_person", "email", "phone", "status")
-    search_fields = ("company_name", "contact_person", "email")
+    search_fields = ("^company_name", "=email")
+    export_fields = ("pk", "company_name", "contact_person", "email", "phone", "status")
 
 
 @admin.register(SubscriptionPlan)
@@ -16,7 +126,7 @@ class SubscriptionPlanAdmin(admin.ModelAdmin):
 
 
 @admin.register(Subscription)
-class SubscriptionAdmin(admin.ModelAdmin):
+class SubscriptionAdmin(LargeTableAdmin):
     list_display = (
         "client",
         "plan",
@@ -26,11 +136,27 @@ class SubscriptionAdmin(admin.ModelAdmin):
         "status",
     )
     list_filter = ("status", "billing_cycle")
-    search_fields = ("client__company_name", "plan__name")
+    list_select_related = ("client", "plan")
+    search_fields = ("^client__company_name",)
+    autocomplete_fields = ("client",)
+    date_hierarchy = "start_date"
+    export_fields = (
+        "pk",
+        "client__company_name",
+        "plan__name",
+        "billing_cycle",
+        "start_date",
+        "end_date",
+        "status",
+    )
+
+    def get_queryset(self, request):
+        # Subscriptions are shown as "<client> - <plan>", in autocomplete results too.
+        return super().get_queryset(request).select_related("client", "plan")
 
 
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(LargeTableAdmin):
     list_display = (
         "subscription",
         "amount",
@@ -39,11 +165,23 @@ class PaymentAdmin(admin.ModelAdmin):
         "status",
     )
     list_filter = ("payment_method", "status")
-    search_fields = ("subscription__client__company_name",)
+    list_select_related = ("subscription__client", "subscription__plan")
+    search_fields = ("^subscription__client__company_name",)
+    autocomplete_fields = ("subscription",)
+    date_hierarchy = "payment_date"
+    export_fields = (
+        "pk",
+        "subscription__client__company_name",
+        "subscription__plan__name",
+        "amount",
+        "payment_date",
+        "payment_method",
+        "status",
+    )
 
 
 @admin.register(Invoice)
-class InvoiceAdmin(admin.ModelAdmin):
+class InvoiceAdmin(LargeTableAdmin):
     list_display = (
         "invoice_number",
         "subscription",
@@ -52,7 +190,40 @@ class InvoiceAdmin(admin.ModelAdmin):
         "status",
     )
     list_filter = ("status",)
-    search_fields = ("invoice_number", "subscription__client__company_name")
+    list_select_related = ("subscription__client", "subscription__plan")
+    search_fields = ("=invoice_number", "^subscription__client__company_name")
+    autocomplete_fields = ("subscription",)
+    date_hierarchy = "issue_date"
+    actions = ("mark_paid", "resend", "mark_overdue", "export_csv")
+    export_fields = (
+        "invoice_number",
+        "subscription__client__company_name",
+        "amount",
+        "issue_date",
+        "due_date",
+        "status",
+    )
+
+    def _run_bulk_action(self, request, queryset, action):
+        result = run_invoice_bulk_action(action, queryset.values_list("pk", flat=True))
+        self.message_user(
+            request,
+            f"{INVOICE_BULK_ACTIONS[action]}: {len(result['updated'])} invoice(s) updated, "
+            f"{len(result['skipped'])} skipped",
+            messages.SUCCESS,
+        )
+
+    @admin.action(description="Mark selected invoices paid")
+    def mark_paid(self, request, queryset):
+        self._run_bulk_action(request, queryset, "mark_paid")
+
+    @admin.action(description="Resend selected invoice emails")
+    def resend(self, request, queryset):
+        self._run_bulk_action(request, queryset, "resend")
+
+    @admin.action(description="Mark selected invoices overdue")
+    def mark_overdue(self, request, queryset):
+        self._run_bulk_action(request, queryset, "mark_overdue")
 
 
 @admin.register(SiteConfiguration)
@@ -65,3 +236,48 @@ class SiteConfigurationAdmin(admin.ModelAdmin):
 
     def has_delete_permission(self, request, obj=None):
         return False
+
+
+@admin.register(JobRun)
+class JobRunAdmin(admin.ModelAdmin):
+    list_display = ("job", "scheduled_for", "status", "node", "started_at", "duration")
+    list_filter = ("job", "status")
+    readonly_fields = [field.name for field in JobRun._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(WebhookEndpoint)
+class WebhookEndpointAdmin(admin.ModelAdmin):
+    list_display = ("url", "events", "is_active")
+    list_filter = ("is_active",)
+
+
+@admin.register(ApiToken)
+class ApiTokenAdmin(admin.ModelAdmin):
+    list_display = ("name", "user", "created_at")
+    readonly_fields = ("key",)
+    autocomplete_fields = ("user",)
+
+
+@admin.register(WebhookDelivery)
+class WebhookDeliveryAdmin(admin.ModelAdmin):
+    list_display = ("event", "endpoint", "status", "attempts", "last_status_code", "next_attempt_at")
+    list_filter = ("status", "endpoint")
+    list_select_related = ("event", "endpoint")
+    readonly_fields = [field.name for field in WebhookDelivery._meta.fields]
+    actions = ("retry",)
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Retry selected deliveries now")
+    def retry(self, request, queryset):
+        updated = queryset.exclude(status=WebhookDelivery.Status.DELIVERED).update(
+            status=WebhookDelivery.Status.PENDING, next_attempt_at=timezone.now()
+        )
+        self.message_user(request, f"{updated} delivery(ies) queued for retry", messages.SUCCESS)
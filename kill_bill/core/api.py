@@ -0,0 +1,402 @@
+"""
+Versioned JSON API (``/api/v1/<resource>/``).
+
+Every resource supports:
+
+- ``GET /api/v1/<resource>/`` in id order, ``limit`` at a time. Pass the
+  response's ``next_cursor`` back as ``cursor`` for the next page; cursors
+  stay valid while rows are added.
+- ``fields=a,b`` to return only some fields (``id`` is always included).
+- ``include=x,y`` to add the related objects to ``included``, fetched with
+  one query per relation however many rows are on the page.
+- ``GET /api/v1/<resource>/<id>/`` for one object, with ``fields`` and
+  ``include`` too.
+- ``POST`` ``{"data": [{...}, ...]}`` to create and ``PATCH``
+  ``{"data": [{"id": ..., ...}, ...]}`` to update up to ``API_MAX_BATCH``
+  objects. Each object is validated by the same form as the HTML pages and
+  saved the same way; if any is invalid nothing is written.
+
+Scripts authenticate with ``Authorization: Bearer <key>``, the key of an
+``ApiToken``; such requests need no CSRF token. A browser can use the
+session of a logged-in user instead, like the other JSON views, with the
+CSRF token on writes.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+from dataclasses import dataclass, field
+from functools import wraps
+
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.forms.models import model_to_dict
+from django.http import JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.views.decorators.csrf import csrf_exempt
+
+from .forms import ClientForm, InvoiceForm, PaymentForm, SubscriptionForm, SubscriptionPlanForm
+from .models import ApiToken, Client, Invoice, Payment, Subscription, SubscriptionPlan
+from .plans import get_plans
+from .replica import read_replica
+
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 500
+API_MAX_BATCH = 100
+
+
+class ApiError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass(frozen=True)
+class Resource:
+    model: type
+    form: type
+    fields: tuple
+    # include name (a foreign key on ``model``) -> resource name
+    includes: dict = field(default_factory=dict)
+    # Report the status the object has today (see with_effective_status).
+    effective_status: bool = False
+
+    def queryset(self):
+        queryset = self.model.objects.all()
+        if self.effective_status:
+            queryset = queryset.with_effective_status()
+        return queryset.order_by("pk")
+
+    def serialize(self, obj, fields=None) -> dict:
+        data = {}
+        for name in fields or self.fields:
+            if name == "status" and self.effective_status:
+                data[name] = getattr(obj, "effective_status", obj.status)
+            else:
+                data[name] = getattr(obj, self.model._meta.get_field(name).attname)
+        return data
+
+
+RESOURCES = {
+    "clients": Resource(
+        Client,
+        ClientForm,
+        (
+            "id",
+            "company_name",
+            "contact_person",
+            "email",
+            "phone",
+            "status",
+            "outstanding_balance",
+            "active_subscription_count",
+            "lifetime_paid",
+            "created_at",
+            "updated_at",
+        ),
+    ),
+    "plans": Resource(
+        SubscriptionPlan,
+        SubscriptionPlanForm,
+        ("id", "name", "price_monthly", "price_annual", "is_active"),
+    ),
+    "subscriptions": Resource(
+        Subscription,
+        SubscriptionForm,
+        (
+            "id",
+            "client",
+            "plan",
+            "billing_cycle",
+            "start_date",
+            "end_date",
+            "status",
+            "created_at",
+            "updated_at",
+        ),
+        includes={"client": "clients", "plan": "plans"},
+        effective_status=True,
+    ),
+    "invoices": Resource(
+        Invoice,
+        InvoiceForm,
+        (
+            "id",
+            "invoice_number",
+            "subscription",
+            "amount",
+            "issue_date",
+            "due_date",
+            "status",
+            "created_at",
+            "updated_at",
+        ),
+        includes={"subscription": "subscriptions"},
+        effective_status=True,
+    ),
+    "payments": Resource(
+        Payment,
+        PaymentForm,
+        (
+            "id",
+            "subscription",
+            "amount",
+            "payment_date",
+            "payment_method",
+            "status",
+            "created_at",
+            "updated_at",
+        ),
+        includes={"subscription": "subscriptions"},
+    ),
+}
+
+
+class CsrfCheck(CsrfViewMiddleware):
+    def _reject(self, request, reason):
+        return reason
+
+
+def authenticate(request):
+    """
+    Set ``request.user`` from the bearer token, if one is sent. Returns an
+    error response, or None if the request may go on.
+    """
+    scheme, _, key = request.headers.get("Authorization", "").partition(" ")
+    if scheme:
+        key = key.strip()
+        token = None
+        if scheme.lower() == "bearer" and key:
+            # Read from the primary, so a revoked token stops working at once.
+            token = (
+                ApiToken.objects.using(DEFAULT_DB_ALIAS)
+                .select_related("user")
+                .filter(key=key, user__is_active=True)
+                .first()
+            )
+        if token is None:
+            return JsonResponse({"error": "Invalid token"}, status=401)
+        request.user = token.user
+        return None
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Authentication required"}, status=401)
+    # The views are csrf_exempt for token requests; a session needs the check.
+    reason = CsrfCheck(lambda request: None).process_view(request, None, (), {})
+    if reason:
+        return JsonResponse({"error": f"CSRF check failed: {reason}"}, status=403)
+    return None
+
+
+def api_view(view_func):
+    """Resolve the resource, authenticate the request and turn ApiError into JSON."""
+
+    @csrf_exempt
+    @wraps(view_func)
+    def _wrapped_view(request, resource, *args, **kwargs):
+        error = authenticate(request)
+        if error:
+            return error
+        if resource not in RESOURCES:
+            return JsonResponse({"error": f"Unknown resource {resource!r}"}, status=404)
+        try:
+            return view_func(request, RESOURCES[resource], *args, **kwargs)
+        except ApiError as e:
+            return JsonResponse({"error": str(e)}, status=e.status)
+
+    return _wrapped_view
+
+
+def encode_cursor(pk: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"after": pk}).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(json.loads(base64.urlsafe_b64decode(padded))["after"])
+    except (ValueError, TypeError, KeyError):
+        raise ApiError("Invalid cursor")
+
+
+def parse_list(value: str, allowed, label: str) -> list:
+    names = [name for name in (value or "").split(",") if name]
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise ApiError(
+            f"Unknown {label}: {', '.join(unknown)}; expected some of: {', '.join(allowed)}"
+        )
+    return names
+
+
+def parse_limit(value: str) -> int:
+    if not value:
+        return API_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= API_MAX_PAGE_SIZE:
+        raise ApiError(f"limit must be between 1 and {API_MAX_PAGE_SIZE}")
+    return limit
+
+
+def read_options(request, resource: Resource) -> tuple:
+    """``(fields, includes, queryset)`` for the ``fields`` and ``include`` parameters."""
+    fields = parse_list(request.GET.get("fields"), resource.fields, "fields")
+    includes = parse_list(request.GET.get("include"), resource.includes, "include")
+    queryset = resource.queryset()
+    if fields:
+        fields = ["id"] + [name for name in fields if name != "id"]
+        queryset = queryset.only(*set(fields) | set(includes))
+    return fields, includes, queryset
+
+
+def resolve_includes(resource: Resource, objects: list, includes: list) -> dict:
+    """Related objects for each include, one query per relation (none for plans)."""
+    included = {}
+    for name in includes:
+        target = RESOURCES[resource.includes[name]]
+        attname = resource.model._meta.get_field(name).attname
+        ids = sorted({getattr(obj, attname) for obj in objects} - {None})
+        if target.model is SubscriptionPlan:
+            plans = get_plans()
+            related = [plans[pk] for pk in ids if pk in plans]
+        else:
+            related = list(target.queryset().filter(pk__in=ids))
+        included[name] = [target.serialize(obj) for obj in related]
+    return included
+
+
+@read_replica
+@api_view
+def collection(request, resource: Resource):
+    if request.method == "GET":
+        return list_objects(request, resource)
+    if request.method == "POST":
+        return create_objects(request, resource)
+    if request.method == "PATCH":
+        return update_objects(request, resource)
+    return JsonResponse({"error": "Method not allowed"}, status=405)
+
+
+@read_replica
+@api_view
+def detail(request, resource: Resource, pk: int):
+    if request.method != "GET":
+        return JsonResponse({"error": "Method not allowed"}, status=405)
+    fields, includes, queryset = read_options(request, resource)
+    obj = queryset.filter(pk=pk).first()
+    if obj is None:
+        raise ApiError("Not found", status=404)
+    return JsonResponse(
+        {
+            "data": resource.serialize(obj, fields),
+            "included": resolve_includes(resource, [obj], includes),
+        }
+    )
+
+
+def list_objects(request, resource: Resource):
+    fields, includes, queryset = read_options(request, resource)
+    limit = parse_limit(request.GET.get("limit"))
+    cursor = request.GET.get("cursor")
+    if cursor:
+        queryset = queryset.filter(pk__gt=decode_cursor(cursor))
+
+    objects = list(queryset[: limit + 1])
+    next_cursor = None
+    if len(objects) > limit:
+        objects = objects[:limit]
+        next_cursor = encode_cursor(objects[-1].pk)
+
+    next_url = None
+    if next_cursor:
+        params = request.GET.copy()
+        params["cursor"] = next_cursor
+        next_url = request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+    return JsonResponse(
+        {
+            "data": [resource.serialize(obj, fields) for obj in objects],
+            "included": resolve_includes(resource, objects, includes),
+            "next_cursor": next_cursor,
+            "next": next_url,
+        }
+    )
+
+
+def read_batch(request) -> list:
+    try:
+        items = json.loads(request.body)["data"]
+    except (ValueError, KeyError, TypeError):
+        raise ApiError('Expected {"data": [objects]}')
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ApiError('Expected {"data": [objects]}')
+    if not 1 <= len(items) <= API_MAX_BATCH:
+        raise ApiError(f"Send between 1 and {API_MAX_BATCH} objects at a time")
+    return items
+
+
+def save_forms(resource: Resource, forms: list, errors: list, status: int):
+    """Save every form in one transaction, or report the errors and save none."""
+    for index, form in enumerate(forms):
+        if form is not None and not form.is_valid():
+            errors.append({"index": index, "errors": form.errors.get_json_data()})
+    if errors:
+        return JsonResponse({"errors": sorted(errors, key=lambda e: e["index"])}, status=400)
+    try:
+        with transaction.atomic():
+            objects = [form.save() for form in forms]
+    except IntegrityError as e:
+        # For instance two objects in the batch clashing with each other.
+        return JsonResponse({"error": f"Conflicting objects: {e}"}, status=409)
+    return JsonResponse({"data": [resource.serialize(obj) for obj in objects]}, status=status)
+
+
+def unknown_fields(form_class, item: dict, allowed=()) -> dict:
+    unknown = set(item) - set(form_class.base_fields) - set(allowed)
+    return {
+        name: [{"message": "Unknown or read-only field", "code": "unknown"}]
+        for name in sorted(unknown)
+    }
+
+
+def create_objects(request, resource: Resource):
+    forms, errors = [], []
+    for index, item in enumerate(read_batch(request)):
+        unknown = unknown_fields(resource.form, item)
+        if unknown:
+            errors.append({"index": index, "errors": unknown})
+            forms.append(None)
+        else:
+            forms.append(resource.form(data=item))
+    return save_forms(resource, forms, errors, status=201)
+
+
+def update_objects(request, resource: Resource):
+    items = read_batch(request)
+    try:
+        ids = [int(item["id"]) for item in items]
+    except (KeyError, TypeError, ValueError):
+        raise ApiError("Every object needs its integer id")
+    if len(set(ids)) != len(ids):
+        raise ApiError("Each id can only be updated once per request")
+
+    with transaction.atomic():
+        instances = resource.model.objects.select_for_update().in_bulk(ids)
+        forms, errors = [], []
+        for index, (pk, item) in enumerate(zip(ids, items)):
+            instance = instances.get(pk)
+            unknown = unknown_fields(resource.form, item, allowed=("id",))
+            if instance is None:
+                not_found = [{"message": "Not found", "code": "not_found"}]
+                errors.append({"index": index, "errors": {"id": not_found}})
+            elif unknown:
+                errors.append({"index": index, "errors": unknown})
+            if instance is None or unknown:
+                forms.append(None)
+                continue
+            # Fields left out keep their current value.
+            data = model_to_dict(instance, fields=list(resource.form.base_fields))
+            data.update((name, value) for name, value in item.items() if name != "id")
+            forms.append(resource.form(data=data, instance=instance))
+        return save_forms(resource, forms, errors, status=200)
@@ -0,0 +1,42 @@
+"""
+Authentication backend that keeps logged-in users in the cache.
+
+``AuthenticationMiddleware`` loads the session's user on every request,
+which with ``ModelBackend`` is one query per page view. ``CachedModelBackend``
+keeps the user in the Django cache instead; saving or deleting a user clears
+the entry (see signals.py), and ``USER_CACHE_TIMEOUT`` bounds how long a
+set-based update of the user table can go unnoticed. Permissions are still
+checked against the database, as before.
+"""
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+USER_CACHE_KEY = "auth-user:{}"
+USER_CACHE_TIMEOUT = 60 * 5
+
+
+def user_cache_key(user_id) -> str:
+    return USER_CACHE_KEY.format(user_id)
+
+
+def invalidate_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, USER_CACHE_TIMEOUT)
+        # The same check ModelBackend.get_user() makes.
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        # ModelBackend.aget_user() queries directly rather than calling get_user().
+        return await sync_to_async(self.get_user)(user_id)
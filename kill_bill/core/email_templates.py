@@ -0,0 +1,60 @@
+"""
+Template loader that prepares HTML email templates for mail clients.
+
+Standalone HTML templates under ``emails/`` (full documents, not pages that
+``{% extends %}`` the site layout) have their ``<style>`` rules inlined into
+``style`` attributes and their whitespace collapsed when the template is
+loaded. The result is cached per template source, so each send only fills
+in variables.
+"""
+
+import logging
+import re
+from functools import lru_cache
+
+import css_inline
+from django.template.loaders.filesystem import Loader as FilesystemLoader
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_TAG = re.compile(r"{%.*?%}|{{.*?}}|{#.*?#}", re.DOTALL)
+HTML_COMMENT = re.compile(r"<!--(?!\[if).*?-->", re.DOTALL)
+WHITESPACE = re.compile(r"\s+")
+
+_inliner = css_inline.CSSInliner(keep_style_tags=False, load_remote_stylesheets=False)
+
+
+def is_email_html(template_name: str, source: str) -> bool:
+    return (
+        template_name.startswith("emails/")
+        and template_name.endswith(".html")
+        and "{% extends" not in source
+    )
+
+
+def minify_html(html: str) -> str:
+    html = HTML_COMMENT.sub("", html)
+    return WHITESPACE.sub(" ", html).strip()
+
+
+@lru_cache(maxsize=64)
+def prepare_email_html(source: str) -> str:
+    """Inline and minify an email template's source, once per version."""
+    html = minify_html(_inliner.inline(source))
+    # The HTML parser moves stray text out of tables; a template tag between
+    # <tr> rows would end up somewhere else and change the template's meaning.
+    if TEMPLATE_TAG.findall(WHITESPACE.sub(" ", source)) != TEMPLATE_TAG.findall(html):
+        raise ValueError("template tags were moved while inlining")
+    return html
+
+
+class Loader(FilesystemLoader):
+    def get_contents(self, origin):
+        contents = super().get_contents(origin)
+        if not is_email_html(origin.template_name, contents):
+            return contents
+        try:
+            return prepare_email_html(contents)
+        except ValueError as e:
+            logger.warning(f"Sending {origin.template_name} without inlined CSS: {e}")
+            return contents
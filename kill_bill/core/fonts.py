@@ -0,0 +1,46 @@
+"""
+Self-hosted invoice fonts.
+
+Every ``InvoiceConfiguration.FontFamily`` is bundled as latin-subset WOFF2
+files under ``static/fonts/<slug>/`` with an ``@font-face`` stylesheet at
+``static/fonts/<slug>.css``; ``manage.py bundle_fonts`` writes both. A family
+that has not been bundled falls back to Google Fonts.
+"""
+
+from functools import lru_cache
+
+from django.contrib.staticfiles import finders
+from django.templatetags.static import static
+from django.utils.text import slugify
+
+GOOGLE_FONTS_URL = (
+    "https://fonts.googleapis.com/css2?family={family}:wght@300;400;500;600;700&display=swap"
+)
+
+
+def font_slug(family: str) -> str:
+    return slugify(family)
+
+
+def font_stylesheet_path(family: str) -> str:
+    return f"fonts/{font_slug(family)}.css"
+
+
+@lru_cache
+def _is_bundled(path: str) -> bool:
+    return finders.find(path) is not None
+
+
+def font_stylesheet_url(family: str) -> str:
+    """Stylesheet URL for a font family, the bundled copy if there is one."""
+    path = font_stylesheet_path(family)
+    if _is_bundled(path):
+        return static(path)
+    return GOOGLE_FONTS_URL.format(family=family.replace(" ", "+"))
+
+
+def font_stylesheet_urls() -> dict:
+    """Stylesheet URL for every invoice font family, keyed by family name."""
+    from .models import InvoiceConfiguration
+
+    return {family: font_stylesheet_url(family) for family in InvoiceConfiguration.FontFamily.values}
@@ -1,10 +1,14 @@
 from __future__ import annotations
 
+import io
 from datetime import timedelta
 
 from django import forms
+from django.forms.models import ModelChoiceIterator
+from django.urls import reverse
 
 from .models import Client, Invoice, InvoiceConfiguration, Payment, SiteConfiguration, Subscription, SubscriptionPlan
+from .plans import get_plans, plan_price
 
 
 class SubscriptionPlanForm(forms.ModelForm):
@@ -38,13 +42,99 @@ class ClientForm(forms.ModelForm):
         }
 
 
+class AutocompleteSelect(forms.Select):
+    """
+    Select for a ModelChoiceField that renders only the current choice
+    instead of every row; static/js/autocomplete.js fills in matches from
+    the ``url_name`` endpoint as the user types. Validation is left to the
+    field, which still checks the submitted pk against its queryset.
+
+    ``forward`` names other fields of the form whose values are sent along
+    with the search (e.g. the chosen client).
+    """
+
+    def __init__(self, url_name: str, forward=(), attrs=None):
+        super().__init__(attrs)
+        self.url_name = url_name
+        self.forward = list(forward)
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context["widget"]["attrs"]["data-autocomplete-url"] = reverse(self.url_name)
+        if self.forward:
+            context["widget"]["attrs"]["data-autocomplete-forward"] = ",".join(self.forward)
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        choices = self.choices
+        pks = [pk for pk in value if str(pk).isdigit()]
+        self.choices = []
+        if choices.field.empty_label is not None:
+            self.choices.append(("", choices.field.empty_label))
+        if pks:
+            self.choices += [choices.choice(obj) for obj in choices.queryset.filter(pk__in=pks)]
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = choices
+
+
+class PlanChoiceIterator(ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for plan in self.field.cached_plans():
+            yield self.choice(plan)
+
+    def __len__(self):
+        return len(self.field.cached_plans()) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.field.cached_plans())
+
+
+class PlanChoiceField(forms.ModelChoiceField):
+    """Plan select whose choices and validation come from the plan cache."""
+
+    iterator = PlanChoiceIterator
+
+    def __init__(self, *, active_only: bool = False, **kwargs):
+        self.active_only = active_only
+        super().__init__(queryset=SubscriptionPlan.objects.all(), **kwargs)
+
+    def cached_plans(self) -> list:
+        return [
+            plan for plan in get_plans().values()
+            if plan.is_active or not self.active_only
+        ]
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        if isinstance(value, SubscriptionPlan):
+            value = value.pk
+        try:
+            pk = int(value)
+        except (TypeError, ValueError):
+            pk = None
+        for plan in self.cached_plans():
+            if plan.pk == pk:
+                return plan
+        raise forms.ValidationError(
+            self.error_messages["invalid_choice"],
+            code="invalid_choice",
+            params={"value": value},
+        )
+
+
 class SubscriptionForm(forms.ModelForm):
+    plan = PlanChoiceField(widget=forms.Select(attrs={}))
+
     class Meta:
         model = Subscription
         fields = ["client", "plan", "billing_cycle", "start_date", "status"]
         widgets = {
-            "client": forms.Select(attrs={}),
-            "plan": forms.Select(attrs={}),
+            "client": AutocompleteSelect("autocomplete_clients"),
             "billing_cycle": forms.Select(attrs={}),
             "start_date": forms.DateInput(attrs={"type": "date", "class": "input"}),
             "status": forms.Select(attrs={}),
@@ -53,10 +143,7 @@ class SubscriptionForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # Only show active plans by default, but allow all plans if editing
-        if not self.instance.pk:  # New subscription
-            self.fields["plan"].queryset = SubscriptionPlan.objects.filter(is_active=True)
-        else:  # Editing existing subscription
-            self.fields["plan"].queryset = SubscriptionPlan.objects.all()
+        self.fields["plan"].active_only = not self.instance.pk
 
     def clean(self):
         cleaned = super().clean()
@@ -67,7 +154,11 @@ class SubscriptionForm(forms.ModelForm):
 
 
 class PaymentForm(forms.ModelForm):
-    client = forms.ModelChoiceField(queryset=Client.objects.all(), required=False)
+    client = forms.ModelChoiceField(
+        queryset=Client.objects.all(),
+        required=False,
+        widget=AutocompleteSelect("autocomplete_clients"),
+    )
 
     class Meta:
         model = Payment
@@ -80,8 +171,7 @@ class PaymentForm(forms.ModelForm):
             "status",
         ]
         widgets = {
-            "client": forms.Select(attrs={}),
-            "subscription": forms.Select(attrs={}),
+            "subscription": AutocompleteSelect("autocomplete_subscriptions", forward=["client"]),
             "amount": forms.NumberInput(attrs={"class": "input", "step": "0.01"}),
             "payment_date": forms.DateInput(attrs={"type": "date", "class": "input"}),
             "payment_method": forms.Select(attrs={}),
@@ -120,7 +210,7 @@ class InvoiceForm(forms.ModelForm):
         model = Invoice
         fields = ["subscription", "issue_date", "due_date"]
         widgets = {
-            "subscription": forms.Select(attrs={}),
+            "subscription": AutocompleteSelect("autocomplete_subscriptions"),
             "issue_date": forms.DateInput(attrs={"type": "date", "class": "input"}),
             "due_date": forms.DateInput(attrs={"type": "date", "class": "input"}),
         }
@@ -137,11 +227,9 @@ class InvoiceForm(forms.ModelForm):
 
     def save(self, commit: bool = True):
         invoice: Invoice = super().save(commit=False)
-        plan = invoice.subscription.plan
-        if invoice.subscription.billing_cycle == Subscription.BillingCycle.MONTHLY:
-            invoice.amount = plan.price_monthly
-        else:
-            invoice.amount = plan.price_annual
+        invoice.amount = plan_price(
+            invoice.subscription.plan_id, invoice.subscription.billing_cycle
+        )
         invoice.status = Invoice.Status.UNPAID
         if commit:
             invoice.save()
@@ -262,3 +350,33 @@ class InvoiceConfigurationForm(forms.ModelForm):
             "background_color": "Background Color",
             "accent_color": "Accent Color",
         }
+
+
+class BankStatementForm(forms.Form):
+    statement = forms.FileField(
+        label="Bank statement (CSV)",
+        help_text="Columns: date, amount, reference and optionally payer",
+        widget=forms.ClearableFileInput(attrs={"class": "file-input", "accept": ".csv,text/csv"}),
+    )
+
+    def clean(self):
+        from .reconciliation import StatementError, parse_statement
+
+        cleaned = super().clean()
+        upload = cleaned.get("statement")
+        if upload is None:
+            return cleaned
+        try:
+            text = upload.read().decode("utf-8-sig")
+            # Read through csv, not line by line: a quoted field may span lines.
+            rows = parse_statement(io.StringIO(text, newline=""))
+        except UnicodeDecodeError:
+            self.add_error("statement", "Statement must be a UTF-8 encoded CSV file")
+        except StatementError as e:
+            self.add_error("statement", str(e))
+        else:
+            if rows:
+                cleaned["rows"] = rows
+            else:
+                self.add_error("statement", "Statement has no lines")
+        return cleaned
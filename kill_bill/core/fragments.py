@@ -0,0 +1,63 @@
+"""
+Version stamps for cached template fragments.
+
+A model's stamp is its counter in ``versions``, moved on by a save or
+delete of the model (see signals.py) or a set-based write (``touch``).
+Fragments cached with ``{% cache %}`` vary on ``fragment_key`` of every
+model they show and are rebuilt exactly when one of them changes, or the
+day does. The counters live in the database, so a change made by another
+worker or the scheduler is seen from the next request on whatever cache
+backend the fragments are kept in.
+
+Stamps are read from the primary. Rebuild a fragment from the primary too
+(``fragment_queryset``): rows read from a lagging replica would be cached
+under a stamp that already says they are current.
+"""
+
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+from .versions import bump, get_versions
+
+# Fragments are keyed by their stamps, so this only bounds how long
+# superseded copies take up cache space.
+FRAGMENT_TIMEOUT = 60 * 60
+STAMP_KEY = "fragments:{}"
+
+
+def stamp_key(model) -> str:
+    """The ``versions`` key of ``model``'s stamp."""
+    from .models import SubscriptionPlan
+    from .plans import PLAN_VERSION_KEY
+
+    if model is SubscriptionPlan:
+        # Plans already carry a version counter.
+        return PLAN_VERSION_KEY
+    return STAMP_KEY.format(model._meta.label_lower)
+
+
+def fragment_key(*models) -> str:
+    """Vary-on value for a fragment showing ``models``: today plus their stamps."""
+    keys = [stamp_key(model) for model in models]
+    stamps = get_versions(*keys)
+    return "|".join([timezone.localdate().isoformat(), *(stamps[key] for key in keys)])
+
+
+async def afragment_cached(name: str, *vary_on) -> bool:
+    """Whether ``{% cache ... name vary_on %}`` will be served from the cache."""
+    return await cache.aget(make_template_fragment_key(name, vary_on)) is not None
+
+
+def fragment_queryset(queryset):
+    """Read rows for a fragment being rebuilt from the primary, like the stamps."""
+    return queryset.using(DEFAULT_DB_ALIAS)
+
+
+def touch(*models, using: str = DEFAULT_DB_ALIAS):
+    """
+    Move the stamps of ``models`` on after a write that sends no signals
+    (``update()``, ``bulk_create()``).
+    """
+    bump(*(stamp_key(model) for model in models), using=using)
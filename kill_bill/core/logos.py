@@ -0,0 +1,121 @@
+"""
+Resized variants of the invoice logo.
+
+The uploaded ``InvoiceConfiguration.logo`` is often a multi-megabyte image
+but is never shown more than a couple of hundred pixels wide. Each variant
+is rendered once per distinct logo and stored in the default storage under
+``logo_variants/<content hash>/``, so pages and emails fetch a few KB and a
+re-upload of the same image reuses the existing files.
+"""
+
+import base64
+import hashlib
+import logging
+from functools import lru_cache
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+VARIANT_DIR = "logo_variants"
+
+# name: (max width, max height, format). Sizes are twice the CSS box the
+# logo is shown in, for high-density screens and print.
+LOGO_VARIANTS = {
+    "print": (400, 120, "WEBP"),
+    "preview": (300, 80, "WEBP"),
+    # Inlined into emails as a data URI; mail clients still lack WebP.
+    "email": (400, 120, "PNG"),
+}
+CONTENT_TYPES = {"WEBP": "image/webp", "PNG": "image/png"}
+
+
+def content_hash(file) -> str:
+    """SHA-256 of an uploaded or stored file's content."""
+    digest = hashlib.sha256()
+    file.open("rb")
+    file.seek(0)
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def variant_name(logo_hash: str, variant: str) -> str:
+    fmt = LOGO_VARIANTS[variant][2]
+    return f"{VARIANT_DIR}/{logo_hash[:32]}/{variant}.{fmt.lower()}"
+
+
+def render_variant(image: Image.Image, variant: str) -> bytes:
+    width, height, fmt = LOGO_VARIANTS[variant]
+    image = image.copy()
+    image.thumbnail((width, height), Image.Resampling.LANCZOS)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+    buffer = BytesIO()
+    if fmt == "PNG":
+        # A 256 colour palette keeps alpha and is a fraction of truecolour PNG.
+        image.quantize(256, method=Image.Quantize.FASTOCTREE).save(buffer, fmt, optimize=True)
+    else:
+        image.save(buffer, fmt, quality=90, method=6)
+    return buffer.getvalue()
+
+
+def build_logo_variants(logo, logo_hash: str) -> None:
+    """Render whichever variants of ``logo`` are not stored yet."""
+    missing = [
+        variant for variant in LOGO_VARIANTS
+        if not default_storage.exists(variant_name(logo_hash, variant))
+    ]
+    if not missing:
+        return
+    logo.open("rb")
+    logo.seek(0)
+    with Image.open(logo) as image:
+        image = ImageOps.exif_transpose(image)
+        for variant in missing:
+            default_storage.save(
+                variant_name(logo_hash, variant), ContentFile(render_variant(image, variant))
+            )
+
+
+def logo_variant_url(config, variant: str) -> str:
+    """
+    URL of a logo variant, rendering it first if the stored copy is
+    missing. Falls back to the original upload if it cannot be processed.
+    """
+    if not config.logo:
+        return ""
+    if not config.logo_hash:
+        return config.logo.url
+    name = variant_name(config.logo_hash, variant)
+    if not default_storage.exists(name):
+        try:
+            build_logo_variants(config.logo, config.logo_hash)
+        except (OSError, UnidentifiedImageError) as e:
+            logger.warning(f"Could not render {variant} logo variant: {e}")
+            return config.logo.url
+    return default_storage.url(name)
+
+
+@lru_cache(maxsize=8)
+def _data_uri(logo_hash: str) -> str:
+    fmt = LOGO_VARIANTS["email"][2]
+    with default_storage.open(variant_name(logo_hash, "email")) as file:
+        data = base64.b64encode(file.read()).decode()
+    return f"data:{CONTENT_TYPES[fmt]};base64,{data}"
+
+
+def logo_data_uri(config) -> str:
+    """The email variant as a ``data:`` URI, or "" if there is no logo."""
+    if not config.logo or not config.logo_hash:
+        return ""
+    try:
+        logo_variant_url(config, "email")
+        return _data_uri(config.logo_hash)
+    except OSError as e:
+        logger.warning(f"Could not inline email logo: {e}")
+        return ""
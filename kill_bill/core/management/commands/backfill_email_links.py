@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from kill_bill.core.utils import EMAIL_BACKFILL_BATCH_SIZE, backfill_email_links
+
+
+class Command(BaseCommand):
+    help = "Link email log rows written before they recorded their client, subscription and invoice"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=EMAIL_BACKFILL_BATCH_SIZE,
+            help=f"Rows read and updated per batch (default: {EMAIL_BACKFILL_BATCH_SIZE})",
+        )
+
+    def handle(self, *args, **options):
+        linked = backfill_email_links(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Linked {linked} email log rows"))
@@ -0,0 +1,150 @@
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client as TestClient
+
+DEFAULT_PATHS = ["/", "/reminders/"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare sync WSGI and async ASGI throughput for the read-heavy pages "
+        "by driving both handlers in-process under concurrent load"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths",
+            nargs="*",
+            default=DEFAULT_PATHS,
+            help="Paths to request (default: dashboard and reminders)",
+        )
+        parser.add_argument(
+            "--requests", type=int, default=200, help="Requests per path and mode"
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=10, help="Requests in flight at once"
+        )
+        parser.add_argument(
+            "--username",
+            help="User to authenticate as (default: first superuser)",
+        )
+
+    def handle(self, *args, **options):
+        cookie = self.session_cookie(options["username"])
+        total = options["requests"]
+        concurrency = options["concurrency"]
+
+        self.stdout.write(
+            self.style.MIGRATE_HEADING(
+                f"Benchmarking {total} requests per path with concurrency {concurrency}"
+            )
+        )
+        for path in options["paths"]:
+            self.stdout.write(self.style.MIGRATE_LABEL(path))
+            for mode, runner in (("WSGI", self.run_wsgi), ("ASGI", self.run_asgi)):
+                elapsed, statuses = runner(path, cookie, total, concurrency)
+                errors = sum(1 for status in statuses if status != 200)
+                self.stdout.write(
+                    f"  {mode}: {total / elapsed:8.1f} req/s  "
+                    f"{elapsed * 1000 / total:7.2f} ms/req  {errors} non-200"
+                )
+
+    def session_cookie(self, username) -> str:
+        User = get_user_model()
+        users = User.objects.filter(is_active=True)
+        user = (
+            users.filter(username=username).first()
+            if username
+            else users.filter(is_superuser=True).first()
+        )
+        if user is None:
+            raise CommandError("No user to authenticate as; create a superuser first")
+        client = TestClient()
+        client.force_login(user)
+        session_id = client.cookies[settings.SESSION_COOKIE_NAME].value
+        return f"{settings.SESSION_COOKIE_NAME}={session_id}"
+
+    def run_wsgi(self, path, cookie, total, concurrency):
+        handler = WSGIHandler()
+
+        def request(_):
+            environ = {
+                "REQUEST_METHOD": "GET",
+                "PATH_INFO": path,
+                "QUERY_STRING": "",
+                "SERVER_NAME": "testserver",
+                "SERVER_PORT": "80",
+                "SERVER_PROTOCOL": "HTTP/1.1",
+                "HTTP_HOST": "testserver",
+                "HTTP_COOKIE": cookie,
+                "wsgi.url_scheme": "http",
+                "wsgi.input": BytesIO(),
+                "wsgi.errors": sys.stderr,
+            }
+            status = []
+            body = handler(environ, lambda s, headers: status.append(s))
+            b"".join(body)
+            body.close()
+            return int(status[0].split()[0])
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            statuses = list(executor.map(request, range(total)))
+        return time.perf_counter() - start, statuses
+
+    def run_asgi(self, path, cookie, total, concurrency):
+        handler = ASGIHandler()
+
+        async def request(semaphore):
+            scope = {
+                "type": "http",
+                "asgi": {"version": "3.0"},
+                "http_version": "1.1",
+                "method": "GET",
+                "scheme": "http",
+                "path": path,
+                "raw_path": path.encode(),
+                "query_string": b"",
+                "root_path": "",
+                "headers": [(b"host", b"testserver"), (b"cookie", cookie.encode())],
+                "client": ("127.0.0.1", 0),
+                "server": ("testserver", 80),
+            }
+            done = asyncio.Event()
+            sent = []
+
+            async def receive():
+                if not sent:
+                    sent.append(True)
+                    return {"type": "http.request", "body": b"", "more_body": False}
+                await done.wait()
+                return {"type": "http.disconnect"}
+
+            status = []
+
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    status.append(message["status"])
+                elif not message.get("more_body", False):
+                    done.set()
+
+            async with semaphore:
+                await handler(scope, receive, send)
+            return status[0]
+
+        async def main():
+            semaphore = asyncio.Semaphore(concurrency)
+            return await asyncio.gather(*(request(semaphore) for _ in range(total)))
+
+        start = time.perf_counter()
+        statuses = asyncio.run(main())
+        return time.perf_counter() - start, statuses
@@ -0,0 +1,95 @@
+import re
+from collections import defaultdict
+from pathlib import Path
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from kill_bill.core.fonts import GOOGLE_FONTS_URL, font_slug
+from kill_bill.core.models import InvoiceConfiguration
+
+# Google Fonts only serves WOFF2 to browsers it knows support it.
+USER_AGENT = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+)
+FONT_FACE = re.compile(r"/\*\s*([\w-]+)\s*\*/\s*(@font-face\s*\{[^}]*\})")
+FONT_URL = re.compile(r"url\((https://[^)]+\.woff2)\)")
+FONT_WEIGHT = re.compile(r"font-weight:\s*(\d+)")
+
+
+def fetch(url: str) -> bytes:
+    request = Request(url, headers={"User-Agent": USER_AGENT})
+    with urlopen(request, timeout=30) as response:
+        return response.read()
+
+
+class Command(BaseCommand):
+    help = "Download the invoice font families as subsetted WOFF2 files for self-hosting"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output",
+            default=None,
+            help="Directory to write into (default: fonts/ in the first STATICFILES_DIRS entry)",
+        )
+        parser.add_argument(
+            "--subsets",
+            default="latin",
+            help="Comma separated unicode subsets to keep (default: latin)",
+        )
+        parser.add_argument(
+            "--family",
+            action="append",
+            choices=InvoiceConfiguration.FontFamily.values,
+            help="Only bundle this family (repeatable; default: all invoice fonts)",
+        )
+
+    def handle(self, *args, **options):
+        output = Path(options["output"] or Path(settings.STATICFILES_DIRS[0]) / "fonts")
+        subsets = {subset.strip() for subset in options["subsets"].split(",") if subset.strip()}
+        families = options["family"] or InvoiceConfiguration.FontFamily.values
+
+        for family in families:
+            css = fetch(GOOGLE_FONTS_URL.format(family=family.replace(" ", "+"))).decode()
+            stylesheet, files = self.bundle(family, css, subsets, output)
+            if not files:
+                raise CommandError(f"{family}: no {', '.join(sorted(subsets))} font faces found")
+            (output / f"{font_slug(family)}.css").write_text(stylesheet)
+            size = sum(path.stat().st_size for path in files)
+            self.stdout.write(f"{family}: {len(files)} file(s), {size / 1024:.1f} KiB")
+
+        self.stdout.write(self.style.SUCCESS(f"Fonts written to {output}"))
+
+    def bundle(self, family: str, css: str, subsets: set, output: Path) -> tuple:
+        """
+        Keep the ``@font-face`` rules for the wanted subsets, download their
+        WOFF2 files and point the rules at the local copies. Returns the new
+        stylesheet and the written files.
+        """
+        slug = font_slug(family)
+        faces = [
+            (subset, face) for subset, face in FONT_FACE.findall(css) if subset in subsets
+        ]
+
+        # Variable fonts serve every weight from one file; download it once.
+        weights = defaultdict(list)
+        for subset, face in faces:
+            url = FONT_URL.search(face).group(1)
+            weights[(subset, url)].append(FONT_WEIGHT.search(face).group(1))
+
+        (output / slug).mkdir(parents=True, exist_ok=True)
+        local = {}
+        files = []
+        for (subset, url), face_weights in weights.items():
+            face_weights = list(dict.fromkeys(face_weights))
+            suffix = "-".join(face_weights[:1] + face_weights[1:][-1:])
+            path = output / slug / f"{slug}-{subset}-{suffix}.woff2"
+            path.write_bytes(fetch(url))
+            local[url] = f"{slug}/{path.name}"
+            files.append(path)
+
+        rules = [FONT_URL.sub(lambda m: f"url({local[m.group(1)]})", face) for _, face in faces]
+        header = f"/* {family}: self-hosted by manage.py bundle_fonts */\n"
+        return header + "\n".join(rules) + "\n", files
@@ -1,7 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
-from core.models import get_reminder_invoices
+from kill_bill.core.models import get_reminder_invoices
 
 
 class Command(BaseCommand):
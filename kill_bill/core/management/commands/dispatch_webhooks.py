@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from kill_bill.core.webhooks import WEBHOOK_BATCH_SIZE, WEBHOOK_CONCURRENCY, dispatch_webhooks
+
+
+class Command(BaseCommand):
+    help = "Deliver pending webhooks"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=WEBHOOK_BATCH_SIZE,
+            help=f"Deliveries sent per endpoint per round (default: {WEBHOOK_BATCH_SIZE})",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=WEBHOOK_CONCURRENCY,
+            help=f"Number of endpoints delivered to in parallel (default: {WEBHOOK_CONCURRENCY})",
+        )
+
+    def handle(self, *args, **options):
+        counts = dispatch_webhooks(options["batch_size"], options["concurrency"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Webhooks: {counts['delivered']} delivered, {counts['retrying']} to retry, "
+                f"{counts['failed']} failed"
+            )
+        )
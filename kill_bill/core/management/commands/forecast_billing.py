@@ -0,0 +1,91 @@
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from kill_bill.core.forecast import add_months, forecast_billing, site_configuration
+from kill_bill.core.models import Subscription
+from kill_bill.core.plans import get_plans
+
+
+class Command(BaseCommand):
+    help = "Forecast the invoices the billing run would generate, without writing anything"
+
+    def add_arguments(self, parser):
+        horizon = parser.add_mutually_exclusive_group()
+        horizon.add_argument("--days", type=int, help="Forecast the next N days (default: 30)")
+        horizon.add_argument("--months", type=int, help="Forecast the next N months")
+        parser.add_argument(
+            "--by",
+            choices=["day", "month"],
+            help="Group invoices by issue day or month (default: day for --days, month for --months)",
+        )
+        parser.add_argument(
+            "--days-before",
+            type=int,
+            help="Simulate a different invoice_days_before_expiry setting",
+        )
+        parser.add_argument(
+            "--price",
+            action="append",
+            default=[],
+            metavar="PLAN_ID:CYCLE=AMOUNT",
+            help="Simulate a plan price, e.g. 3:monthly=12.50 (repeatable)",
+        )
+
+    def handle(self, *args, **options):
+        today = timezone.now().date()
+        if options["months"]:
+            until = add_months(today, options["months"])
+            group_by = options["by"] or "month"
+        else:
+            until = today + timedelta(days=options["days"] or 30)
+            group_by = options["by"] or "day"
+        days_before = options["days_before"]
+        if days_before is None:
+            days_before = site_configuration().invoice_days_before_expiry
+
+        forecast = forecast_billing(
+            until,
+            days_before_expiry=days_before,
+            prices=self.parse_prices(options["price"]),
+            group_by=group_by,
+        )
+
+        self.stdout.write(
+            self.style.MIGRATE_HEADING(
+                f"Billing forecast {today} to {until} (invoice {days_before} days before expiry)"
+            )
+        )
+        date_format = "%Y-%m-%d" if group_by == "day" else "%Y-%m"
+        for row in forecast["periods"]:
+            self.stdout.write(
+                f"  {row['date']:{date_format}}  {row['invoices']:>7} invoices  {row['amount']:>14,.2f}"
+            )
+        if not forecast["periods"]:
+            self.stdout.write("  None")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Total: {forecast['invoices']} invoices, {forecast['amount']:,.2f}"
+            )
+        )
+
+    def parse_prices(self, values: list) -> dict:
+        prices = {}
+        plans = get_plans()
+        for value in values:
+            try:
+                plan, rest = value.split(":", 1)
+                cycle, amount = rest.split("=", 1)
+                plan, amount = int(plan), Decimal(amount)
+            except (ValueError, InvalidOperation):
+                raise CommandError(f"Invalid --price {value!r}, expected PLAN_ID:CYCLE=AMOUNT")
+            if plan not in plans:
+                raise CommandError(f"Unknown plan {plan}")
+            if cycle not in Subscription.BillingCycle.values:
+                raise CommandError(
+                    f"Unknown billing cycle {cycle!r}, expected one of {', '.join(Subscription.BillingCycle.values)}"
+                )
+            prices.setdefault(plan, {})[cycle] = amount
+        return prices
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from kill_bill.core.models import BILLING_COUNTER_FIELDS, Client
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized client billing counters and repair any drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of clients checked per query (default: 1000)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report drifted clients without fixing them",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        dry_run = options["dry_run"]
+        computed_fields = [f"computed_{name}" for name in BILLING_COUNTER_FIELDS]
+
+        checked = 0
+        drifted = 0
+        last_pk = 0
+        while True:
+            rows = list(
+                Client.objects.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .with_computed_billing_counters()
+                .values("pk", "company_name", *BILLING_COUNTER_FIELDS, *computed_fields)[
+                    :batch_size
+                ]
+            )
+            if not rows:
+                break
+            last_pk = rows[-1]["pk"]
+            checked += len(rows)
+
+            drifted_pks = []
+            for row in rows:
+                changes = [
+                    f"{name} {row[name]} -> {row[f'computed_{name}']}"
+                    for name in BILLING_COUNTER_FIELDS
+                    if row[name] != row[f"computed_{name}"]
+                ]
+                if changes:
+                    drifted_pks.append(row["pk"])
+                    self.stdout.write(
+                        self.style.WARNING(f"  {row['company_name']}: {', '.join(changes)}")
+                    )
+
+            if drifted_pks and not dry_run:
+                # Recompute at write time rather than writing the values read
+                # above, so concurrent invoice/payment writes are not lost.
+                with transaction.atomic():
+                    Client.objects.filter(pk__in=drifted_pks).refresh_billing_counters()
+            drifted += len(drifted_pks)
+
+        action = "found" if dry_run else "repaired"
+        self.stdout.write(
+            self.style.SUCCESS(f"Checked {checked} clients, {action} {drifted} with drifted counters")
+        )
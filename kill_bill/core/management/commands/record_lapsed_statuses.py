@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from kill_bill.core.models import Invoice
+from kill_bill.core.utils import expire_subscriptions, mark_invoices_overdue
+
+
+class Command(BaseCommand):
+    help = "Store the overdue and expired statuses that passed due and end dates have made effective"
+
+    def handle(self, *args, **options):
+        # Invoices and subscriptions lapse by date, not through a save; store
+        # the new statuses so their events are recorded.
+        overdue = mark_invoices_overdue(
+            Invoice.objects.filter(status=Invoice.Status.UNPAID)
+            .filter_effective_status(Invoice.Status.OVERDUE)
+            .values_list("pk", flat=True)
+        )
+        expired = expire_subscriptions()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Marked {len(overdue)} invoices overdue and {len(expired)} subscriptions expired"
+            )
+        )
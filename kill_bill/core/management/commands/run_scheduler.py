@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from kill_bill.core.scheduler import configured_jobs, node_name, run_due_jobs, run_forever
+
+
+class Command(BaseCommand):
+    help = "Run the jobs in settings.SCHEDULED_JOBS on schedule, once across all nodes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Run whatever is due (including missed runs) and exit",
+        )
+        parser.add_argument(
+            "--interval",
+            type=int,
+            default=30,
+            help="Seconds between checks for due jobs (default: 30)",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            jobs = configured_jobs()
+        except ValueError as e:
+            raise CommandError(str(e))
+        if not jobs:
+            raise CommandError("No jobs configured in SCHEDULED_JOBS")
+
+        node = node_name()
+        self.stdout.write(
+            self.style.MIGRATE_HEADING(f"Scheduler {node}: {', '.join(job.name for job in jobs)}")
+        )
+        if options["once"]:
+            for run in run_due_jobs(jobs, node):
+                self.report(run)
+            return
+        run_forever(jobs, node, options["interval"], on_run=self.report)
+
+    def report(self, run):
+        style = self.style.SUCCESS if run.status == run.Status.SUCCEEDED else self.style.ERROR
+        self.stdout.write(
+            style(f"{run.job} ({run.scheduled_for:%Y-%m-%d %H:%M}): {run.status} in {run.duration}")
+        )
@@ -1,55 +1,113 @@
+import json
 from datetime import timedelta
+from functools import partial
 
 from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
 from django.template.loader import render_to_string
 from django.utils import timezone
 
-from kill_bill.core.models import SiteConfiguration, Subscription
-from kill_bill.core.utils import process_expiring_subscriptions, send_and_log_email
+from kill_bill.core.models import EmailLog, SiteConfiguration, Subscription
+from kill_bill.core.utils import (
+    SUBSCRIPTION_EXPIRED_SUBJECT,
+    email_log_fields,
+    empty_results,
+    expiry_watermark,
+    iter_expiring_subscriptions,
+    render_email,
+    send_and_log_email,
+    send_emails_concurrently,
+    tally_outcome,
+)
 
 
 class Command(BaseCommand):
     help = "Sends automated emails for expiring and expired subscriptions, and generates invoices"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=1,
+            help="Number of emails to render and send in parallel (default: 1, sequential)",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of processes to split expiring subscriptions across (default: 1)",
+        )
+        parser.add_argument(
+            "--output",
+            choices=["text", "jsonl"],
+            default="text",
+            help="text (default) or jsonl: one JSON object per subscription as it is processed",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help=(
+                "Only check subscriptions that entered the expiry window or were saved since "
+                "the last run (default: re-check every subscription in the window)"
+            ),
+        )
+
     def handle(self, *args, **options):
+        concurrency = options["concurrency"]
+        self.jsonl = options["output"] == "jsonl"
         today = timezone.now().date()
         config = SiteConfiguration.get_config()
         days_before = config.invoice_days_before_expiry
 
-        self.stdout.write(
+        self.write(
             self.style.MIGRATE_HEADING(
                 f"Running subscription emails (invoice {days_before} days or less before expiry)"
             )
         )
 
         # 1. Generate invoices and send reminders for subscriptions expiring within configured days
-        results = process_expiring_subscriptions(days_before)
-
-        self.stdout.write(
-            f"Found {results['subscriptions_found']} subscriptions expiring within {days_before} days"
+        incremental = options["incremental"]
+        scope = (
+            "new or changed since the last run" if expiry_watermark(incremental) else "in total"
         )
-
-        for detail in results["details"]:
-            if detail["action"] == "created":
+        results = empty_results()
+        for outcome in iter_expiring_subscriptions(
+            days_before,
+            concurrency=concurrency,
+            incremental=incremental,
+            workers=options["workers"],
+        ):
+            tally_outcome(results, outcome)
+            if self.jsonl:
+                self.emit(outcome)
+                continue
+            if outcome["action"] == "created":
                 self.stdout.write(
                     self.style.SUCCESS(
-                        f"  Created invoice {detail['invoice']} for {detail['client']}"
+                        f"  Created invoice {outcome['invoice']} for {outcome['client']}"
                     )
                 )
-                if detail["email_sent"]:
-                    self.stdout.write(
-                        self.style.SUCCESS(f"  Sent invoice email to {detail['client']}")
-                    )
-                else:
-                    self.stdout.write(
-                        self.style.ERROR(f"  Failed to send email to {detail['client']}")
-                    )
             else:
                 self.stdout.write(
-                    f"  Invoice {detail['invoice']} already exists for {detail['client']}"
+                    f"  Invoice {outcome['invoice']} already exists for {outcome['client']}"
+                )
+            if not outcome["email_due"]:
+                continue
+            if outcome["email_sent"]:
+                self.stdout.write(
+                    self.style.SUCCESS(f"  Sent invoice email to {outcome['client']}")
+                )
+            else:
+                self.stdout.write(
+                    self.style.ERROR(f"  Failed to send email to {outcome['client']}")
                 )
 
-        self.stdout.write(
+        if self.jsonl:
+            self.emit({"summary": results})
+        self.write(
+            f"Found {results['subscriptions_found']} subscriptions expiring within {days_before} days ({scope})"
+        )
+        self.write(
             f"Summary: {results['invoices_created']} invoices created, "
             f"{results['invoices_existing']} already existed, "
             f"{results['emails_sent']} emails sent"
@@ -57,14 +115,50 @@ class Command(BaseCommand):
 
         # 2. Expired (Yesterday) - send notification without invoice
         expired_date = today - timedelta(days=1)
-        expired_subscriptions = Subscription.objects.filter(end_date=expired_date)
+        expired_subscriptions = Subscription.objects.filter(
+            end_date=expired_date
+        ).select_related("client", "plan")
 
-        self.stdout.write(
+        self.write(
             f"\nFound {expired_subscriptions.count()} subscriptions expired on {expired_date}"
         )
 
-        for sub in expired_subscriptions:
-            self.send_email(sub, "Subscription Expired", "emails/subscription_expired")
+        if concurrency > 1:
+            self.send_emails_concurrently(
+                list(expired_subscriptions),
+                SUBSCRIPTION_EXPIRED_SUBJECT,
+                "emails/subscription_expired",
+                concurrency,
+            )
+        else:
+            for sub in expired_subscriptions:
+                self.send_email(sub, SUBSCRIPTION_EXPIRED_SUBJECT, "emails/subscription_expired")
+
+    def write(self, message: str):
+        """Write a text-mode line; JSON Lines output only carries outcomes."""
+        if not self.jsonl:
+            self.stdout.write(message)
+
+    def emit(self, outcome: dict):
+        self.stdout.write(json.dumps(outcome, cls=DjangoJSONEncoder))
+        # Keep piped output moving while the run is in progress.
+        self.stdout.flush()
+
+    def report_expired(self, subscription: Subscription, sent: bool, error: str = ""):
+        if self.jsonl:
+            self.emit({
+                "subscription": subscription.pk,
+                "client": subscription.client.company_name,
+                "action": "expired_notice",
+                "email_sent": sent,
+            })
+        elif sent:
+            self.stdout.write(self.style.SUCCESS(f"  Sent email to {subscription.client.email}"))
+        else:
+            suffix = f": {error}" if error else ""
+            self.stdout.write(
+                self.style.ERROR(f"  Failed to send email to {subscription.client.email}{suffix}")
+            )
 
     def send_email(self, subscription: Subscription, subject: str, template_base: str):
         """Send a generic subscription email."""
@@ -78,13 +172,32 @@ class Command(BaseCommand):
                 message=plain_message,
                 recipient_list=[subscription.client.email],
                 html_message=html_message,
-            )
-            self.stdout.write(
-                self.style.SUCCESS(f"  Sent email to {subscription.client.email}")
+                log_fields=email_log_fields(
+                    EmailLog.MessageType.SUBSCRIPTION_EXPIRED, subscription=subscription
+                ),
             )
         except Exception as e:
-            self.stdout.write(
-                self.style.ERROR(
-                    f"  Failed to send email to {subscription.client.email}: {e}"
-                )
+            self.report_expired(subscription, False, str(e))
+        else:
+            self.report_expired(subscription, True)
+
+    def send_emails_concurrently(
+        self, subscriptions: list, subject: str, template_base: str, concurrency: int
+    ):
+        """Send a generic subscription email to each subscription through a thread pool."""
+        jobs = [
+            partial(
+                render_email,
+                subject=subject,
+                template_base=template_base,
+                context={"subscription": subscription},
+                recipient_list=[subscription.client.email],
+                log_fields=email_log_fields(
+                    EmailLog.MessageType.SUBSCRIPTION_EXPIRED, subscription=subscription
+                ),
             )
+            for subscription in subscriptions
+        ]
+        outcomes = send_emails_concurrently(jobs, concurrency)
+        for subscription, sent in zip(subscriptions, outcomes):
+            self.report_expired(subscription, sent)
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_invoiceconfiguration"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(fields=["status", "due_date"], name="core_invoic_status_71224b_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="subscription",
+            index=models.Index(fields=["status", "end_date"], name="core_subscr_status_fb4057_idx"),
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:08
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_billing_counters(apps, schema_editor):
+    Client = apps.get_model("core", "Client")
+    Invoice = apps.get_model("core", "Invoice")
+    Payment = apps.get_model("core", "Payment")
+    Subscription = apps.get_model("core", "Subscription")
+
+    def total(queryset, expression, default):
+        return Coalesce(
+            Subquery(
+                queryset.order_by()
+                .values("subscription__client")
+                .annotate(total=expression)
+                .values("total")
+            ),
+            Value(default),
+        )
+
+    Client.objects.update(
+        outstanding_balance=total(
+            Invoice.objects.filter(
+                subscription__client=OuterRef("pk"), status__in=["unpaid", "overdue"]
+            ),
+            Sum("amount"),
+            Decimal("0.00"),
+        ),
+        lifetime_paid=total(
+            Payment.objects.filter(subscription__client=OuterRef("pk"), status="received"),
+            Sum("amount"),
+            Decimal("0.00"),
+        ),
+        active_subscription_count=Coalesce(
+            Subquery(
+                Subscription.objects.filter(client=OuterRef("pk"), status="active")
+                .order_by()
+                .values("client")
+                .annotate(count=Count("pk"))
+                .values("count")
+            ),
+            Value(0),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0005_status_date_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="client",
+            name="active_subscription_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="client",
+            name="lifetime_paid",
+            field=models.DecimalField(decimal_places=2, default=Decimal("0.00"), editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name="client",
+            name="outstanding_balance",
+            field=models.DecimalField(decimal_places=2, default=Decimal("0.00"), editable=False, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name="client",
+            index=models.Index(fields=["outstanding_balance"], name="core_client_outstan_0bfd4d_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="client",
+            index=models.Index(fields=["active_subscription_count"], name="core_client_active__1fc3ae_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="client",
+            index=models.Index(fields=["lifetime_paid"], name="core_client_lifetim_65fa51_idx"),
+        ),
+        migrations.RunPython(backfill_billing_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0006_client_billing_counters"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BankStatement",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("filename", models.CharField(max_length=255)),
+            ],
+            options={
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.CreateModel(
+            name="BankStatementLine",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("line_number", models.PositiveIntegerField()),
+                ("date", models.DateField()),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=10)),
+                ("reference", models.CharField(blank=True, max_length=255)),
+                ("payer", models.CharField(blank=True, max_length=255)),
+                ("status", models.CharField(choices=[("matched", "Matched"), ("ambiguous", "Needs review"), ("unmatched", "Unmatched"), ("ignored", "Ignored")], max_length=20)),
+                ("note", models.CharField(blank=True, max_length=255)),
+                ("candidates", models.ManyToManyField(blank=True, related_name="+", to="core.invoice")),
+                ("invoice", models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="statement_lines", to="core.invoice")),
+                ("payment", models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="statement_line", to="core.payment")),
+                ("statement", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="lines", to="core.bankstatement")),
+            ],
+            options={
+                "ordering": ["statement", "line_number"],
+                "indexes": [models.Index(fields=["statement", "status"], name="core_bankst_stateme_0a4006_idx")],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0007_bankstatement"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="invoiceconfiguration",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
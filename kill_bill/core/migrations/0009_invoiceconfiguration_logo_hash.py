@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:25
+
+from django.db import migrations, models
+
+
+def backfill_logo_hash(apps, schema_editor):
+    from kill_bill.core.logos import content_hash
+
+    InvoiceConfiguration = apps.get_model("core", "InvoiceConfiguration")
+    for config in InvoiceConfiguration.objects.exclude(logo="").exclude(logo__isnull=True):
+        try:
+            config.logo_hash = content_hash(config.logo)
+        except OSError:
+            # Missing upload; the logo keeps being served as is.
+            continue
+        config.save(update_fields=["logo_hash"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0008_invoiceconfiguration_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="invoiceconfiguration",
+            name="logo_hash",
+            field=models.CharField(blank=True, default="", editable=False, max_length=64),
+        ),
+        migrations.RunPython(backfill_logo_hash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:29
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0009_invoiceconfiguration_logo_hash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="JobLease",
+            fields=[
+                ("name", models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ("owner", models.CharField(max_length=255)),
+                ("expires_at", models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name="JobRun",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("job", models.CharField(max_length=100)),
+                ("scheduled_for", models.DateTimeField()),
+                ("status", models.CharField(choices=[("running", "Running"), ("succeeded", "Succeeded"), ("failed", "Failed"), ("abandoned", "Abandoned")], default="running", max_length=20)),
+                ("node", models.CharField(max_length=255)),
+                ("started_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("finished_at", models.DateTimeField(blank=True, null=True)),
+                ("duration", models.DurationField(blank=True, null=True)),
+                ("output", models.TextField(blank=True)),
+            ],
+            options={
+                "ordering": ["-started_at"],
+                "indexes": [models.Index(fields=["job", "scheduled_for"], name="core_jobrun_job_675fe9_idx")],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_scheduler"),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="invoice",
+            constraint=models.UniqueConstraint(fields=("subscription", "due_date"), name="unique_invoice_per_period", violation_error_message="This subscription already has an invoice due on that date."),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0011_invoice_unique_period"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="siteconfiguration",
+            name="expiry_scanned_at",
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name="siteconfiguration",
+            name="expiry_scanned_through",
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="subscription",
+            index=models.Index(fields=["status", "updated_at"], name="core_subscr_status_016e8f_idx"),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:44
+
+import django.db.models.deletion
+import django.utils.timezone
+import kill_bill.core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0012_expiry_watermark"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WebhookEndpoint",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("url", models.URLField(max_length=500)),
+                ("secret", models.CharField(default=kill_bill.core.models.generate_webhook_secret, help_text="Shared secret used to sign each request (X-KillBill-Signature)", max_length=128)),
+                ("events", models.JSONField(blank=True, default=list, help_text="List of event types to send, such as invoice.created; empty for all")),
+                ("is_active", models.BooleanField(default=True)),
+            ],
+            options={
+                "abstract": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="WebhookEvent",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("type", models.CharField(choices=[("invoice.created", "Invoice created"), ("invoice.paid", "Invoice paid"), ("invoice.overdue", "Invoice overdue"), ("subscription.created", "Subscription created"), ("subscription.expired", "Subscription expired"), ("payment.received", "Payment received")], max_length=50)),
+                ("data", models.JSONField()),
+                ("created_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                "ordering": ["pk"],
+            },
+        ),
+        migrations.CreateModel(
+            name="WebhookDelivery",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("status", models.CharField(choices=[("pending", "Pending"), ("delivered", "Delivered"), ("failed", "Failed")], default="pending", max_length=20)),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("next_attempt_at", models.DateTimeField(default=django.utils.timezone.now)),
+                ("last_status_code", models.PositiveIntegerField(blank=True, null=True)),
+                ("last_error", models.TextField(blank=True)),
+                ("delivered_at", models.DateTimeField(blank=True, null=True)),
+                ("endpoint", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="deliveries", to="core.webhookendpoint")),
+                ("event", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="deliveries", to="core.webhookevent")),
+            ],
+            options={
+                "verbose_name_plural": "webhook deliveries",
+                "ordering": ["pk"],
+                "indexes": [models.Index(fields=["endpoint", "status", "id"], name="core_webhoo_endpoin_68004d_idx")],
+            },
+        ),
+    ]
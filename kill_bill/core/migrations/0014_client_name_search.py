@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:56
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0013_webhooks"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="client",
+            index=models.Index(django.db.models.functions.text.Upper("company_name"), name="client_company_name_upper"),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0014_client_name_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="emaillog",
+            name="client",
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="email_logs", to="core.client"),
+        ),
+        migrations.AddField(
+            model_name="emaillog",
+            name="invoice",
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="email_logs", to="core.invoice"),
+        ),
+        migrations.AddField(
+            model_name="emaillog",
+            name="message_type",
+            field=models.CharField(choices=[("subscription_created", "Subscription created"), ("invoice_reminder", "Invoice reminder"), ("subscription_expired", "Subscription expired"), ("other", "Other")], default="other", max_length=30),
+        ),
+        migrations.AddField(
+            model_name="emaillog",
+            name="subscription",
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name="email_logs", to="core.subscription"),
+        ),
+        migrations.AddIndex(
+            model_name="emaillog",
+            index=models.Index(fields=["client", "-created_at"], name="emaillog_client_created"),
+        ),
+        migrations.AddIndex(
+            model_name="emaillog",
+            index=models.Index(fields=["invoice", "-created_at"], name="emaillog_invoice_created"),
+        ),
+    ]
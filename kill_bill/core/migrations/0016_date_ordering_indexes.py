@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0015_email_log_links"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="invoice",
+            index=models.Index(fields=["issue_date", "id"], name="core_invoic_issue_d_fc723d_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(fields=["payment_date", "id"], name="core_paymen_payment_9fd906_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="subscription",
+            index=models.Index(fields=["start_date", "id"], name="core_subscr_start_d_29a6fb_idx"),
+        ),
+    ]
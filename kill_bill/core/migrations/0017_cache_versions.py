@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0016_date_ordering_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CacheVersion",
+            fields=[
+                ("key", models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ("version", models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
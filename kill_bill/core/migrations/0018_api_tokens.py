@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:33
+
+import django.db.models.deletion
+import kill_bill.core.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0017_cache_versions"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ApiToken",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("name", models.CharField(help_text="What the token is used for", max_length=100)),
+                ("key", models.CharField(default=kill_bill.core.models.generate_api_token, help_text="Sent as: Authorization: Bearer <key>", max_length=64, unique=True)),
+                ("user", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="api_tokens", to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                "verbose_name": "API token",
+            },
+        ),
+    ]
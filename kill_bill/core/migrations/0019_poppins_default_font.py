@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:47
+
+from django.db import migrations, models
+
+
+def replace_outfit(apps, schema_editor):
+    InvoiceConfiguration = apps.get_model("core", "InvoiceConfiguration")
+    # Outfit is no longer bundled; Poppins is the closest self-hosted family.
+    InvoiceConfiguration.objects.filter(font_family="Outfit").update(font_family="Poppins")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0018_api_tokens"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="invoiceconfiguration",
+            name="font_family",
+            field=models.CharField(choices=[("Inter", "Inter"), ("Roboto", "Roboto"), ("Poppins", "Poppins"), ("Lato", "Lato"), ("Open Sans", "Open Sans"), ("Playfair Display", "Playfair Display"), ("Merriweather", "Merriweather")], default="Poppins", help_text="Font used in invoice", max_length=50),
+        ),
+        migrations.RunPython(replace_outfit, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0019_poppins_default_font"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="invoice",
+            name="email_pending",
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -1,12 +1,21 @@
 from __future__ import annotations
 
+import logging
+import secrets
 from calendar import monthrange
 from datetime import date, timedelta
+from decimal import Decimal
 from typing import Tuple
 
-from django.db import models
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Case, Count, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Upper
 from django.utils import timezone
 
+logger = logging.getLogger(__name__)
+
 
 class TimeStampedModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
@@ -16,6 +25,67 @@ class TimeStampedModel(models.Model):
         abstract = True
 
 
+BILLING_COUNTER_FIELDS = ("outstanding_balance", "active_subscription_count", "lifetime_paid")
+
+
+class ClientQuerySet(models.QuerySet):
+    def with_computed_billing_counters(self) -> "ClientQuerySet":
+        """Annotate ``computed_<counter>`` for each counter, from the source rows."""
+        return self.annotate(
+            **{
+                f"computed_{name}": expression
+                for name, expression in self._billing_counter_expressions().items()
+            }
+        )
+
+    def refresh_billing_counters(self) -> int:
+        """Recompute the stored billing counters of these clients in one UPDATE."""
+        return self.update(**self._billing_counter_expressions())
+
+    @staticmethod
+    def _billing_counter_expressions() -> dict:
+        def total(queryset, expression):
+            return Coalesce(
+                Subquery(
+                    queryset.order_by()
+                    .values("subscription__client")
+                    .annotate(total=expression)
+                    .values("total")
+                ),
+                Value(Decimal("0.00")),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            )
+
+        return {
+            "outstanding_balance": total(
+                Invoice.objects.filter(
+                    subscription__client=OuterRef("pk"),
+                    status__in=[Invoice.Status.UNPAID, Invoice.Status.OVERDUE],
+                ),
+                Sum("amount"),
+            ),
+            "lifetime_paid": total(
+                Payment.objects.filter(
+                    subscription__client=OuterRef("pk"),
+                    status=Payment.Status.RECEIVED,
+                ),
+                Sum("amount"),
+            ),
+            "active_subscription_count": Coalesce(
+                Subquery(
+                    Subscription.objects.filter(
+                        client=OuterRef("pk"), status=Subscription.Status.ACTIVE
+                    )
+                    .order_by()
+                    .values("client")
+                    .annotate(count=Count("pk"))
+                    .values("count")
+                ),
+                Value(0),
+            ),
+        }
+
+
 class Client(TimeStampedModel):
     class Status(models.TextChoices):
         ACTIVE = "active", "Active"
@@ -29,10 +99,79 @@ class Client(TimeStampedModel):
         max_length=20, choices=Status.choices, default=Status.ACTIVE
     )
 
+    # Denormalized billing counters, kept in step by BillingCountersMixin and
+    # repaired by the reconcile_client_counters command.
+    outstanding_balance = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal("0.00"), editable=False
+    )
+    active_subscription_count = models.PositiveIntegerField(default=0, editable=False)
+    lifetime_paid = models.DecimalField(
+        max_digits=12, decimal_places=2, default=Decimal("0.00"), editable=False
+    )
+
+    objects = ClientQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["outstanding_balance"]),
+            models.Index(fields=["active_subscription_count"]),
+            models.Index(fields=["lifetime_paid"]),
+            # Case-insensitive prefix search (see views.autocomplete_clients).
+            models.Index(Upper("company_name"), name="client_company_name_upper"),
+        ]
+
     def __str__(self) -> str:  # pragma: no cover - simple representation
         return self.company_name
 
 
+class BillingCountersMixin:
+    """
+    Refresh the owning client's billing counters in the same transaction as
+    every save; deletes, including queryset deletes, are handled by the
+    post_delete receiver in signals.py. Set-based writes (``update()``,
+    ``bulk_create()``) bypass both, so code making them refreshes the
+    counters itself with ``ClientQuerySet.refresh_billing_counters``.
+
+    Subclasses must set ``billing_owner_field``, the foreign key that
+    decides the owning client, and ``billing_client_lookup``, the lookup
+    from ``Client`` to that key's target. The owner as loaded is remembered,
+    so moving a row to another client refreshes the client it left as well.
+    """
+
+    billing_owner_field: str
+    billing_client_lookup: str
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name in ("billing_owner_field", "billing_client_lookup"):
+            if not isinstance(getattr(cls, name, None), str):
+                raise TypeError(f"{cls.__name__} must set {name}")
+
+    @classmethod
+    def billing_clients_of(cls, owners) -> ClientQuerySet:
+        return Client.objects.filter(**{f"{cls.billing_client_lookup}__in": owners})
+
+    def billing_clients(self) -> ClientQuerySet:
+        return self.billing_clients_of([getattr(self, self.billing_owner_field)])
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Read __dict__ so a deferred field is not loaded here.
+        instance._loaded_billing_owner = instance.__dict__.get(cls.billing_owner_field)
+        return instance
+
+    def save(self, *args, **kwargs):
+        owners = {getattr(self, self.billing_owner_field)}
+        loaded = getattr(self, "_loaded_billing_owner", None)
+        if loaded is not None:
+            owners.add(loaded)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.billing_clients_of(owners).refresh_billing_counters()
+        self._loaded_billing_owner = getattr(self, self.billing_owner_field)
+
+
 class SubscriptionPlan(models.Model):
     name = models.CharField(max_length=100)
     price_monthly = models.DecimalField(max_digits=10, decimal_places=2)
@@ -43,7 +182,54 @@ class SubscriptionPlan(models.Model):
         return self.name
 
 
-class Subscription(TimeStampedModel):
+class SubscriptionQuerySet(models.QuerySet):
+    """
+    ``effective_status`` is the status a subscription has today, whether or
+    not the stored ``status`` column has been refreshed since ``end_date``
+    passed.
+    """
+
+    def with_effective_status(self) -> "SubscriptionQuerySet":
+        Status = self.model.Status
+        today = timezone.now().date()
+        return self.annotate(
+            effective_status=Case(
+                When(status=Status.CANCELLED, then=Value(Status.CANCELLED)),
+                When(end_date__lt=today, then=Value(Status.EXPIRED)),
+                default=Value(Status.ACTIVE),
+                output_field=models.CharField(),
+            )
+        )
+
+    def filter_effective_status(self, *statuses: str) -> "SubscriptionQuerySet":
+        # Filter with the column predicates equivalent to the CASE expression
+        # so the (status, end_date) index can be used.
+        Status = self.model.Status
+        today = timezone.now().date()
+        not_cancelled = Q(status__in=[Status.ACTIVE, Status.EXPIRED])
+        predicates = {
+            Status.CANCELLED: Q(status=Status.CANCELLED),
+            Status.EXPIRED: not_cancelled & Q(end_date__lt=today),
+            Status.ACTIVE: not_cancelled
+            & (Q(end_date__gte=today) | Q(end_date__isnull=True)),
+        }
+        condition = Q(pk__in=[])
+        for status in statuses:
+            condition |= predicates[status]
+        return self.filter(condition)
+
+
+def calculate_end_date(start_date: date, billing_cycle: str) -> date:
+    """Last day of a billing period starting on ``start_date``."""
+    months = 12 if billing_cycle == Subscription.BillingCycle.ANNUAL else 1
+    month = start_date.month - 1 + months
+    year = start_date.year + month // 12
+    month = month % 12 + 1
+    day = min(start_date.day, monthrange(year, month)[1])
+    return date(year, month, day) - timedelta(days=1)
+
+
+class Subscription(BillingCountersMixin, TimeStampedModel):
     class BillingCycle(models.TextChoices):
         MONTHLY = "monthly", "Monthly"
         ANNUAL = "annual", "Annual"
@@ -64,20 +250,29 @@ class Subscription(TimeStampedModel):
         max_length=20, choices=Status.choices, default=Status.ACTIVE
     )
 
+    objects = SubscriptionQuerySet.as_manager()
+
     class Meta:
         ordering = ["-start_date"]
+        indexes = [
+            models.Index(fields=["status", "end_date"]),
+            models.Index(fields=["status", "updated_at"]),
+            # Default ordering, with the admin's pk tie-break, and its date hierarchy.
+            models.Index(fields=["start_date", "id"]),
+        ]
 
     def __str__(self) -> str:  # pragma: no cover
         return f"{self.client} - {self.plan}"
 
+    def get_effective_status_display(self) -> str:
+        status = getattr(self, "effective_status", self.status)
+        return self.Status(status).label
+
+    billing_owner_field = "client_id"
+    billing_client_lookup = "pk"
+
     def _calculate_end_date(self) -> date:
-        months = 12 if self.billing_cycle == self.BillingCycle.ANNUAL else 1
-        month = self.start_date.month - 1 + months
-        year = self.start_date.year + month // 12
-        month = month % 12 + 1
-        day = min(self.start_date.day, monthrange(year, month)[1])
-        calculated = date(year, month, day) - timedelta(days=1)
-        return calculated
+        return calculate_end_date(self.start_date, self.billing_cycle)
 
     def _compute_status(self) -> str:
         if self.status == self.Status.CANCELLED:
@@ -101,7 +296,7 @@ class Subscription(TimeStampedModel):
         return today <= self.end_date <= today + timedelta(days=30)
 
 
-class Payment(TimeStampedModel):
+class Payment(BillingCountersMixin, TimeStampedModel):
     class Method(models.TextChoices):
         BANK_TRANSFER = "bank_transfer", "Bank Transfer"
         CHEQUE = "cheque", "Cheque"
@@ -122,12 +317,51 @@ class Payment(TimeStampedModel):
 
     class Meta:
         ordering = ["-payment_date"]
+        indexes = [models.Index(fields=["payment_date", "id"])]
 
     def __str__(self) -> str:  # pragma: no cover
         return f"Payment {self.amount} for {self.subscription}"
 
+    billing_owner_field = "subscription_id"
+    billing_client_lookup = "subscriptions"
+
 
-class Invoice(TimeStampedModel):
+class InvoiceQuerySet(models.QuerySet):
+    """
+    ``effective_status`` is the status an invoice has today, whether or not
+    the stored ``status`` column has been refreshed since ``due_date`` passed.
+    """
+
+    def with_effective_status(self) -> "InvoiceQuerySet":
+        Status = self.model.Status
+        today = timezone.now().date()
+        return self.annotate(
+            effective_status=Case(
+                When(status=Status.PAID, then=Value(Status.PAID)),
+                When(due_date__lt=today, then=Value(Status.OVERDUE)),
+                default=Value(Status.UNPAID),
+                output_field=models.CharField(),
+            )
+        )
+
+    def filter_effective_status(self, *statuses: str) -> "InvoiceQuerySet":
+        # Filter with the column predicates equivalent to the CASE expression
+        # so the (status, due_date) index can be used.
+        Status = self.model.Status
+        today = timezone.now().date()
+        not_paid = Q(status__in=[Status.UNPAID, Status.OVERDUE])
+        predicates = {
+            Status.PAID: Q(status=Status.PAID),
+            Status.OVERDUE: not_paid & Q(due_date__lt=today),
+            Status.UNPAID: not_paid & Q(due_date__gte=today),
+        }
+        condition = Q(pk__in=[])
+        for status in statuses:
+            condition |= predicates[status]
+        return self.filter(condition)
+
+
+class Invoice(BillingCountersMixin, TimeStampedModel):
     class Status(models.TextChoices):
         UNPAID = "unpaid", "Unpaid"
         PAID = "paid", "Paid"
@@ -144,18 +378,59 @@ class Invoice(TimeStampedModel):
         max_length=20, choices=Status.choices, default=Status.UNPAID
     )
     last_reminder_sent_at = models.DateTimeField(blank=True, null=True)
+    # Set with the invoice by a billing run and cleared once its email is
+    # sent, so a run that stopped in between emails it next time.
+    email_pending = models.BooleanField(default=False)
+
+    objects = InvoiceQuerySet.as_manager()
 
     class Meta:
         ordering = ["-issue_date"]
+        indexes = [
+            models.Index(fields=["status", "due_date"]),
+            models.Index(fields=["issue_date", "id"]),
+        ]
+        constraints = [
+            # One invoice per billing period; lets invoice generation insert
+            # without checking first (see create_invoice_for_subscription).
+            models.UniqueConstraint(
+                fields=["subscription", "due_date"],
+                name="unique_invoice_per_period",
+                violation_error_message="This subscription already has an invoice due on that date.",
+            )
+        ]
 
     def __str__(self) -> str:  # pragma: no cover
         return self.invoice_number
 
+    def get_effective_status_display(self) -> str:
+        status = getattr(self, "effective_status", self.status)
+        return self.Status(status).label
+
+    billing_owner_field = "subscription_id"
+    billing_client_lookup = "subscriptions"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remembered so a save that pays the invoice records invoice.paid
+        # (see signals.py).
+        instance._loaded_status = instance.__dict__.get("status")
+        return instance
+
+    @property
+    def paid_by_this_save(self) -> bool:
+        """Whether the save in progress takes the invoice from unpaid to paid."""
+        return self.status == self.Status.PAID and getattr(
+            self, "_loaded_status", None
+        ) != self.Status.PAID
+
     def save(self, *args, **kwargs):
         if not self.invoice_number:
             self.invoice_number = self.generate_invoice_number()
         self.status = self.compute_status()
         super().save(*args, **kwargs)
+        self._loaded_status = self.status
 
     def compute_status(self) -> str:
         if self.status == self.Status.PAID:
@@ -178,9 +453,11 @@ class Invoice(TimeStampedModel):
 
     @property
     def days_overdue(self) -> int:
-        if self.status != self.Status.OVERDUE:
+        # Keyed on the due date rather than the stored status, which stays
+        # UNPAID until mark_invoices_overdue catches up with a lapsed invoice.
+        if self.status == self.Status.PAID or not self.due_date:
             return 0
-        return (timezone.now().date() - self.due_date).days
+        return max((timezone.now().date() - self.due_date).days, 0)
 
 
 ReminderSummary = Tuple[models.QuerySet["Invoice"], models.QuerySet["Invoice"]]
@@ -188,14 +465,10 @@ ReminderSummary = Tuple[models.QuerySet["Invoice"], models.QuerySet["Invoice"]]
 
 def get_reminder_invoices() -> ReminderSummary:
     today = timezone.now().date()
-    upcoming = Invoice.objects.filter(
-        status__in=[Invoice.Status.UNPAID, Invoice.Status.OVERDUE],
-        due_date__range=(today, today + timedelta(days=7)),
-    )
-    overdue = Invoice.objects.filter(
-        status__in=[Invoice.Status.UNPAID, Invoice.Status.OVERDUE],
-        due_date__lt=today,
+    upcoming = Invoice.objects.filter_effective_status(Invoice.Status.UNPAID).filter(
+        due_date__lte=today + timedelta(days=7),
     )
+    overdue = Invoice.objects.filter_effective_status(Invoice.Status.OVERDUE)
     return upcoming, overdue
 
 
@@ -204,13 +477,50 @@ class EmailLog(TimeStampedModel):
         SENT = "sent", "Sent"
         FAILED = "failed", "Failed"
 
+    class MessageType(models.TextChoices):
+        SUBSCRIPTION_CREATED = "subscription_created", "Subscription created"
+        INVOICE_REMINDER = "invoice_reminder", "Invoice reminder"
+        SUBSCRIPTION_EXPIRED = "subscription_expired", "Subscription expired"
+        OTHER = "other", "Other"
+
     recipient = models.EmailField()
     subject = models.CharField(max_length=255)
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.SENT)
     error_message = models.TextField(blank=True, null=True)
+    message_type = models.CharField(
+        max_length=30, choices=MessageType.choices, default=MessageType.OTHER
+    )
+    # Client and invoice lookups are served by the (<fk>, created_at) indexes below.
+    client = models.ForeignKey(
+        Client,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        db_index=False,
+        related_name="email_logs",
+    )
+    subscription = models.ForeignKey(
+        Subscription,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="email_logs",
+    )
+    invoice = models.ForeignKey(
+        Invoice,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        db_index=False,
+        related_name="email_logs",
+    )
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["client", "-created_at"], name="emaillog_client_created"),
+            models.Index(fields=["invoice", "-created_at"], name="emaillog_invoice_created"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.subject} to {self.recipient} ({self.status})"
@@ -221,6 +531,11 @@ class SiteConfiguration(models.Model):
         default=7,
         help_text="Number of days before subscription expiry to generate and send invoice"
     )
+    # Watermark of the last successful expiring-subscription run: it covered
+    # end dates up to ``expiry_scanned_through`` and every change made before
+    # ``expiry_scanned_at``. See process_expiring_subscriptions.
+    expiry_scanned_through = models.DateField(blank=True, null=True, editable=False)
+    expiry_scanned_at = models.DateTimeField(blank=True, null=True, editable=False)
 
     class Meta:
         verbose_name = "Site Configuration"
@@ -244,7 +559,6 @@ class InvoiceConfiguration(models.Model):
     """Singleton model for invoice customization settings."""
 
     class FontFamily(models.TextChoices):
-        OUTFIT = "Outfit", "Outfit"
         INTER = "Inter", "Inter"
         ROBOTO = "Roboto", "Roboto"
         POPPINS = "Poppins", "Poppins"
@@ -314,6 +628,8 @@ class InvoiceConfiguration(models.Model):
         null=True,
         help_text="Company logo (recommended: 200x80px)"
     )
+    # Content hash of ``logo``; keys the resized variants (see core/logos.py)
+    logo_hash = models.CharField(max_length=64, blank=True, default="", editable=False)
     theme = models.CharField(
         max_length=20,
         choices=Theme.choices,
@@ -323,7 +639,7 @@ class InvoiceConfiguration(models.Model):
     font_family = models.CharField(
         max_length=50,
         choices=FontFamily.choices,
-        default=FontFamily.OUTFIT,
+        default=FontFamily.POPPINS,
         help_text="Font used in invoice"
     )
     primary_color = models.CharField(
@@ -346,6 +662,8 @@ class InvoiceConfiguration(models.Model):
         default="#4a90d9",
         help_text="Accent color for highlights (hex)"
     )
+    # Part of the printed invoice's ETag
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         verbose_name = "Invoice Configuration"
@@ -355,9 +673,41 @@ class InvoiceConfiguration(models.Model):
         return "Invoice Configuration"
 
     def save(self, *args, **kwargs):
+        from .logos import build_logo_variants, content_hash
+
         # Ensure only one configuration instance exists (singleton pattern)
         self.pk = 1
+        new_logo = bool(self.logo) and not self.logo._committed
+        if new_logo:
+            self.logo_hash = content_hash(self.logo)
+        elif not self.logo:
+            self.logo_hash = ""
         super().save(*args, **kwargs)
+        if new_logo:
+            # Render the variants now so no page or email waits on it later.
+            try:
+                build_logo_variants(self.logo, self.logo_hash)
+            except OSError as e:
+                logger.warning(f"Could not render logo variants: {e}")
+
+    @property
+    def logo_print_url(self) -> str:
+        from .logos import logo_variant_url
+
+        return logo_variant_url(self, "print")
+
+    @property
+    def logo_preview_url(self) -> str:
+        from .logos import logo_variant_url
+
+        return logo_variant_url(self, "preview")
+
+    @property
+    def logo_data_uri(self) -> str:
+        """The logo as a small inline image for emails."""
+        from .logos import logo_data_uri
+
+        return logo_data_uri(self)
 
     @classmethod
     def get_config(cls) -> "InvoiceConfiguration":
@@ -365,6 +715,241 @@ class InvoiceConfiguration(models.Model):
         return config
 
     def get_font_url(self) -> str:
-        """Return Google Fonts URL for the selected font."""
-        font_name = self.font_family.replace(" ", "+")
-        return f"https://fonts.googleapis.com/css2?family={font_name}:wght@300;400;500;600;700&display=swap"
+        """Return the stylesheet URL for the selected font."""
+        from .fonts import font_stylesheet_url
+
+        return font_stylesheet_url(self.font_family)
+
+
+class BankStatement(TimeStampedModel):
+    """An imported bank statement CSV, reconciled against open invoices."""
+
+    filename = models.CharField(max_length=255)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self) -> str:  # pragma: no cover - simple representation
+        return self.filename
+
+
+class BankStatementLine(TimeStampedModel):
+    class Status(models.TextChoices):
+        MATCHED = "matched", "Matched"
+        AMBIGUOUS = "ambiguous", "Needs review"
+        UNMATCHED = "unmatched", "Unmatched"
+        IGNORED = "ignored", "Ignored"
+
+    statement = models.ForeignKey(
+        BankStatement, on_delete=models.CASCADE, related_name="lines"
+    )
+    line_number = models.PositiveIntegerField()
+    date = models.DateField()
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    reference = models.CharField(max_length=255, blank=True)
+    payer = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=20, choices=Status.choices)
+    note = models.CharField(max_length=255, blank=True)
+    invoice = models.ForeignKey(
+        Invoice,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name="statement_lines",
+    )
+    payment = models.OneToOneField(
+        Payment,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name="statement_line",
+    )
+    candidates = models.ManyToManyField(Invoice, blank=True, related_name="+")
+
+    class Meta:
+        ordering = ["statement", "line_number"]
+        indexes = [models.Index(fields=["statement", "status"])]
+
+    def __str__(self) -> str:  # pragma: no cover - simple representation
+        return f"Line {self.line_number}: {self.amount} {self.reference}"
+
+
+class JobLease(models.Model):
+    """Cross-node lock held by the scheduler while it runs a job."""
+
+    name = models.CharField(max_length=100, primary_key=True)
+    owner = models.CharField(max_length=255)
+    expires_at = models.DateTimeField()
+
+    def __str__(self) -> str:  # pragma: no cover - simple representation
+        return f"{self.name} ({self.owner})"
+
+
+class JobRun(models.Model):
+    """One execution of a scheduled job, for one schedule slot."""
+
+    class Status(models.TextChoices):
+        RUNNING = "running", "Running"
+        SUCCEEDED = "succeeded", "Succeeded"
+        FAILED = "failed", "Failed"
+        # The node died mid-run; the slot is run again.
+        ABANDONED = "abandoned", "Abandoned"
+
+    job = models.CharField(max_length=100)
+    scheduled_for = models.DateTimeField()
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.RUNNING)
+    node = models.CharField(max_length=255)
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    duration = models.DurationField(blank=True, null=True)
+    output = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ["-started_at"]
+        indexes = [models.Index(fields=["job", "scheduled_for"])]
+
+    def __str__(self) -> str:  # pragma: no cover - simple representation
+        return f"{self.job} @ {self.scheduled_for:%Y-%m-%d %H:%M} ({self.status})"
+
+
+def generate_webhook_secret() -> str:
+    return secrets.token_hex(32)
+
+
+class WebhookEndpoint(TimeStampedModel):
+    """An external URL that receives billing events (see core/webhooks.py)."""
+
+    url = models.URLField(max_length=500)
+    secret = models.CharField(
+        max_length=128,
+        default=generate_webhook_secret,
+        help_text="Shared secret used to sign each request (X-KillBill-Signature)",
+    )
+    events = models.JSONField(
+        default=list,
+        blank=True,
+        help_text="List of event types to send, such as invoice.created; empty for all",
+    )
+    is_active = models.BooleanField(default=True)
+
+    def __str__(self) -> str:  # pragma: no cover - simple representation
+        return self.url
+
+    def clean(self):
+        unknown = set(self.events or []) - set(WebhookEvent.Type.values)
+        if not isinstance(self.events, list) or unknown:
+            raise ValidationError(
+                {"events": f"Expected a list of: {', '.join(WebhookEvent.Type.values)}"}
+            )
+
+    def wants(self, event_type: str) -> bool:
+        return not self.events or event_type in self.events
+
+
+class WebhookEvent(models.Model):
+    """A billing event, recorded in the same transaction as the change."""
+
+    class Type(models.TextChoices):
+        INVOICE_CREATED = "invoice.created", "Invoice created"
+        INVOICE_PAID = "invoice.paid", "Invoice paid"
+        INVOICE_OVERDUE = "invoice.overdue", "Invoice overdue"
+        SUBSCRIPTION_CREATED = "subscription.created", "Subscription created"
+        SUBSCRIPTION_EXPIRED = "subscription.expired", "Subscription expired"
+        PAYMENT_RECEIVED = "payment.received", "Payment received"
+
+    type = models.CharField(max_length=50, choices=Type.choices)
+    data = models.JSONField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ["pk"]
+
+    def __str__(self) -> str:  # pragma: no cover - simple representation
+        return f"{self.type} #{self.pk}"
+
+
+class WebhookDelivery(models.Model):
+    """One event queued for one endpoint, delivered in event order."""
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        DELIVERED = "delivered", "Delivered"
+        # Gave up after WEBHOOK_MAX_ATTEMPTS; later events go ahead.
+        FAILED = "failed", "Failed"
+
+    endpoint = models.ForeignKey(
+        WebhookEndpoint, on_delete=models.CASCADE, related_name="deliveries"
+    )
+    event = models.ForeignKey(WebhookEvent, on_delete=models.CASCADE, related_name="deliveries")
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_status_code = models.PositiveIntegerField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    delivered_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ["pk"]
+        verbose_name_plural = "webhook deliveries"
+        indexes = [models.Index(fields=["endpoint", "status", "id"])]
+
+    def __str__(self) -> str:  # pragma: no cover - simple representation
+        return f"{self.event} to {self.endpoint} ({self.status})"
+
+
+class CacheVersion(models.Model):
+    """Counter of an in-process cache, shared by every process (see versions.py)."""
+
+    key = models.CharField(max_length=100, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self) -> str:  # pragma: no cover - simple representation
+        return f"{self.key} v{self.version}"
+
+
+def generate_api_token() -> str:
+    return secrets.token_urlsafe(32)
+
+
+class ApiToken(TimeStampedModel):
+    """A key that authenticates JSON API requests as ``user`` (see core/api.py)."""
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="api_tokens"
+    )
+    name = models.CharField(max_length=100, help_text="What the token is used for")
+    key = models.CharField(
+        max_length=64,
+        unique=True,
+        default=generate_api_token,
+        help_text="Sent as: Authorization: Bearer <key>",
+    )
+
+    class Meta:
+        verbose_name = "API token"
+
+    def __str__(self) -> str:  # pragma: no cover - simple representation
+        return f"{self.name} ({self.user})"
+
+
+class IdempotencyKey(TimeStampedModel):
+    """
+    An ``Idempotency-Key`` sent with a bulk invoice API request, and the
+    response to replay for retries. ``response`` is empty while the first
+    request is still running.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="idempotency_keys"
+    )
+    key = models.CharField(max_length=255)
+    body_hash = models.CharField(max_length=64)
+    response = models.JSONField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="unique_idempotency_key_per_user")
+        ]
+
+    def __str__(self) -> str:  # pragma: no cover - simple representation
+        return f"{self.key} ({self.user})"
@@ -0,0 +1,86 @@
+"""
+In-process cache of subscription plans.
+
+Plans are few and rarely change but are needed on almost every page, so
+each process keeps all of them in memory. Saving or deleting a plan moves
+a version counter kept in the database on (see versions.py), and every
+process reloads its copy at its next request or scheduled job.
+"""
+
+import threading
+from decimal import Decimal
+
+from django.db import DEFAULT_DB_ALIAS
+
+from .versions import bump, get_version, version_expression
+
+PLAN_VERSION_KEY = "subscription-plans"
+
+_lock = threading.Lock()
+_loaded = (None, {})
+
+
+def plans_version() -> str:
+    """Token that changes whenever any plan is saved or deleted."""
+    return get_version(PLAN_VERSION_KEY)
+
+
+def plans_version_expression():
+    """``plans_version`` as stored, folded into a query that runs anyway."""
+    return version_expression(PLAN_VERSION_KEY)
+
+
+def get_plans() -> dict:
+    """
+    Return every plan keyed by pk, in name order. The instances are shared
+    between requests and must be treated as read-only.
+    """
+    global _loaded
+    version = plans_version()
+    loaded_version, plans = _loaded
+    if loaded_version == version:
+        return plans
+
+    from .models import SubscriptionPlan
+
+    with _lock:
+        if _loaded[0] != version:
+            # Always read the primary: the version was moved on when the
+            # write committed there, a replica may not have it yet.
+            plans = {
+                plan.pk: plan
+                for plan in SubscriptionPlan.objects.using(DEFAULT_DB_ALIAS).order_by("name", "pk")
+            }
+            _loaded = (version, plans)
+        return _loaded[1]
+
+
+def get_plan(pk: int):
+    """Return the cached plan with this pk, or None."""
+    return get_plans().get(pk)
+
+
+def attach_plans(objects) -> list:
+    """Set ``plan`` on each subscription from the cache instead of a join."""
+    plans = get_plans()
+    objects = list(objects)
+    for obj in objects:
+        obj.plan = plans[obj.plan_id]
+    return objects
+
+
+def plan_price(plan_id: int, billing_cycle: str) -> Decimal:
+    """Price of a plan for a subscription billing cycle, without a query."""
+    from .models import Subscription, SubscriptionPlan
+
+    plan = get_plan(plan_id)
+    if plan is None:
+        raise SubscriptionPlan.DoesNotExist(f"Subscription plan {plan_id} does not exist")
+    if billing_cycle == Subscription.BillingCycle.MONTHLY:
+        return plan.price_monthly
+    return plan.price_annual
+
+
+def invalidate_plans(using: str = DEFAULT_DB_ALIAS):
+    """Make every process reload its plans once the writing transaction commits."""
+    bump(PLAN_VERSION_KEY, using=using)
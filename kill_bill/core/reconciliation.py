@@ -0,0 +1,276 @@
+"""
+Bank statement reconciliation.
+
+A statement CSV needs ``date``, ``amount`` and ``reference`` columns and may
+have a ``payer`` column. Each line is matched against the open invoices,
+first by an invoice number found in the reference, then by exact amount plus
+payer (the client's company name). Unambiguous matches are paid straight
+away; everything else waits on the review screen.
+"""
+
+import csv
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    BankStatement,
+    BankStatementLine,
+    Client,
+    Invoice,
+    Payment,
+    Subscription,
+    WebhookEvent,
+)
+from .fragments import touch
+from .webhooks import record_events
+
+OPEN_STATUSES = [Invoice.Status.UNPAID, Invoice.Status.OVERDUE]
+INVOICE_REFERENCE = re.compile(r"INV[-\s]?0*(\d+)", re.IGNORECASE)
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d.%m.%Y")
+REQUIRED_COLUMNS = {"date", "amount", "reference"}
+APPLY_BATCH_SIZE = 500
+MAX_CANDIDATES = 10
+
+
+class StatementError(ValueError):
+    """Raised when a statement file cannot be parsed."""
+
+
+@dataclass
+class StatementRow:
+    line_number: int
+    date: date
+    amount: Decimal
+    reference: str
+    payer: str
+
+
+def _parse_date(value: str, line_number: int) -> date:
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), fmt).date()
+        except ValueError:
+            continue
+    raise StatementError(f"Line {line_number}: invalid date {value!r}")
+
+
+def _parse_amount(value: str, line_number: int) -> Decimal:
+    try:
+        amount = Decimal(value.strip().replace(",", ""))
+    except InvalidOperation:
+        raise StatementError(f"Line {line_number}: invalid amount {value!r}")
+    if amount <= 0:
+        raise StatementError(f"Line {line_number}: amount must be positive")
+    return amount.quantize(Decimal("0.01"))
+
+
+def parse_statement(lines) -> list:
+    """Parse the lines of a statement CSV into ``StatementRow`` objects."""
+    reader = csv.DictReader(lines)
+    columns = {name.strip().lower() for name in reader.fieldnames or []}
+    missing = REQUIRED_COLUMNS - columns
+    if missing:
+        raise StatementError(f"Missing column(s): {', '.join(sorted(missing))}")
+
+    rows = []
+    for record in reader:
+        record = {(key or "").strip().lower(): (value or "") for key, value in record.items()}
+        line_number = reader.line_num
+        rows.append(
+            StatementRow(
+                line_number=line_number,
+                date=_parse_date(record["date"], line_number),
+                amount=_parse_amount(record["amount"], line_number),
+                reference=record["reference"].strip()[:255],
+                payer=record.get("payer", "").strip()[:255],
+            )
+        )
+    return rows
+
+
+def _client_key(name: str) -> str:
+    return " ".join(name.casefold().split())
+
+
+def _invoice_number_key(invoice_number: str):
+    match = INVOICE_REFERENCE.fullmatch(invoice_number)
+    return int(match.group(1)) if match else None
+
+
+class OpenInvoiceIndex:
+    """In-memory hash indexes over every open invoice, built from one query."""
+
+    def __init__(self):
+        self.by_number = {}
+        self.by_amount_client = defaultdict(list)
+        self.by_amount = defaultdict(list)
+        self.claimed = set()
+        invoices = (
+            Invoice.objects.filter(status__in=OPEN_STATUSES)
+            .order_by("pk")
+            .values_list("pk", "invoice_number", "amount", "subscription__client__company_name")
+        )
+        for pk, invoice_number, amount, company_name in invoices:
+            number = _invoice_number_key(invoice_number)
+            if number is not None:
+                self.by_number[number] = (pk, amount)
+            self.by_amount_client[(amount, _client_key(company_name))].append(pk)
+            self.by_amount[amount].append(pk)
+
+    def match(self, row: StatementRow) -> tuple:
+        """Return ``(status, invoice_pks)`` for a statement row."""
+        referenced = []
+        for number in INVOICE_REFERENCE.findall(row.reference):
+            invoice = self.by_number.get(int(number))
+            if invoice and invoice[0] not in self.claimed and invoice not in referenced:
+                referenced.append(invoice)
+        if len(referenced) == 1 and referenced[0][1] == row.amount:
+            return BankStatementLine.Status.MATCHED, [referenced[0][0]]
+        if referenced:
+            return BankStatementLine.Status.AMBIGUOUS, [pk for pk, _ in referenced]
+
+        if row.payer:
+            candidates = self._unclaimed(
+                self.by_amount_client.get((row.amount, _client_key(row.payer)), [])
+            )
+            if len(candidates) == 1:
+                return BankStatementLine.Status.MATCHED, candidates
+            if candidates:
+                return BankStatementLine.Status.AMBIGUOUS, candidates[:MAX_CANDIDATES]
+
+        candidates = self._unclaimed(self.by_amount.get(row.amount, []))
+        if 0 < len(candidates) <= MAX_CANDIDATES:
+            return BankStatementLine.Status.AMBIGUOUS, candidates
+        return BankStatementLine.Status.UNMATCHED, []
+
+    def claim(self, pk: int):
+        self.claimed.add(pk)
+
+    def _unclaimed(self, pks: list) -> list:
+        return [pk for pk in pks if pk not in self.claimed]
+
+
+def reconcile_statement(filename: str, rows: list) -> BankStatement:
+    """
+    Store a parsed statement, match every line against the open invoices and
+    pay the unambiguous matches. Returns the new ``BankStatement``.
+
+    Lines are written in batches; each batch's lines, payments and invoice
+    updates share one transaction.
+    """
+    index = OpenInvoiceIndex()
+    statement = BankStatement.objects.create(filename=filename[:255])
+
+    lines = []
+    candidates = []
+    for row in rows:
+        status, invoice_pks = index.match(row)
+        line = BankStatementLine(
+            statement=statement,
+            line_number=row.line_number,
+            date=row.date,
+            amount=row.amount,
+            reference=row.reference,
+            payer=row.payer,
+            status=status,
+        )
+        if status == BankStatementLine.Status.MATCHED:
+            line.invoice_id = invoice_pks[0]
+            index.claim(invoice_pks[0])
+        lines.append(line)
+        candidates.append(invoice_pks if status == BankStatementLine.Status.AMBIGUOUS else [])
+
+    Through = BankStatementLine.candidates.through
+    for start in range(0, len(lines), APPLY_BATCH_SIZE):
+        batch = lines[start:start + APPLY_BATCH_SIZE]
+        with transaction.atomic():
+            _pay_invoices([line for line in batch if line.invoice_id])
+            BankStatementLine.objects.bulk_create(batch)
+            Through.objects.bulk_create(
+                [
+                    Through(bankstatementline_id=line.pk, invoice_id=pk)
+                    for line, pks in zip(batch, candidates[start:start + APPLY_BATCH_SIZE])
+                    for pk in pks
+                ]
+            )
+    return statement
+
+
+def apply_matches(lines: list) -> int:
+    """
+    Pay the invoice chosen for each stored line (``invoice_id``), one
+    transaction per batch. Returns the number of invoices paid.
+    """
+    paid = 0
+    for start in range(0, len(lines), APPLY_BATCH_SIZE):
+        batch = lines[start:start + APPLY_BATCH_SIZE]
+        with transaction.atomic():
+            paid += _pay_invoices(batch)
+            BankStatementLine.objects.bulk_update(
+                batch, ["status", "note", "invoice", "payment"]
+            )
+    return paid
+
+
+def _pay_invoices(lines: list) -> int:
+    """
+    Record a Payment and mark the invoice paid for each line, inside the
+    caller's transaction. Lines whose invoice is no longer open are left
+    unmatched. Returns the number of invoices paid.
+    """
+    open_invoices = dict(
+        Invoice.objects.select_for_update()
+        .filter(pk__in=[line.invoice_id for line in lines], status__in=OPEN_STATUSES)
+        .order_by()
+        .values_list("pk", "subscription_id")
+    )
+
+    # invoice pk -> subscription pk for the invoices paid here; popping
+    # guards against two lines paying the same invoice.
+    invoices = {}
+    applied = []
+    for line in lines:
+        subscription_id = open_invoices.pop(line.invoice_id, None)
+        if subscription_id is None:
+            line.status = BankStatementLine.Status.UNMATCHED
+            line.note = "Invoice is no longer open"
+            line.invoice_id = None
+        else:
+            invoices[line.invoice_id] = subscription_id
+            applied.append(line)
+    if not applied:
+        return 0
+
+    payments = Payment.objects.bulk_create(
+        [
+            Payment(
+                subscription_id=invoices[line.invoice_id],
+                amount=line.amount,
+                payment_date=line.date,
+                payment_method=Payment.Method.BANK_TRANSFER,
+                status=Payment.Status.RECEIVED,
+            )
+            for line in applied
+        ]
+    )
+    for line, payment in zip(applied, payments):
+        line.payment = payment
+        line.status = BankStatementLine.Status.MATCHED
+        line.note = ""
+
+    Invoice.objects.filter(pk__in=invoices).update(
+        status=Invoice.Status.PAID, updated_at=timezone.now()
+    )
+    Client.objects.filter(
+        pk__in=Subscription.objects.filter(pk__in=invoices.values()).values("client_id")
+    ).refresh_billing_counters()
+    touch(Invoice)
+    record_events(WebhookEvent.Type.INVOICE_PAID, Invoice.objects.filter(pk__in=invoices))
+    record_events(WebhookEvent.Type.PAYMENT_RECEIVED, payments)
+    return len(applied)
@@ -0,0 +1,106 @@
+"""
+Read-replica routing.
+
+Views decorated with ``read_replica`` send the queries for this app's models
+to the optional ``replica`` database. Everything else, including sessions and
+auth, stays on ``default``. After any write request the browser is pinned to
+the primary for ``REPLICA_STICKY_SECONDS`` so it always reads its own writes.
+"""
+
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+REPLICA_DB = "replica"
+STICKY_COOKIE_NAME = "kb_read_primary"
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+_use_replica: ContextVar[bool] = ContextVar("use_replica", default=False)
+
+
+def replica_configured() -> bool:
+    return REPLICA_DB in settings.DATABASES
+
+
+def _should_use_replica(request) -> bool:
+    return (
+        replica_configured()
+        and request.method in SAFE_METHODS
+        and STICKY_COOKIE_NAME not in request.COOKIES
+    )
+
+
+def read_replica(view_func):
+    """Route the view's reads to the replica unless the request must see the primary."""
+    if iscoroutinefunction(view_func):
+
+        async def _wrapped_view(request, *args, **kwargs):
+            token = _use_replica.set(_should_use_replica(request))
+            try:
+                return await view_func(request, *args, **kwargs)
+            finally:
+                _use_replica.reset(token)
+
+    else:
+
+        def _wrapped_view(request, *args, **kwargs):
+            token = _use_replica.set(_should_use_replica(request))
+            try:
+                return view_func(request, *args, **kwargs)
+            finally:
+                _use_replica.reset(token)
+
+    return wraps(view_func)(_wrapped_view)
+
+
+class ReplicaRouter:
+    """Send reads of core models to the replica while a ``read_replica`` view runs."""
+
+    def db_for_read(self, model, **hints):
+        if (
+            model._meta.app_label == "core"
+            and _use_replica.get()
+            and replica_configured()
+        ):
+            return REPLICA_DB
+        return None
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same data as the primary.
+        return True
+
+
+class ReplicaStickinessMiddleware:
+    """Pin a browser to the primary for a short while after it writes."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        if request.method not in SAFE_METHODS and replica_configured():
+            response.set_cookie(
+                STICKY_COOKIE_NAME,
+                "1",
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
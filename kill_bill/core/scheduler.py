@@ -0,0 +1,212 @@
+"""
+In-process scheduler for the billing jobs.
+
+Each entry of ``settings.SCHEDULED_JOBS`` maps a management command to a
+schedule: ``{"at": "HH:MM"}`` runs daily at that local time, ``{"every": N}``
+every N minutes. Optional keys are ``args`` (command arguments) and
+``lease_seconds`` (how long a node may hold the job, default one hour).
+
+Any number of nodes can run ``manage.py run_scheduler``. A job's most
+recent slot is due until a run for it has finished, so a slot missed while
+no scheduler was up is caught up on the next check. A node only runs a job
+while it holds that job's row in ``JobLease``, so each slot runs once. The
+lease is renewed from a heartbeat thread while the job runs, so a job may
+take longer than ``lease_seconds``; only a node that stops renewing (one
+that died) loses it.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from io import StringIO
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import IntegrityError, close_old_connections, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import versions
+from .models import JobLease, JobRun
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE_SECONDS = 60 * 60
+# Times a running job's lease is renewed per lease period.
+LEASE_RENEWALS = 3
+MAX_OUTPUT_LENGTH = 10_000
+
+
+@dataclass
+class Job:
+    name: str
+    at: tuple = None
+    every: int = None
+    args: list = field(default_factory=list)
+    lease_seconds: int = DEFAULT_LEASE_SECONDS
+
+    @classmethod
+    def from_setting(cls, name: str, config: dict) -> "Job":
+        if ("at" in config) == ("every" in config):
+            raise ValueError(f"Scheduled job {name!r} needs exactly one of 'at' or 'every'")
+        at = None
+        if "at" in config:
+            hour, minute = (int(part) for part in config["at"].split(":"))
+            at = (hour, minute)
+        return cls(
+            name=name,
+            at=at,
+            every=config.get("every"),
+            args=list(config.get("args", [])),
+            lease_seconds=config.get("lease_seconds", DEFAULT_LEASE_SECONDS),
+        )
+
+    def latest_slot(self, now: datetime) -> datetime:
+        """The most recent scheduled time at or before ``now``."""
+        if self.every:
+            period = self.every * 60
+            return datetime.fromtimestamp(
+                int(now.timestamp()) // period * period, tz=now.tzinfo
+            )
+        local = timezone.localtime(now)
+        slot = local.replace(hour=self.at[0], minute=self.at[1], second=0, microsecond=0)
+        if slot > local:
+            slot -= timedelta(days=1)
+        return slot
+
+    def next_slot(self, now: datetime) -> datetime:
+        if self.every:
+            return self.latest_slot(now) + timedelta(minutes=self.every)
+        return self.latest_slot(now) + timedelta(days=1)
+
+
+def configured_jobs() -> list:
+    return [
+        Job.from_setting(name, config)
+        for name, config in getattr(settings, "SCHEDULED_JOBS", {}).items()
+    ]
+
+
+def node_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}"
+
+
+def acquire_lease(name: str, owner: str, seconds: int) -> bool:
+    """Take or extend the lease on ``name``; False if another node holds it."""
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=seconds)
+    # The WHERE clause is re-checked under the row lock, so of two nodes
+    # racing for an expired lease only one updates it.
+    if JobLease.objects.filter(
+        Q(expires_at__lte=now) | Q(owner=owner), name=name
+    ).update(owner=owner, expires_at=expires_at):
+        return True
+    try:
+        with transaction.atomic():
+            JobLease.objects.create(name=name, owner=owner, expires_at=expires_at)
+    except IntegrityError:
+        return False
+    return True
+
+
+def release_lease(name: str, owner: str):
+    JobLease.objects.filter(name=name, owner=owner).update(expires_at=timezone.now())
+
+
+@contextmanager
+def keep_lease(name: str, owner: str, seconds: int):
+    """Renew the lease on ``name`` from a background thread until the block exits."""
+    stop = threading.Event()
+
+    def renew():
+        try:
+            while not stop.wait(seconds / LEASE_RENEWALS):
+                try:
+                    if not acquire_lease(name, owner, seconds):
+                        logger.error(f"Lost the lease on {name} while running it")
+                except Exception as e:
+                    # Try again on the next beat; the lease has time left.
+                    logger.error(f"Failed to renew the lease on {name}: {e}")
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=renew, name=f"lease-{name}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def is_done(job: Job, slot: datetime) -> bool:
+    return JobRun.objects.filter(
+        job=job.name,
+        scheduled_for=slot,
+        status__in=[JobRun.Status.SUCCEEDED, JobRun.Status.FAILED],
+    ).exists()
+
+
+def run_job(job: Job, slot: datetime, node: str):
+    """
+    Run ``job`` for ``slot`` unless it has already run or another node holds
+    the job. Returns the ``JobRun``, or None if nothing was run.
+    """
+    if is_done(job, slot) or not acquire_lease(job.name, node, job.lease_seconds):
+        return None
+    try:
+        # Holding the lease, a run still marked running belongs to a node
+        # whose lease expired before it finished.
+        JobRun.objects.filter(job=job.name, status=JobRun.Status.RUNNING).update(
+            status=JobRun.Status.ABANDONED, finished_at=timezone.now()
+        )
+        if is_done(job, slot):
+            return None
+        run = JobRun.objects.create(job=job.name, scheduled_for=slot, node=node)
+        output = StringIO()
+        # Like a request, each job sees plan and endpoint changes made since the last.
+        versions.reset()
+        try:
+            with keep_lease(job.name, node, job.lease_seconds):
+                call_command(job.name, *job.args, stdout=output, stderr=output)
+            run.status = JobRun.Status.SUCCEEDED
+        except Exception:
+            output.write(traceback.format_exc())
+            run.status = JobRun.Status.FAILED
+        run.finished_at = timezone.now()
+        run.duration = run.finished_at - run.started_at
+        run.output = output.getvalue()[-MAX_OUTPUT_LENGTH:]
+        run.save(update_fields=["status", "finished_at", "duration", "output"])
+        return run
+    finally:
+        release_lease(job.name, node)
+
+
+def run_due_jobs(jobs: list, node: str, now: datetime = None) -> list:
+    """Run the latest slot of every job that has not run yet."""
+    now = now or timezone.now()
+    runs = []
+    for job in jobs:
+        run = run_job(job, job.latest_slot(now), node)
+        if run:
+            runs.append(run)
+    return runs
+
+
+def run_forever(jobs: list, node: str, poll_seconds: int, on_run=None):
+    """Run due jobs, then sleep until the next slot (checking every ``poll_seconds``)."""
+    while True:
+        close_old_connections()
+        for run in run_due_jobs(jobs, node):
+            if on_run:
+                on_run(run)
+        now = timezone.now()
+        next_slot = min(job.next_slot(now) for job in jobs)
+        time.sleep(max(1, min(poll_seconds, (next_slot - now).total_seconds())))
@@ -1,13 +1,29 @@
-from django.db.models.signals import post_save
+from django.contrib.auth import get_user_model
+from django.core.signals import request_started
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.template.loader import render_to_string
-from .utils import send_and_log_email
-from .models import Subscription
+from .auth import invalidate_user
+from .fragments import touch
+from .plans import invalidate_plans
+from .utils import SUBSCRIPTION_CREATED_SUBJECT, email_log_fields, send_and_log_email
+from .versions import reset as reset_versions
+from .webhooks import invalidate_endpoints, record_events
+from .models import (
+    Client,
+    EmailLog,
+    Invoice,
+    Payment,
+    Subscription,
+    SubscriptionPlan,
+    WebhookEndpoint,
+    WebhookEvent,
+)
 
 @receiver(post_save, sender=Subscription)
 def send_subscription_created_email(sender, instance, created, **kwargs):
     if created:
-        subject = "Welcome to Kill Bill - Subscription Created"
+        subject = SUBSCRIPTION_CREATED_SUBJECT
         context = {"subscription": instance}
         
         html_message = render_to_string("emails/subscription_created.html", context)
@@ -18,4 +34,73 @@ def send_subscription_created_email(sender, instance, created, **kwargs):
             message=plain_message,
             recipient_list=[instance.client.email],
             html_message=html_message,
+            log_fields=email_log_fields(
+                EmailLog.MessageType.SUBSCRIPTION_CREATED, subscription=instance
+            ),
         )
+
+
+# Each request reads the cache versions afresh (see versions.py).
+request_started.connect(reset_versions, dispatch_uid="kill_bill.core.versions.reset")
+
+
+@receiver(post_save, sender=SubscriptionPlan)
+@receiver(post_delete, sender=SubscriptionPlan)
+def invalidate_plan_cache(sender, using, **kwargs):
+    invalidate_plans(using)
+
+
+@receiver(post_save, sender=Subscription)
+def record_subscription_created(sender, instance, created, **kwargs):
+    if created:
+        record_events(WebhookEvent.Type.SUBSCRIPTION_CREATED, [instance])
+
+
+@receiver(post_save, sender=Invoice)
+def record_invoice_created(sender, instance, created, **kwargs):
+    if created:
+        record_events(WebhookEvent.Type.INVOICE_CREATED, [instance])
+
+
+@receiver(post_save, sender=Invoice)
+def record_invoice_paid(sender, instance, **kwargs):
+    # Set-based payments (mark_invoices_paid, reconciliation) record their own.
+    if instance.paid_by_this_save:
+        record_events(WebhookEvent.Type.INVOICE_PAID, [instance])
+
+
+@receiver(post_save, sender=Payment)
+def record_payment_received(sender, instance, created, **kwargs):
+    if created and instance.status == Payment.Status.RECEIVED:
+        record_events(WebhookEvent.Type.PAYMENT_RECEIVED, [instance])
+
+
+@receiver(post_save, sender=WebhookEndpoint)
+@receiver(post_delete, sender=WebhookEndpoint)
+def invalidate_endpoint_cache(sender, using, **kwargs):
+    invalidate_endpoints(using)
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+def touch_fragment_stamps(sender, using, **kwargs):
+    touch(sender, using=using)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_cached_user(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+@receiver(post_delete, sender=Subscription)
+@receiver(post_delete, sender=Invoice)
+@receiver(post_delete, sender=Payment)
+def refresh_billing_counters_after_delete(sender, instance, using, **kwargs):
+    # Sent for queryset deletes too, inside the deletion's transaction, and
+    # for cascaded rows before the subscription they belong to is deleted.
+    instance.billing_clients().using(using).refresh_billing_counters()
@@ -0,0 +1,11 @@
+from django import template
+
+from kill_bill.core.fonts import font_stylesheet_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def font_stylesheet(family):
+    """``{% font_stylesheet "Poppins" %}``: stylesheet URL for a font family."""
+    return font_stylesheet_url(family)
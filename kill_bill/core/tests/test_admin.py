@@ -0,0 +1,109 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from kill_bill.core.models import Client, Invoice, Payment, Subscription, SubscriptionPlan
+
+CHANGELISTS = ("core_invoice", "core_subscription", "core_payment")
+
+
+class AdminChangelistTest(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_superuser("admin", "", "secret")
+        self.client.force_login(user)
+        self.plan = SubscriptionPlan.objects.create(
+            name="Test Plan",
+            price_monthly=10.00,
+            price_annual=100.00
+        )
+        self.add_rows(3)
+
+    def add_rows(self, count):
+        today = timezone.now().date()
+        start = Client.objects.count()
+        for i in range(start, start + count):
+            company = Client.objects.create(
+                company_name=f"Company {i}",
+                contact_person="John Doe",
+                email=f"billing{i}@example.com",
+                phone="1234567890"
+            )
+            subscription = Subscription.objects.create(
+                client=company,
+                plan=self.plan,
+                billing_cycle=Subscription.BillingCycle.MONTHLY,
+                start_date=today - timedelta(days=i),
+            )
+            Invoice.objects.create(
+                subscription=subscription,
+                amount=10,
+                issue_date=today - timedelta(days=i),
+                due_date=today + timedelta(days=14),
+            )
+            Payment.objects.create(
+                subscription=subscription,
+                amount=10,
+                payment_date=today - timedelta(days=i),
+                payment_method=Payment.Method.BANK_TRANSFER,
+            )
+
+    def changelist_queries(self, name, **params):
+        url = reverse(f"admin:{name}_changelist")
+        self.client.get(url, params)  # fill the session and user caches
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return [query["sql"] for query in queries]
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        before = {name: self.changelist_queries(name) for name in CHANGELISTS}
+        self.add_rows(5)
+        for name in CHANGELISTS:
+            with self.subTest(changelist=name):
+                queries = self.changelist_queries(name)
+                self.assertEqual(len(queries), len(before[name]))
+                # Including the session and user reads of database-backed sessions.
+                self.assertLessEqual(len(queries), 7)
+                # The page's count, not a second one for the unfiltered total.
+                self.assertEqual(sum("COUNT(" in sql for sql in queries), 1)
+
+    def test_search_is_a_prefix_match(self):
+        url = reverse("admin:core_invoice_changelist")
+        response = self.client.get(url, {"q": "company 1"})
+        self.assertEqual(response.context["cl"].result_count, 1)
+        response = self.client.get(url, {"q": "pany"})
+        self.assertEqual(response.context["cl"].result_count, 0)
+        invoice = Invoice.objects.first()
+        response = self.client.get(url, {"q": invoice.invoice_number})
+        self.assertEqual(list(response.context["cl"].result_list), [invoice])
+
+        response = self.client.get(
+            reverse("admin:autocomplete"),
+            {"app_label": "core", "model_name": "payment", "field_name": "subscription", "term": "COMPANY 2"},
+        )
+        self.assertEqual(len(response.json()["results"]), 1)
+
+    def test_date_hierarchy(self):
+        today = timezone.now().date()
+        response = self.client.get(
+            reverse("admin:core_payment_changelist"),
+            {"payment_date__year": today.year, "payment_date__month": today.month, "payment_date__day": today.day},
+        )
+        self.assertEqual(response.context["cl"].result_count, 1)
+
+    def test_export_csv(self):
+        ids = Invoice.objects.order_by("pk").values_list("pk", flat=True)
+        response = self.client.post(
+            reverse("admin:core_invoice_changelist"),
+            {"action": "export_csv", "_selected_action": [str(pk) for pk in ids]},
+        )
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "invoice_number,subscription__client__company_name,amount,issue_date,due_date,status")
+        self.assertEqual(len(lines), 4)
+        self.assertIn("Company 0", lines[1])
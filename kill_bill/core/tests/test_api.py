@@ -0,0 +1,209 @@
+import json
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from kill_bill.core.models import ApiToken, Client, Invoice, Subscription, SubscriptionPlan
+
+
+class ApiTest(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.user = get_user_model().objects.create_superuser("staff", "", "secret")
+        self.client.force_login(self.user)
+        self.plan = SubscriptionPlan.objects.create(
+            name="Test Plan",
+            price_monthly=10.00,
+            price_annual=100.00
+        )
+        self.companies = [
+            Client.objects.create(
+                company_name=f"Company {i}",
+                contact_person="John Doe",
+                email=f"john{i}@example.com",
+                phone="1234567890"
+            )
+            for i in range(5)
+        ]
+        self.subscriptions = [
+            Subscription.objects.create(
+                client=company,
+                plan=self.plan,
+                billing_cycle=Subscription.BillingCycle.MONTHLY,
+                start_date=self.today
+            )
+            for company in self.companies
+        ]
+
+    def url(self, resource, **params):
+        url = reverse("api_collection", args=[resource])
+        if params:
+            url += "?" + "&".join(f"{key}={value}" for key, value in params.items())
+        return url
+
+    def send(self, method, resource, data):
+        return getattr(self.client, method)(
+            self.url(resource), json.dumps({"data": data}), content_type="application/json"
+        )
+
+    def test_requires_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url("clients")).status_code, 401)
+
+    def test_cursor_pagination(self):
+        response = self.client.get(self.url("clients", limit=2))
+        body = response.json()
+        self.assertEqual([row["id"] for row in body["data"]], [c.pk for c in self.companies[:2]])
+
+        seen = [row["id"] for row in body["data"]]
+        while body["next_cursor"]:
+            # Rows added behind the cursor do not shift later pages.
+            Client.objects.create(
+                company_name="Late", contact_person="x", email="x@example.com", phone="1"
+            )
+            body = self.client.get(body["next"]).json()
+            seen += [row["id"] for row in body["data"]]
+        self.assertEqual(seen, sorted(Client.objects.values_list("pk", flat=True)))
+        self.assertEqual(self.client.get(self.url("clients", cursor="nope")).status_code, 400)
+
+    def test_sparse_fields_and_include(self):
+        body = self.client.get(
+            self.url("subscriptions", fields="status,client", include="client,plan")
+        ).json()
+        self.assertEqual(
+            body["data"][0],
+            {"id": self.subscriptions[0].pk, "status": "active", "client": self.companies[0].pk},
+        )
+        self.assertEqual(len(body["included"]["client"]), 5)
+        self.assertEqual(body["included"]["plan"][0]["price_monthly"], "10.00")
+        self.assertEqual(self.client.get(self.url("subscriptions", fields="secret")).status_code, 400)
+
+    def test_include_is_one_query_per_relation(self):
+        def count(limit):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(self.url("subscriptions", limit=limit, include="client,plan"))
+            return len(queries)
+
+        count(1)  # load the session and plan cache
+        self.assertEqual(count(1), count(5))
+
+    def test_detail(self):
+        invoice = Invoice.objects.create(
+            subscription=self.subscriptions[0],
+            amount=10,
+            due_date=self.today - timedelta(days=1),
+        )
+        Invoice.objects.filter(pk=invoice.pk).update(status=Invoice.Status.UNPAID)
+        response = self.client.get(
+            reverse("api_detail", args=["invoices", invoice.pk]) + "?include=subscription"
+        )
+        body = response.json()
+        self.assertEqual(body["data"]["status"], "overdue")
+        self.assertEqual(body["included"]["subscription"][0]["id"], self.subscriptions[0].pk)
+        self.assertEqual(
+            self.client.get(reverse("api_detail", args=["invoices", 0])).status_code, 404
+        )
+
+    def test_bulk_create_validates_with_forms(self):
+        response = self.send("post", "invoices", [
+            {"subscription": self.subscriptions[0].pk, "issue_date": str(self.today),
+             "due_date": str(self.today)},
+            {"subscription": self.subscriptions[1].pk, "issue_date": str(self.today),
+             "due_date": str(self.today - timedelta(days=1))},
+            {"subscription": self.subscriptions[2].pk, "amount": "1.00"},
+        ])
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()["errors"]
+        self.assertEqual([error["index"] for error in errors], [1, 2])
+        self.assertIn("due_date", errors[0]["errors"])
+        self.assertIn("amount", errors[1]["errors"])
+        self.assertFalse(Invoice.objects.exists())
+
+        response = self.send("post", "invoices", [
+            {"subscription": subscription.pk, "issue_date": str(self.today),
+             "due_date": str(self.today + timedelta(days=14))}
+            for subscription in self.subscriptions[:2]
+        ])
+        self.assertEqual(response.status_code, 201)
+        data = response.json()["data"]
+        self.assertEqual([row["amount"] for row in data], ["10.00", "10.00"])
+        self.assertEqual(Invoice.objects.count(), 2)
+
+    def test_bulk_update_is_partial_and_atomic(self):
+        first, second = self.companies[:2]
+        response = self.send("patch", "clients", [
+            {"id": first.pk, "status": "inactive"},
+            {"id": second.pk, "email": "not an email"},
+        ])
+        self.assertEqual(response.status_code, 400)
+        first.refresh_from_db()
+        self.assertEqual(first.status, Client.Status.ACTIVE)
+
+        response = self.send("patch", "clients", [
+            {"id": first.pk, "status": "inactive"},
+            {"id": second.pk, "phone": "555"},
+        ])
+        self.assertEqual(response.status_code, 200)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, first.company_name), (Client.Status.INACTIVE, "Company 0"))
+        self.assertEqual(second.phone, "555")
+
+        response = self.send("patch", "clients", [{"id": 0, "phone": "1"}])
+        self.assertEqual(response.json()["errors"][0]["errors"]["id"][0]["code"], "not_found")
+
+
+class ApiTokenTest(TestCase):
+    def setUp(self):
+        self.client = self.client_class(enforce_csrf_checks=True)
+        self.user = get_user_model().objects.create_user("script", password="secret")
+        self.token = ApiToken.objects.create(user=self.user, name="Import script")
+        self.url = reverse("api_collection", args=["clients"])
+        self.body = json.dumps(
+            {
+                "data": [
+                    {
+                        "company_name": "Acme",
+                        "contact_person": "Jo",
+                        "email": "jo@acme.test",
+                        "phone": "1",
+                        "status": "active",
+                    }
+                ]
+            }
+        )
+
+    def post(self, **headers):
+        return self.client.post(self.url, self.body, content_type="application/json", headers=headers)
+
+    def test_token_writes_need_no_csrf_token(self):
+        response = self.post(Authorization=f"Bearer {self.token.key}")
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertTrue(Client.objects.filter(company_name="Acme").exists())
+        response = self.client.get(self.url, headers={"Authorization": f"Bearer {self.token.key}"})
+        self.assertEqual(response.json()["data"][0]["company_name"], "Acme")
+
+    def test_invalid_or_revoked_tokens_are_rejected(self):
+        self.assertEqual(self.post(Authorization="Bearer wrong").status_code, 401)
+        self.assertEqual(self.post(Authorization=f"Basic {self.token.key}").status_code, 401)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.post(Authorization=f"Bearer {self.token.key}").status_code, 401)
+        self.token.delete()
+        self.assertEqual(self.post(Authorization=f"Bearer {self.token.key}").status_code, 401)
+        self.assertFalse(Client.objects.exists())
+
+    def test_session_writes_still_need_the_csrf_token(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(self.post().status_code, 403)
+        self.assertFalse(Client.objects.exists())
+
+        self.client.get(reverse("dashboard"))
+        response = self.post(**{"X-CSRFToken": self.client.cookies["csrftoken"].value})
+        self.assertEqual(response.status_code, 201, response.content)
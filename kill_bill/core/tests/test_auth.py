@@ -0,0 +1,121 @@
+from datetime import timedelta
+from unittest import skipIf
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from kill_bill.core import urls
+from kill_bill.core.models import (
+    BankStatement,
+    Client,
+    Invoice,
+    Subscription,
+    SubscriptionPlan,
+)
+
+# What settings.py picks when CACHE_URL names a shared cache.
+CACHED_SESSIONS = {
+    "SESSION_ENGINE": "django.contrib.sessions.backends.cached_db",
+    "AUTHENTICATION_BACKENDS": ["kill_bill.core.auth.CachedModelBackend"],
+}
+
+
+class SessionQueryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = get_user_model().objects.create_superuser("staff", "", "secret")
+        self.company = Client.objects.create(
+            company_name="Test Company",
+            contact_person="John Doe",
+            email="john@example.com",
+            phone="1234567890"
+        )
+        self.plan = SubscriptionPlan.objects.create(
+            name="Test Plan",
+            price_monthly=10.00,
+            price_annual=100.00
+        )
+        self.subscription = Subscription.objects.create(
+            client=self.company,
+            plan=self.plan,
+            billing_cycle=Subscription.BillingCycle.MONTHLY,
+            start_date=timezone.now().date()
+        )
+        self.invoice = Invoice.objects.create(
+            subscription=self.subscription,
+            amount=10,
+            due_date=timezone.now().date() + timedelta(days=14),
+        )
+        self.statement = BankStatement.objects.create(filename="statement.csv")
+
+    def pages(self) -> list:
+        """A GET of every route in core/urls.py that needs a logged-in user."""
+        pks = {
+            "client": self.company.pk,
+            "subscription": self.subscription.pk,
+            "invoice": self.invoice.pk,
+            "plan": self.plan.pk,
+            "reconciliation": self.statement.pk,
+            "api": self.company.pk,
+        }
+        pages = []
+        for pattern in urls.urlpatterns:
+            if not isinstance(pattern, URLPattern) or pattern.name in ("login", "logout"):
+                continue
+            kwargs = {}
+            if "resource" in pattern.pattern.converters:
+                kwargs["resource"] = "clients"
+            if "pk" in pattern.pattern.converters:
+                kwargs["pk"] = pks[pattern.name.split("_")[0]]
+            pages.append(reverse(pattern.name, kwargs=kwargs))
+        return pages
+
+    def count_queries(self, path) -> int:
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path)
+        self.assertLess(response.status_code, 500, path)
+        self.assertFalse(response.get("Location", "").startswith(reverse("login")), path)
+        return len(queries)
+
+    def measure(self) -> dict:
+        # A new handler, as SessionMiddleware picks its engine when loaded.
+        self.client = self.client_class()
+        self.client.force_login(self.user)
+        counts = {}
+        for path in self.pages():
+            self.count_queries(path)  # fill the caches
+            counts[path] = self.count_queries(path)
+        return counts
+
+    def test_page_views_skip_session_and_user_queries(self):
+        before = self.measure()
+        with override_settings(**CACHED_SESSIONS):
+            after = self.measure()
+
+        self.assertGreater(len(after), 20)
+        for path, queries in after.items():
+            # One SELECT for the session, one for the user.
+            self.assertLessEqual(queries, before[path] - 2, path)
+
+    @skipIf(settings.CACHE_URL, "a shared cache is configured")
+    def test_database_sessions_without_a_shared_cache(self):
+        self.assertEqual(settings.SESSION_ENGINE, "django.contrib.sessions.backends.db")
+        self.assertEqual(
+            settings.AUTHENTICATION_BACKENDS, ["django.contrib.auth.backends.ModelBackend"]
+        )
+
+    @override_settings(**CACHED_SESSIONS)
+    def test_saving_a_user_refreshes_the_cache(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse("dashboard"))
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(reverse("dashboard"))
+        self.assertEqual(response.status_code, 302)
@@ -0,0 +1,144 @@
+from datetime import timedelta
+from inspect import iscoroutinefunction
+
+from asgiref.sync import async_to_sync
+from django.contrib import messages
+from django.contrib.auth import get_user_model
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.cache import SessionStore
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from kill_bill.core import views
+from kill_bill.core.models import (
+    Client,
+    Invoice,
+    InvoiceConfiguration,
+    Payment,
+    Subscription,
+    SubscriptionPlan,
+)
+
+
+class ConditionalPageTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.user = get_user_model().objects.create_user("staff", password="secret")
+        self.company = Client.objects.create(
+            company_name="Test Company",
+            contact_person="John Doe",
+            email="john@example.com",
+            phone="1234567890"
+        )
+        self.plan = SubscriptionPlan.objects.create(
+            name="Test Plan",
+            price_monthly=10.00,
+            price_annual=100.00
+        )
+        self.subscription = Subscription.objects.create(
+            client=self.company,
+            plan=self.plan,
+            billing_cycle=Subscription.BillingCycle.MONTHLY,
+            start_date=timezone.now().date()
+        )
+        self.invoice = Invoice.objects.create(
+            subscription=self.subscription,
+            amount=10,
+            due_date=timezone.now().date() + timedelta(days=14),
+        )
+        InvoiceConfiguration.get_config()
+
+    def pages(self):
+        return [
+            (views.invoice_detail, self.invoice.pk),
+            (views.invoice_print, self.invoice.pk),
+            (views.subscription_detail, self.subscription.pk),
+            (views.client_detail, self.company.pk),
+        ]
+
+    def request(self, **headers):
+        request = self.factory.get("/", headers=headers)
+        request.user = self.user
+        request.auser = self.auser
+        request.session = SessionStore()
+        request._messages = FallbackStorage(request)
+        return request
+
+    async def auser(self):
+        return self.user
+
+    def get(self, view, pk, **headers):
+        if iscoroutinefunction(view):
+            view = async_to_sync(view)
+        return view(self.request(**headers), pk=pk)
+
+    def test_repeat_visit_is_304_with_one_query(self):
+        for view, pk in self.pages():
+            with self.subTest(view=view.__name__):
+                response = self.get(view, pk)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn("no-cache", response["Cache-Control"])
+                etag = response["ETag"]
+
+                with self.assertNumQueries(1):
+                    response = self.get(view, pk, if_none_match=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response["ETag"], etag)
+
+                response = self.get(
+                    view, pk, if_modified_since=response["Last-Modified"]
+                )
+                self.assertEqual(response.status_code, 304)
+
+    def test_changes_invalidate_etag(self):
+        before = {view: self.get(view, pk)["ETag"] for view, pk in self.pages()}
+
+        Payment.objects.create(
+            subscription=self.subscription,
+            amount=10,
+            payment_date=timezone.now().date(),
+            payment_method=Payment.Method.CHEQUE,
+        )
+        self.assertEqual(
+            self.get(views.invoice_detail, self.invoice.pk)["ETag"], before[views.invoice_detail]
+        )
+        self.assertNotEqual(
+            self.get(views.subscription_detail, self.subscription.pk)["ETag"],
+            before[views.subscription_detail],
+        )
+        self.assertNotEqual(
+            self.get(views.client_detail, self.company.pk)["ETag"],
+            before[views.client_detail],
+        )
+
+        config = InvoiceConfiguration.get_config()
+        config.company_name = "Renamed"
+        config.save()
+        self.assertNotEqual(
+            self.get(views.invoice_print, self.invoice.pk)["ETag"], before[views.invoice_print]
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.plan.name = "Renamed Plan"
+            self.plan.save()
+        self.assertNotEqual(
+            self.get(views.invoice_detail, self.invoice.pk)["ETag"], before[views.invoice_detail]
+        )
+
+    def test_pending_messages_render_the_page(self):
+        response = self.get(views.invoice_detail, self.invoice.pk)
+        etag = response["ETag"]
+
+        request = self.request(if_none_match=etag)
+        messages.info(request, "Invoice already marked as paid")
+        response = views.invoice_detail(request, pk=self.invoice.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Invoice already marked as paid")
+
+    def test_missing_object_still_404(self):
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse("invoice_detail", args=[0]), headers={"if_none_match": "*"}
+        )
+        self.assertEqual(response.status_code, 404)
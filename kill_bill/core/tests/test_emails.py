@@ -1,8 +1,20 @@
-from django.test import TestCase
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
 from django.core import mail
+from django.template.loader import get_template
+from django.urls import reverse
 from django.utils import timezone
 from django.core.management import call_command
-from kill_bill.core.models import Client, Invoice, Subscription, SubscriptionPlan
+from kill_bill.core.email_templates import prepare_email_html
+from kill_bill.core.models import Client, EmailLog, Invoice, Subscription, SubscriptionPlan
+from kill_bill.core.utils import (
+    INVOICE_SUBJECT,
+    SUBSCRIPTION_CREATED_SUBJECT,
+    backfill_email_links,
+    send_invoice_email,
+)
 from datetime import timedelta
 
 class SubscriptionEmailTest(TestCase):
@@ -107,3 +119,226 @@ class SubscriptionEmailTest(TestCase):
         log = EmailLog.objects.first()
         self.assertEqual(log.recipient, "john@example.com")
         self.assertEqual(log.subject, "Subscription Expired")
+
+    def test_send_subscription_emails_concurrently(self):
+        # Several subscriptions expiring soon plus one expired yesterday
+        from io import StringIO
+        from kill_bill.core.models import EmailLog
+
+        today = timezone.now().date()
+        subs = []
+        for i in range(5):
+            client = Client.objects.create(
+                company_name=f"Company {i}",
+                contact_person="Jane Doe",
+                email=f"billing{i}@example.com",
+                phone="1234567890"
+            )
+            sub = Subscription.objects.create(
+                client=client,
+                plan=self.plan,
+                billing_cycle=Subscription.BillingCycle.MONTHLY,
+                start_date=today - timedelta(days=20 + i)
+            )
+            Subscription.objects.filter(pk=sub.pk).update(end_date=today + timedelta(days=i + 1))
+            subs.append(sub)
+        Subscription.objects.filter(pk=subs[0].pk).update(end_date=today - timedelta(days=1))
+
+        mail.outbox = []
+        EmailLog.objects.all().delete()
+
+        out = StringIO()
+        call_command('send_subscription_emails', concurrency=4, stdout=out)
+
+        self.assertEqual(Invoice.objects.count(), 4)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(EmailLog.objects.count(), 5)
+        self.assertEqual(
+            EmailLog.objects.filter(subject="Subscription Expired").get().recipient,
+            "billing0@example.com",
+        )
+
+        # Output follows subscription order regardless of completion order
+        output = out.getvalue()
+        self.assertIn("Summary: 4 invoices created, 0 already existed, 4 emails sent", output)
+        positions = [output.index(f"Company {i}") for i in range(1, 5)]
+        self.assertEqual(positions, sorted(positions))
+        self.assertIn("Sent email to billing0@example.com", output)
+
+    def test_send_subscription_emails_is_full_unless_incremental(self):
+        from io import StringIO
+
+        call_command('send_subscription_emails', stdout=StringIO())
+
+        out = StringIO()
+        call_command('send_subscription_emails', stdout=out)
+        self.assertIn("(in total)", out.getvalue())
+
+        out = StringIO()
+        call_command('send_subscription_emails', incremental=True, stdout=out)
+        self.assertIn("(new or changed since the last run)", out.getvalue())
+
+    def test_send_subscription_emails_jsonl(self):
+        import json
+        from io import StringIO
+
+        today = timezone.now().date()
+        sub = Subscription.objects.create(
+            client=self.client,
+            plan=self.plan,
+            billing_cycle=Subscription.BillingCycle.MONTHLY,
+            start_date=today
+        )
+        Subscription.objects.filter(pk=sub.pk).update(end_date=today + timedelta(days=3))
+
+        out = StringIO()
+        call_command('send_subscription_emails', output="jsonl", stdout=out)
+
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        invoice = Invoice.objects.get()
+        self.assertEqual(lines, [
+            {
+                "subscription": sub.pk,
+                "client": "Test Company",
+                "invoice": invoice.invoice_number,
+                "action": "created",
+                "email_due": True,
+                "email_sent": True,
+            },
+            {
+                "summary": {
+                    "subscriptions_found": 1,
+                    "invoices_created": 1,
+                    "invoices_existing": 0,
+                    "emails_sent": 1,
+                    "emails_failed": 0,
+                }
+            },
+        ])
+
+
+class EmailLogLinkTest(TestCase):
+    def setUp(self):
+        self.company = Client.objects.create(
+            company_name="Test Company",
+            contact_person="John Doe",
+            email="john@example.com",
+            phone="1234567890"
+        )
+        self.plan = SubscriptionPlan.objects.create(
+            name="Test Plan",
+            price_monthly=10.00,
+            price_annual=100.00
+        )
+        today = timezone.now().date()
+        self.subscription = Subscription.objects.create(
+            client=self.company,
+            plan=self.plan,
+            billing_cycle=Subscription.BillingCycle.MONTHLY,
+            start_date=today - timedelta(days=20),
+        )
+
+    def test_sent_emails_are_linked(self):
+        created = EmailLog.objects.get()
+        self.assertEqual(created.message_type, EmailLog.MessageType.SUBSCRIPTION_CREATED)
+        self.assertEqual(created.client, self.company)
+        self.assertEqual(created.subscription, self.subscription)
+        self.assertIsNone(created.invoice)
+
+        today = timezone.now().date()
+        expired = Subscription.objects.create(
+            client=self.company,
+            plan=self.plan,
+            billing_cycle=Subscription.BillingCycle.MONTHLY,
+            start_date=today - timedelta(days=40),
+        )
+        Subscription.objects.filter(pk=expired.pk).update(end_date=today - timedelta(days=1))
+        Subscription.objects.filter(pk=self.subscription.pk).update(end_date=today + timedelta(days=3))
+        call_command("send_subscription_emails", concurrency=2, stdout=StringIO())
+
+        invoice = Invoice.objects.get()
+        reminder = invoice.email_logs.get()
+        self.assertEqual(reminder.message_type, EmailLog.MessageType.INVOICE_REMINDER)
+        self.assertEqual(reminder.subscription, self.subscription)
+        self.assertEqual(reminder.client, self.company)
+        notice = EmailLog.objects.get(message_type=EmailLog.MessageType.SUBSCRIPTION_EXPIRED)
+        self.assertEqual(notice.subscription, expired)
+
+    def test_backfill_parses_subjects_in_batches(self):
+        invoice = Invoice.objects.create(
+            subscription=self.subscription,
+            amount=10,
+            due_date=timezone.now().date() + timedelta(days=14),
+        )
+        EmailLog.objects.all().delete()
+        EmailLog.objects.bulk_create([
+            EmailLog(recipient="john@example.com", subject=SUBSCRIPTION_CREATED_SUBJECT),
+            EmailLog(
+                recipient="john@example.com",
+                subject=INVOICE_SUBJECT.format(number=invoice.invoice_number),
+            ),
+            EmailLog(recipient="nobody@example.com", subject=SUBSCRIPTION_CREATED_SUBJECT),
+            EmailLog(recipient="john@example.com", subject="Hello"),
+            EmailLog(recipient="john@example.com", subject=INVOICE_SUBJECT.format(number="NOPE")),
+        ])
+
+        out = StringIO()
+        call_command("backfill_email_links", batch_size=2, stdout=out)
+        self.assertIn("Linked 2 email log rows", out.getvalue())
+        self.assertEqual(
+            self.company.email_logs.get(message_type=EmailLog.MessageType.SUBSCRIPTION_CREATED).subscription,
+            self.subscription,
+        )
+        self.assertEqual(invoice.email_logs.get().client, self.company)
+        self.assertEqual(EmailLog.objects.filter(client__isnull=True).count(), 3)
+        self.assertEqual(backfill_email_links(), 0)
+
+    def test_detail_pages_list_linked_emails(self):
+        invoice = Invoice.objects.create(
+            subscription=self.subscription,
+            amount=10,
+            due_date=timezone.now().date() + timedelta(days=14),
+        )
+        user = get_user_model().objects.create_user("staff", password="secret")
+        self.client.force_login(user)
+        # The panel is a page partial; the email loader must leave it alone.
+        with self.assertNoLogs("kill_bill.core.email_templates"):
+            response = self.client.get(reverse("client_detail", args=[self.company.pk]))
+        self.assertContains(response, "Subscription created")
+        etag = response["ETag"]
+
+        send_invoice_email(self.subscription, invoice)
+        response = self.client.get(reverse("invoice_detail", args=[invoice.pk]))
+        self.assertContains(response, "Invoice reminder")
+        self.assertNotContains(response, "Subscription created")
+        response = self.client.get(
+            reverse("client_detail", args=[self.company.pk]), HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class InlinedEmailTemplateTest(SimpleTestCase):
+    def test_email_templates_are_inlined_and_minified(self):
+        names = ["invoice_reminder", "subscription_created", "subscription_expired", "subscription_expiring"]
+        for name in names:
+            with self.subTest(name=name):
+                template = get_template(f"emails/{name}.html")
+                with open(template.origin.name) as f:
+                    raw = f.read()
+                compiled = template.template.source
+                self.assertNotIn("<style", compiled)
+                self.assertIn('style="', compiled)
+                self.assertNotIn("\n", compiled)
+                self.assertLess(len(compiled), len(raw))
+
+    def test_site_pages_are_untouched(self):
+        self.assertIn("{% extends", get_template("emails/list.html").template.source)
+
+    def test_tags_moved_by_parser_are_rejected(self):
+        source = (
+            "<html><head><style>td { color: red; }</style></head><body><table>"
+            "{% for row in rows %}<tr><td>{{ row }}</td></tr>{% endfor %}"
+            "</table></body></html>"
+        )
+        with self.assertRaises(ValueError):
+            prepare_email_html(source)
@@ -0,0 +1,120 @@
+import json
+import re
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+
+from kill_bill.core.fonts import _is_bundled, font_stylesheet_path, font_stylesheet_url
+from kill_bill.core.models import InvoiceConfiguration
+
+GOOGLE_CSS = """
+/* latin-ext */
+@font-face {
+  font-family: 'Poppins';
+  font-style: normal;
+  font-weight: 300;
+  font-display: swap;
+  src: url(https://fonts.gstatic.com/s/poppins/v11/ext.woff2) format('woff2');
+  unicode-range: U+0100-02BA;
+}
+/* latin */
+@font-face {
+  font-family: 'Poppins';
+  font-style: normal;
+  font-weight: 300;
+  font-display: swap;
+  src: url(https://fonts.gstatic.com/s/poppins/v11/latin.woff2) format('woff2');
+  unicode-range: U+0000-00FF;
+}
+/* latin */
+@font-face {
+  font-family: 'Poppins';
+  font-style: normal;
+  font-weight: 700;
+  font-display: swap;
+  src: url(https://fonts.gstatic.com/s/poppins/v11/latin.woff2) format('woff2');
+  unicode-range: U+0000-00FF;
+}
+"""
+
+
+def fake_fetch(url):
+    if "fonts.googleapis.com" in url:
+        return GOOGLE_CSS.encode()
+    return b"wOF2" + url.encode()
+
+
+@mock.patch("kill_bill.core.management.commands.bundle_fonts.fetch", side_effect=fake_fetch)
+class FontBundleTest(SimpleTestCase):
+    def setUp(self):
+        self.static_dir = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        _is_bundled.cache_clear()
+        self.addCleanup(_is_bundled.cache_clear)
+
+    def bundle(self):
+        call_command(
+            "bundle_fonts", family=["Poppins"], output=str(self.static_dir / "fonts"), stdout=StringIO()
+        )
+
+    def test_keeps_latin_subset_and_downloads_each_file_once(self, fetch):
+        self.bundle()
+        font_dir = self.static_dir / "fonts" / "poppins"
+        self.assertEqual(
+            [path.name for path in font_dir.iterdir()], ["poppins-latin-300-700.woff2"]
+        )
+        css = (self.static_dir / "fonts" / "poppins.css").read_text()
+        self.assertNotIn("gstatic", css)
+        self.assertNotIn("U+0100", css)
+        self.assertEqual(css.count("url(poppins/poppins-latin-300-700.woff2)"), 2)
+        self.assertEqual(fetch.call_count, 2)
+
+    def test_invoice_font_url_prefers_bundled_copy(self, fetch):
+        config = InvoiceConfiguration(font_family="Poppins")
+        with override_settings(STATICFILES_DIRS=[self.static_dir]):
+            self.assertTrue(config.get_font_url().startswith("https://fonts.googleapis.com/"))
+
+            self.bundle()
+            _is_bundled.cache_clear()
+            self.assertEqual(config.get_font_url(), "/static/fonts/poppins.css")
+            self.assertTrue(font_stylesheet_url("Inter").startswith("https://"))
+
+    def test_collectstatic_hashes_and_compresses(self, fetch):
+        self.bundle()
+        static_root = self.static_dir / "collected"
+        storages = {
+            **settings.STORAGES,
+            "staticfiles": {"BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage"},
+        }
+        with override_settings(
+            STATICFILES_DIRS=[self.static_dir], STATIC_ROOT=static_root, STORAGES=storages
+        ):
+            call_command("collectstatic", interactive=False, verbosity=0)
+
+        manifest = json.loads((static_root / "staticfiles.json").read_text())["paths"]
+        hashed_css = manifest["fonts/poppins.css"]
+        self.assertNotEqual(hashed_css, "fonts/poppins.css")
+        for suffix in ("", ".gz", ".br"):
+            self.assertTrue((static_root / f"{hashed_css}{suffix}").exists(), suffix)
+        # References inside the stylesheet point at the hashed font file.
+        hashed_font = manifest["fonts/poppins/poppins-latin-300-700.woff2"]
+        self.assertIn(
+            Path(hashed_font).name, (static_root / hashed_css).read_text()
+        )
+
+
+class BundledFontsTest(SimpleTestCase):
+    def test_every_invoice_font_is_bundled(self):
+        for family in InvoiceConfiguration.FontFamily.values:
+            with self.subTest(family):
+                stylesheet = finders.find(font_stylesheet_path(family))
+                self.assertIsNotNone(stylesheet, f"{family} is not bundled; run manage.py bundle_fonts")
+                urls = re.findall(r"url\(([^)]+)\)", Path(stylesheet).read_text())
+                self.assertTrue(urls)
+                for url in urls:
+                    self.assertIsNotNone(finders.find(f"fonts/{url}"), url)
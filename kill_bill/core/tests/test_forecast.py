@@ -0,0 +1,103 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from kill_bill.core.forecast import add_months, forecast_billing, next_end_date
+from kill_bill.core.models import Client, Invoice, Subscription, SubscriptionPlan
+from kill_bill.core.utils import create_invoice_for_subscription
+
+
+class ForecastTest(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.plan = SubscriptionPlan.objects.create(
+            name="Test Plan",
+            price_monthly=10.00,
+            price_annual=100.00
+        )
+        self.company = Client.objects.create(
+            company_name="Test Company",
+            contact_person="John Doe",
+            email="john@example.com",
+            phone="1234567890"
+        )
+
+    def make_subscription(self, days_left, cycle=Subscription.BillingCycle.MONTHLY):
+        subscription = Subscription.objects.create(
+            client=self.company,
+            plan=self.plan,
+            billing_cycle=cycle,
+            start_date=self.today
+        )
+        Subscription.objects.filter(pk=subscription.pk).update(
+            end_date=self.today + timedelta(days=days_left)
+        )
+        subscription.refresh_from_db()
+        return subscription
+
+    def test_next_end_date_matches_subscription(self):
+        for end_date in (date(2025, 1, 30), date(2024, 2, 28), date(2025, 12, 31)):
+            for cycle in Subscription.BillingCycle.values:
+                renewal = Subscription(start_date=end_date + timedelta(days=1), billing_cycle=cycle)
+                self.assertEqual(next_end_date(end_date, cycle), renewal._calculate_end_date())
+        self.assertEqual(add_months(date(2025, 1, 31), 1), date(2025, 2, 28))
+
+    def test_daily_forecast(self):
+        self.make_subscription(10)
+        self.make_subscription(10)
+        self.make_subscription(3, Subscription.BillingCycle.ANNUAL)
+
+        forecast = forecast_billing(self.today + timedelta(days=7), days_before_expiry=7)
+        self.assertEqual(forecast["periods"], [
+            {"date": self.today, "invoices": 1, "amount": Decimal("100.00")},
+            {"date": self.today + timedelta(days=3), "invoices": 2, "amount": Decimal("20.00")},
+        ])
+        self.assertEqual(forecast["invoices"], 3)
+        self.assertEqual(forecast["amount"], Decimal("120.00"))
+
+    def test_renewals_and_existing_invoices(self):
+        subscription = self.make_subscription(3)
+        create_invoice_for_subscription(subscription)
+        first_renewal = next_end_date(subscription.end_date, subscription.billing_cycle)
+        second_renewal = next_end_date(first_renewal, subscription.billing_cycle)
+
+        forecast = forecast_billing(
+            second_renewal - timedelta(days=6), days_before_expiry=7
+        )
+        # The current period is invoiced already; the renewals are not.
+        self.assertEqual(
+            [row["date"] for row in forecast["periods"]],
+            [first_renewal - timedelta(days=7), second_renewal - timedelta(days=7)],
+        )
+
+    def test_simulated_settings_and_prices(self):
+        self.make_subscription(10)
+        until = self.today + timedelta(days=5)
+        self.assertEqual(forecast_billing(until, days_before_expiry=3)["invoices"], 0)
+
+        forecast = forecast_billing(
+            until,
+            days_before_expiry=14,
+            prices={self.plan.pk: {Subscription.BillingCycle.MONTHLY: Decimal("12.50")}},
+        )
+        self.assertEqual(forecast["periods"][0]["date"], self.today)
+        self.assertEqual(forecast["amount"], Decimal("12.50"))
+
+    def test_command_writes_nothing(self):
+        self.make_subscription(3)
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command(
+                "forecast_billing", months=2, price=[f"{self.plan.pk}:monthly=11"], stdout=out
+            )
+        self.assertFalse(
+            [query for query in queries if not query["sql"].lstrip().upper().startswith("SELECT")]
+        )
+        self.assertIn("11.00", out.getvalue())
+        self.assertFalse(Invoice.objects.exists())
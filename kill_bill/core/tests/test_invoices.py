@@ -0,0 +1,442 @@
+import hashlib
+import json
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.db import IntegrityError, transaction
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from kill_bill.core.forms import InvoiceForm
+from kill_bill.core.models import (
+    Client,
+    EmailLog,
+    IdempotencyKey,
+    Invoice,
+    Payment,
+    SiteConfiguration,
+    Subscription,
+    SubscriptionPlan,
+)
+from kill_bill.core.utils import (
+    create_invoice_for_subscription,
+    id_ranges,
+    iter_expiring_subscriptions,
+    mark_invoices_paid,
+    process_expiring_subscriptions,
+)
+
+
+class InvoiceBulkActionTest(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.user = get_user_model().objects.create_superuser("staff", "", "secret")
+        self.client.force_login(self.user)
+        self.company = Client.objects.create(
+            company_name="Test Company",
+            contact_person="John Doe",
+            email="john@example.com",
+            phone="1234567890"
+        )
+        self.plan = SubscriptionPlan.objects.create(
+            name="Test Plan",
+            price_monthly=10.00,
+            price_annual=100.00
+        )
+        self.subscription = Subscription.objects.create(
+            client=self.company,
+            plan=self.plan,
+            billing_cycle=Subscription.BillingCycle.MONTHLY,
+            start_date=self.today
+        )
+        self.invoices = [
+            Invoice.objects.create(
+                subscription=self.subscription,
+                amount=10,
+                issue_date=self.today - timedelta(days=30),
+                due_date=self.today + timedelta(days=days),
+            )
+            for days in (-3, 5, 10)
+        ]
+        self.ids = [invoice.pk for invoice in self.invoices]
+        mail.outbox = []
+        EmailLog.objects.all().delete()
+
+    def post_json(self, payload, **headers):
+        return self.client.post(
+            reverse("invoice_bulk_api"),
+            json.dumps(payload),
+            content_type="application/json",
+            headers=headers,
+        )
+
+    def test_mark_paid_is_set_based_and_idempotent(self):
+        # select, update, payment insert, counter refresh, plus savepoint pair
+        with self.assertNumQueries(6):
+            self.assertEqual(mark_invoices_paid(self.ids), self.ids)
+        self.assertEqual(mark_invoices_paid(self.ids), [])
+
+        self.assertEqual(
+            Invoice.objects.filter(status=Invoice.Status.PAID).count(), len(self.ids)
+        )
+        self.assertEqual(Payment.objects.count(), len(self.ids))
+        self.company.refresh_from_db()
+        self.assertEqual(self.company.outstanding_balance, Decimal("0"))
+        self.assertEqual(self.company.lifetime_paid, Decimal("30"))
+
+    def test_invoice_list_bulk_form(self):
+        response = self.client.post(reverse("invoice_bulk_action"), {
+            "action": "mark_overdue",
+            "invoices": [str(pk) for pk in self.ids],
+            "status_filter": "unpaid",
+        })
+        self.assertRedirects(
+            response, reverse("invoice_list") + "?status=unpaid", fetch_redirect_response=False
+        )
+        statuses = dict(Invoice.objects.values_list("pk", "status"))
+        self.assertEqual(statuses[self.ids[0]], Invoice.Status.OVERDUE)
+        self.assertEqual(statuses[self.ids[1]], Invoice.Status.UNPAID)
+
+    def test_bulk_form_redirect_escapes_the_filter(self):
+        response = self.client.post(reverse("invoice_bulk_action"), {
+            "action": "mark_overdue",
+            "invoices": [str(self.ids[0])],
+            "status_filter": "unpaid&x=1",
+        })
+        self.assertRedirects(
+            response,
+            reverse("invoice_list") + "?status=unpaid%26x%3D1",
+            fetch_redirect_response=False,
+        )
+
+    def test_json_endpoint(self):
+        Invoice.objects.filter(pk=self.ids[2]).update(status=Invoice.Status.PAID)
+
+        response = self.post_json({"action": "mark_paid", "invoices": self.ids})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            "action": "mark_paid",
+            "updated": self.ids[:2],
+            "skipped": self.ids[2:],
+        })
+
+        response = self.post_json({"action": "mark_paid", "invoices": self.ids})
+        self.assertEqual(response.json()["updated"], [])
+        self.assertEqual(Payment.objects.count(), 2)
+
+        self.assertEqual(self.post_json({"action": "delete", "invoices": []}).status_code, 400)
+        self.assertEqual(self.post_json({"invoices": self.ids}).status_code, 400)
+        # A string is iterable, but "12" is not a list of invoice ids.
+        response = self.post_json({"action": "mark_paid", "invoices": str(self.ids[0])})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Payment.objects.count(), 2)
+
+    def test_resend_with_idempotency_key(self):
+        Invoice.objects.filter(pk=self.ids[2]).update(status=Invoice.Status.PAID)
+        payload = {"action": "resend", "invoices": self.ids}
+
+        first = self.post_json(payload, **{"Idempotency-Key": "abc"})
+        self.assertEqual(first.json()["updated"], self.ids[:2])
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(EmailLog.objects.count(), 2)
+        self.assertEqual(
+            Invoice.objects.filter(last_reminder_sent_at__isnull=False).count(), 2
+        )
+
+        retry = self.post_json(payload, **{"Idempotency-Key": "abc"})
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_idempotency_key_reused_for_another_request(self):
+        payload = {"action": "mark_paid", "invoices": self.ids[:1]}
+        first = self.post_json(payload, **{"Idempotency-Key": "abc"})
+        self.assertEqual(first.json()["updated"], self.ids[:1])
+
+        # The same request with its keys in another order is a retry.
+        retry = self.post_json(
+            {"invoices": self.ids[:1], "action": "mark_paid"}, **{"Idempotency-Key": "abc"}
+        )
+        self.assertEqual(retry.json(), first.json())
+
+        other = self.post_json(
+            {"action": "mark_paid", "invoices": self.ids}, **{"Idempotency-Key": "abc"}
+        )
+        self.assertEqual(other.status_code, 422)
+        self.assertEqual(Invoice.objects.filter(status=Invoice.Status.PAID).count(), 1)
+
+    def test_idempotency_key_claimed_by_a_running_request(self):
+        payload = {"action": "mark_paid", "invoices": self.ids}
+        IdempotencyKey.objects.create(
+            user=self.user,
+            key="abc",
+            body_hash=hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest(),
+        )
+
+        response = self.post_json(payload, **{"Idempotency-Key": "abc"})
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Invoice.objects.filter(status=Invoice.Status.PAID).exists())
+
+    def test_expired_idempotency_key_runs_again(self):
+        payload = {"action": "mark_paid", "invoices": self.ids[:1]}
+        self.post_json(payload, **{"Idempotency-Key": "abc"})
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        Invoice.objects.update(status=Invoice.Status.UNPAID)
+
+        response = self.post_json(payload, **{"Idempotency-Key": "abc"})
+        self.assertEqual(response.json()["updated"], self.ids[:1])
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    def test_admin_action(self):
+        response = self.client.post(
+            reverse("admin:core_invoice_changelist"),
+            {"action": "mark_paid", "_selected_action": [str(pk) for pk in self.ids]},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            Invoice.objects.filter(status=Invoice.Status.PAID).count(), len(self.ids)
+        )
+
+
+class InvoiceCreationTest(TestCase):
+    def setUp(self):
+        self.company = Client.objects.create(
+            company_name="Test Company",
+            contact_person="John Doe",
+            email="john@example.com",
+            phone="1234567890"
+        )
+        self.plan = SubscriptionPlan.objects.create(
+            name="Test Plan",
+            price_monthly=10.00,
+            price_annual=100.00
+        )
+        self.subscription = Subscription.objects.create(
+            client=self.company,
+            plan=self.plan,
+            billing_cycle=Subscription.BillingCycle.MONTHLY,
+            start_date=timezone.now().date()
+        )
+
+    def test_one_invoice_per_period(self):
+        invoice, created = create_invoice_for_subscription(self.subscription)
+        self.assertTrue(created)
+        self.assertEqual(invoice.due_date, self.subscription.end_date)
+        self.assertEqual(invoice.amount, Decimal("10.00"))
+        self.company.refresh_from_db()
+        self.assertEqual(self.company.outstanding_balance, Decimal("10.00"))
+
+        again, created = create_invoice_for_subscription(self.subscription)
+        self.assertFalse(created)
+        self.assertEqual(again.pk, invoice.pk)
+        self.assertEqual(Invoice.objects.count(), 1)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Invoice.objects.create(
+                subscription=self.subscription, amount=10, due_date=self.subscription.end_date
+            )
+
+    def test_taken_invoice_number_is_retried(self):
+        Invoice.objects.create(
+            subscription=self.subscription,
+            amount=10,
+            due_date=self.subscription.end_date - timedelta(days=30),
+            invoice_number="INV-0001",
+        )
+        with mock.patch.object(
+            Invoice, "generate_invoice_number", side_effect=["INV-0001", "INV-0002"]
+        ):
+            invoice, created = create_invoice_for_subscription(self.subscription)
+        self.assertTrue(created)
+        self.assertEqual(invoice.invoice_number, "INV-0002")
+
+    def test_form_reports_duplicate_period(self):
+        create_invoice_for_subscription(self.subscription)
+        form = InvoiceForm(
+            data={
+                "subscription": self.subscription.pk,
+                "issue_date": timezone.now().date(),
+                "due_date": self.subscription.end_date,
+            }
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn("already has an invoice", str(form.errors))
+
+
+class IncrementalExpiryTest(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.plan = SubscriptionPlan.objects.create(
+            name="Test Plan",
+            price_monthly=10.00,
+            price_annual=100.00
+        )
+
+    def make_subscription(self, name, days_left):
+        company = Client.objects.create(
+            company_name=name,
+            contact_person="John Doe",
+            email="john@example.com",
+            phone="1234567890"
+        )
+        subscription = Subscription.objects.create(
+            client=company,
+            plan=self.plan,
+            billing_cycle=Subscription.BillingCycle.MONTHLY,
+            start_date=self.today
+        )
+        # update() leaves updated_at alone, like a subscription saved long ago.
+        Subscription.objects.filter(pk=subscription.pk).update(
+            end_date=self.today + timedelta(days=days_left)
+        )
+        return subscription
+
+    def test_only_new_work_is_scanned(self):
+        self.make_subscription("Acme", 3)
+        self.make_subscription("Later", 9)
+        first = process_expiring_subscriptions(7, incremental=True)
+        self.assertFalse(first["incremental"])
+        self.assertEqual(first["invoices_created"], 1)
+
+        config = SiteConfiguration.get_config()
+        self.assertEqual(config.expiry_scanned_through, self.today + timedelta(days=7))
+
+        second = process_expiring_subscriptions(7, incremental=True)
+        self.assertTrue(second["incremental"])
+        self.assertEqual(second["subscriptions_found"], 0)
+
+        # A longer window takes in subscriptions beyond the watermark.
+        wider = process_expiring_subscriptions(10, incremental=True)
+        self.assertEqual(
+            [detail["client"] for detail in wider["details"]], ["Later"]
+        )
+
+    def test_changed_subscription_is_rescanned(self):
+        process_expiring_subscriptions(7, incremental=True)
+        subscription = self.make_subscription("Acme", 3)
+        Subscription.objects.filter(pk=subscription.pk).update(updated_at=timezone.now())
+
+        results = process_expiring_subscriptions(7, incremental=True)
+        self.assertEqual(results["invoices_created"], 1)
+
+    def test_full_run_rescans_window(self):
+        self.make_subscription("Acme", 3)
+        process_expiring_subscriptions(7, incremental=True)
+        results = process_expiring_subscriptions(7)
+        self.assertEqual(results["subscriptions_found"], 1)
+        self.assertEqual(results["invoices_existing"], 1)
+
+
+class InlineExecutor:
+    """Runs partitions in this process, inside the test transaction."""
+
+    def __init__(self, **kwargs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def map(self, fn, iterable):
+        return [fn(item) for item in iterable]
+
+
+@mock.patch("kill_bill.core.utils.ProcessPoolExecutor", InlineExecutor)
+class PartitionedExpiryTest(TestCase):
+    def setUp(self):
+        today = timezone.now().date()
+        plan = SubscriptionPlan.objects.create(
+            name="Test Plan",
+            price_monthly=10.00,
+            price_annual=100.00
+        )
+        for i in range(5):
+            company = Client.objects.create(
+                company_name=f"Company {i}",
+                contact_person="John Doe",
+                email=f"john{i}@example.com",
+                phone="1234567890"
+            )
+            subscription = Subscription.objects.create(
+                client=company,
+                plan=plan,
+                billing_cycle=Subscription.BillingCycle.MONTHLY,
+                start_date=today
+            )
+            Subscription.objects.filter(pk=subscription.pk).update(
+                end_date=today + timedelta(days=3)
+            )
+        mail.outbox = []
+
+    def test_id_ranges(self):
+        self.assertEqual(id_ranges([1, 2, 5, 8, 9], 2), [(1, 5), (8, 9)])
+        self.assertEqual(id_ranges([4], 3), [(4, 4)])
+        self.assertEqual(id_ranges([], 3), [])
+
+    def test_partitions_are_merged(self):
+        results = process_expiring_subscriptions(7, workers=2)
+        self.assertEqual(results["subscriptions_found"], 5)
+        self.assertEqual(results["invoices_created"], 5)
+        self.assertEqual(results["emails_sent"], 5)
+        self.assertEqual(len(results["details"]), 5)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_crashed_run_resumes_without_duplicates(self):
+        calls = []
+
+        def crash_on_third(subscription):
+            calls.append(subscription.pk)
+            if len(calls) == 3:
+                raise RuntimeError("worker died")
+            return create_invoice_for_subscription(subscription)
+
+        with mock.patch(
+            "kill_bill.core.utils.create_invoice_for_subscription", side_effect=crash_on_third
+        ), self.assertRaises(RuntimeError):
+            process_expiring_subscriptions(7, incremental=True, workers=2)
+        self.assertIsNone(SiteConfiguration.get_config().expiry_scanned_at)
+
+        results = process_expiring_subscriptions(7, incremental=True, workers=2)
+        self.assertEqual(results["invoices_created"], 3)
+        self.assertEqual(results["invoices_existing"], 2)
+        self.assertEqual(Invoice.objects.count(), 5)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_emails_lost_in_a_crash_are_sent_on_the_next_run(self):
+        with mock.patch(
+            "kill_bill.core.utils.send_emails_concurrently", side_effect=RuntimeError("killed")
+        ), self.assertRaises(RuntimeError):
+            process_expiring_subscriptions(7, concurrency=2)
+        self.assertEqual(Invoice.objects.filter(email_pending=True).count(), 5)
+        self.assertEqual(len(mail.outbox), 0)
+
+        results = process_expiring_subscriptions(7, concurrency=2)
+        self.assertEqual(results["invoices_existing"], 5)
+        self.assertEqual(results["emails_sent"], 5)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertFalse(Invoice.objects.filter(email_pending=True).exists())
+
+        results = process_expiring_subscriptions(7, concurrency=2)
+        self.assertEqual(results["emails_sent"], 0)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_outcomes_stream_as_processed(self):
+        created = []
+
+        def create(subscription):
+            created.append(subscription.pk)
+            return create_invoice_for_subscription(subscription)
+
+        with mock.patch(
+            "kill_bill.core.utils.create_invoice_for_subscription", side_effect=create
+        ):
+            outcomes = iter_expiring_subscriptions(7)
+            first = next(outcomes)
+            self.assertEqual(created, [first["subscription"]])
+            self.assertTrue(first["email_sent"])
+            self.assertEqual(len(list(outcomes)), 4)
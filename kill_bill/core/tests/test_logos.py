@@ -0,0 +1,101 @@
+import base64
+import tempfile
+from io import BytesIO
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from kill_bill.core.logos import LOGO_VARIANTS, variant_name
+from kill_bill.core.models import (
+    Client,
+    Invoice,
+    InvoiceConfiguration,
+    Subscription,
+    SubscriptionPlan,
+)
+from kill_bill.core.utils import render_invoice_email
+
+
+def make_logo(size=(2400, 900)) -> SimpleUploadedFile:
+    image = Image.radial_gradient("L").resize(size).convert("RGBA")
+    buffer = BytesIO()
+    image.save(buffer, "PNG")
+    return SimpleUploadedFile("logo.png", buffer.getvalue(), content_type="image/png")
+
+
+class LogoVariantTest(TestCase):
+    def setUp(self):
+        media_root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.config = InvoiceConfiguration.get_config()
+
+    def upload(self):
+        self.config.logo = make_logo()
+        self.config.save()
+        return self.config
+
+    def test_upload_renders_bounded_variants(self):
+        config = self.upload()
+        self.assertEqual(len(config.logo_hash), 64)
+        for variant, (width, height, fmt) in LOGO_VARIANTS.items():
+            with default_storage.open(variant_name(config.logo_hash, variant)) as file:
+                image = Image.open(file)
+                self.assertEqual(image.format, fmt)
+                self.assertLessEqual(image.width, width)
+                self.assertLessEqual(image.height, height)
+        self.assertEqual(
+            config.logo_print_url,
+            default_storage.url(variant_name(config.logo_hash, "print")),
+        )
+
+    def test_same_image_reuses_variants(self):
+        first = self.upload().logo_hash
+        name = variant_name(first, "print")
+        modified = default_storage.get_modified_time(name)
+        self.assertEqual(self.upload().logo_hash, first)
+        self.assertEqual(default_storage.get_modified_time(name), modified)
+
+    def test_missing_variant_is_rebuilt(self):
+        config = self.upload()
+        default_storage.delete(variant_name(config.logo_hash, "preview"))
+        self.assertEqual(
+            config.logo_preview_url,
+            default_storage.url(variant_name(config.logo_hash, "preview")),
+        )
+        self.assertTrue(default_storage.exists(variant_name(config.logo_hash, "preview")))
+
+    def test_email_inlines_small_logo(self):
+        self.upload()
+        company = Client.objects.create(
+            company_name="Test Company",
+            contact_person="John Doe",
+            email="john@example.com",
+            phone="1234567890"
+        )
+        plan = SubscriptionPlan.objects.create(
+            name="Test Plan",
+            price_monthly=10.00,
+            price_annual=100.00
+        )
+        subscription = Subscription.objects.create(
+            client=company,
+            plan=plan,
+            billing_cycle=Subscription.BillingCycle.MONTHLY,
+            start_date=timezone.now().date()
+        )
+        invoice = Invoice.objects.create(
+            subscription=subscription, amount=10, due_date=subscription.end_date
+        )
+
+        html = render_invoice_email(subscription, invoice)["html_message"]
+        data_uri = InvoiceConfiguration.get_config().logo_data_uri
+        self.assertTrue(data_uri.startswith("data:image/png;base64,"))
+        self.assertIn(data_uri, html)
+        self.assertLess(len(base64.b64decode(data_uri.split(",", 1)[1])), 20 * 1024)
+
+    def test_no_logo(self):
+        self.assertEqual(self.config.logo_print_url, "")
+        self.assertEqual(self.config.logo_data_uri, "")
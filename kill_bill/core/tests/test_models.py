@@ -0,0 +1,232 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from kill_bill.core.models import (
+    BillingCountersMixin,
+    Client,
+    Invoice,
+    Payment,
+    Subscription,
+    SubscriptionPlan,
+    get_reminder_invoices,
+)
+
+
+class EffectiveStatusTest(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.company = Client.objects.create(
+            company_name="Test Company",
+            contact_person="John Doe",
+            email="john@example.com",
+            phone="1234567890"
+        )
+        self.plan = SubscriptionPlan.objects.create(
+            name="Test Plan",
+            price_monthly=10.00,
+            price_annual=100.00
+        )
+
+    def make_subscription(self, end_date, status=Subscription.Status.ACTIVE):
+        sub = Subscription.objects.create(
+            client=self.company,
+            plan=self.plan,
+            billing_cycle=Subscription.BillingCycle.MONTHLY,
+            start_date=self.today - timedelta(days=10)
+        )
+        # Simulate a stored status that has not been refreshed yet
+        Subscription.objects.filter(pk=sub.pk).update(end_date=end_date, status=status)
+        return sub
+
+    def make_invoice(self, due_date, status=Invoice.Status.UNPAID):
+        invoice = Invoice.objects.create(
+            subscription=self.make_subscription(self.today + timedelta(days=20)),
+            amount=10,
+            issue_date=self.today - timedelta(days=30),
+            due_date=self.today + timedelta(days=1),
+        )
+        Invoice.objects.filter(pk=invoice.pk).update(due_date=due_date, status=status)
+        return invoice
+
+    def test_subscription_effective_status(self):
+        stale = self.make_subscription(self.today - timedelta(days=1))
+        current = self.make_subscription(self.today)
+        cancelled = self.make_subscription(
+            self.today - timedelta(days=1), Subscription.Status.CANCELLED
+        )
+
+        statuses = dict(
+            Subscription.objects.with_effective_status().values_list("pk", "effective_status")
+        )
+        self.assertEqual(statuses[stale.pk], Subscription.Status.EXPIRED)
+        self.assertEqual(statuses[current.pk], Subscription.Status.ACTIVE)
+        self.assertEqual(statuses[cancelled.pk], Subscription.Status.CANCELLED)
+
+        for status in Subscription.Status.values:
+            self.assertEqual(
+                set(Subscription.objects.filter_effective_status(status).values_list("pk", flat=True)),
+                {pk for pk, value in statuses.items() if value == status},
+            )
+
+    def test_invoice_effective_status(self):
+        stale = self.make_invoice(self.today - timedelta(days=1))
+        due_today = self.make_invoice(self.today, Invoice.Status.OVERDUE)
+        paid = self.make_invoice(self.today - timedelta(days=5), Invoice.Status.PAID)
+
+        statuses = dict(
+            Invoice.objects.with_effective_status().values_list("pk", "effective_status")
+        )
+        self.assertEqual(statuses[stale.pk], Invoice.Status.OVERDUE)
+        self.assertEqual(statuses[due_today.pk], Invoice.Status.UNPAID)
+        self.assertEqual(statuses[paid.pk], Invoice.Status.PAID)
+
+        for status in Invoice.Status.values:
+            self.assertEqual(
+                set(Invoice.objects.filter_effective_status(status).values_list("pk", flat=True)),
+                {pk for pk, value in statuses.items() if value == status},
+            )
+
+        upcoming, overdue = get_reminder_invoices()
+        self.assertEqual(list(upcoming), [due_today])
+        self.assertEqual(list(overdue), [stale])
+        # Lapsed but still stored as unpaid: counted from the due date.
+        self.assertEqual([invoice.days_overdue for invoice in overdue], [1])
+        self.assertEqual([invoice.days_overdue for invoice in upcoming], [0])
+        self.assertEqual(Invoice.objects.get(pk=paid.pk).days_overdue, 0)
+
+
+class ClientBillingCountersTest(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.company = Client.objects.create(
+            company_name="Test Company",
+            contact_person="John Doe",
+            email="john@example.com",
+            phone="1234567890"
+        )
+        self.plan = SubscriptionPlan.objects.create(
+            name="Test Plan",
+            price_monthly=10.00,
+            price_annual=100.00
+        )
+        self.subscription = Subscription.objects.create(
+            client=self.company,
+            plan=self.plan,
+            billing_cycle=Subscription.BillingCycle.MONTHLY,
+            start_date=self.today
+        )
+
+    def assertCounters(self, outstanding, active, paid):
+        self.company.refresh_from_db()
+        self.assertEqual(self.company.outstanding_balance, Decimal(outstanding))
+        self.assertEqual(self.company.active_subscription_count, active)
+        self.assertEqual(self.company.lifetime_paid, Decimal(paid))
+
+    def test_counters_follow_writes(self):
+        self.assertCounters("0", 1, "0")
+
+        invoice = Invoice.objects.create(
+            subscription=self.subscription,
+            amount=10,
+            due_date=self.today + timedelta(days=14),
+        )
+        self.assertCounters("10", 1, "0")
+
+        invoice.status = Invoice.Status.PAID
+        invoice.save()
+        Payment.objects.create(
+            subscription=self.subscription,
+            amount=10,
+            payment_date=self.today,
+            payment_method=Payment.Method.BANK_TRANSFER,
+        )
+        self.assertCounters("0", 1, "10")
+
+        self.subscription.status = Subscription.Status.CANCELLED
+        self.subscription.save()
+        self.assertCounters("0", 0, "10")
+
+        self.subscription.delete()
+        self.assertCounters("0", 0, "0")
+
+    def test_moving_a_row_refreshes_both_clients(self):
+        other = Client.objects.create(
+            company_name="Other Company",
+            contact_person="Jane Doe",
+            email="jane@example.com",
+            phone="1234567890"
+        )
+        other_subscription = Subscription.objects.create(
+            client=other,
+            plan=self.plan,
+            billing_cycle=Subscription.BillingCycle.MONTHLY,
+            start_date=self.today
+        )
+        invoice = Invoice.objects.create(
+            subscription=self.subscription,
+            amount=10,
+            due_date=self.today + timedelta(days=14),
+        )
+        self.assertCounters("10", 1, "0")
+
+        invoice = Invoice.objects.get(pk=invoice.pk)
+        invoice.subscription = other_subscription
+        invoice.save()
+        self.assertCounters("0", 1, "0")
+        other.refresh_from_db()
+        self.assertEqual(other.outstanding_balance, Decimal("10"))
+
+        subscription = Subscription.objects.get(pk=self.subscription.pk)
+        subscription.client = other
+        subscription.save()
+        self.assertCounters("0", 0, "0")
+        other.refresh_from_db()
+        self.assertEqual(other.active_subscription_count, 2)
+
+    def test_queryset_delete_refreshes_counters(self):
+        for days in (14, 44):
+            Invoice.objects.create(
+                subscription=self.subscription,
+                amount=10,
+                due_date=self.today + timedelta(days=days),
+            )
+        Payment.objects.create(
+            subscription=self.subscription,
+            amount=10,
+            payment_date=self.today,
+            payment_method=Payment.Method.BANK_TRANSFER,
+        )
+        self.assertCounters("20", 1, "10")
+
+        Invoice.objects.filter(subscription=self.subscription).delete()
+        Payment.objects.all().delete()
+        self.assertCounters("0", 1, "0")
+
+    def test_mixin_requires_the_owner_lookup(self):
+        with self.assertRaisesMessage(TypeError, "Orphan must set billing_client_lookup"):
+            type("Orphan", (BillingCountersMixin,), {"billing_owner_field": "client_id"})
+
+    def test_reconcile_repairs_drift(self):
+        Invoice.objects.create(
+            subscription=self.subscription,
+            amount=10,
+            due_date=self.today + timedelta(days=14),
+        )
+        Client.objects.filter(pk=self.company.pk).update(
+            outstanding_balance=0, active_subscription_count=5
+        )
+
+        out = StringIO()
+        call_command("reconcile_client_counters", dry_run=True, stdout=out)
+        self.assertIn("found 1", out.getvalue())
+        self.assertCounters("0", 5, "0")
+
+        out = StringIO()
+        call_command("reconcile_client_counters", batch_size=1, stdout=out)
+        self.assertIn("repaired 1", out.getvalue())
+        self.assertCounters("10", 1, "0")
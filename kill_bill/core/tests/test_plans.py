@@ -0,0 +1,147 @@
+import contextvars
+from decimal import Decimal
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from kill_bill.core.forms import SubscriptionForm
+from kill_bill.core import versions
+from kill_bill.core.models import CacheVersion, Client, Subscription, SubscriptionPlan
+from kill_bill.core.plans import PLAN_VERSION_KEY, get_plans, plan_price
+from kill_bill.core.utils import create_invoice_for_subscription
+
+
+class PlanCacheTest(TestCase):
+    def setUp(self):
+        self.company = Client.objects.create(
+            company_name="Test Company",
+            contact_person="John Doe",
+            email="john@example.com",
+            phone="1234567890"
+        )
+        self.basic = SubscriptionPlan.objects.create(
+            name="Basic",
+            price_monthly=10.00,
+            price_annual=100.00
+        )
+        self.legacy = SubscriptionPlan.objects.create(
+            name="Legacy",
+            price_monthly=5.00,
+            price_annual=50.00,
+            is_active=False
+        )
+        get_plans()
+
+    def test_prices_come_from_memory(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                plan_price(self.basic.pk, Subscription.BillingCycle.MONTHLY), Decimal("10.00")
+            )
+            self.assertEqual(
+                plan_price(self.basic.pk, Subscription.BillingCycle.ANNUAL), Decimal("100.00")
+            )
+        with self.assertRaises(SubscriptionPlan.DoesNotExist):
+            plan_price(0, Subscription.BillingCycle.MONTHLY)
+
+    def test_saving_a_plan_invalidates_the_cache(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.basic.price_monthly = Decimal("12.00")
+            self.basic.save()
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(
+            plan_price(self.basic.pk, Subscription.BillingCycle.MONTHLY), Decimal("12.00")
+        )
+
+        premium = SubscriptionPlan.objects.create(
+            name="Premium", price_monthly=20.00, price_annual=200.00
+        )
+        self.assertEqual(list(get_plans()), [self.basic.pk, self.legacy.pk, premium.pk])
+
+    def test_subscription_form_choices_from_memory(self):
+        with self.assertNumQueries(0):
+            choices = [value for value, _ in SubscriptionForm().fields["plan"].choices]
+        self.assertEqual(choices, ["", self.basic.pk])
+
+        subscription = Subscription(
+            client=self.company,
+            plan=self.legacy,
+            billing_cycle=Subscription.BillingCycle.MONTHLY,
+            start_date=timezone.now().date()
+        )
+        subscription.pk = 1
+        choices = [value for value, _ in SubscriptionForm(instance=subscription).fields["plan"].choices]
+        self.assertEqual(choices, ["", self.basic.pk, self.legacy.pk])
+
+    def test_subscription_form_validates_plan_from_memory(self):
+        data = {
+            "client": self.company.pk,
+            "plan": self.legacy.pk,
+            "billing_cycle": Subscription.BillingCycle.MONTHLY,
+            "start_date": timezone.now().date(),
+            "status": Subscription.Status.ACTIVE,
+        }
+        form = SubscriptionForm(data)
+        self.assertFalse(form.is_valid())
+        self.assertIn("plan", form.errors)
+
+        form = SubscriptionForm({**data, "plan": self.basic.pk})
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertIs(form.cleaned_data["plan"], get_plans()[self.basic.pk])
+
+    def test_invoice_amount_without_loading_plan(self):
+        subscription = Subscription.objects.create(
+            client=self.company,
+            plan=self.basic,
+            billing_cycle=Subscription.BillingCycle.ANNUAL,
+            start_date=timezone.now().date()
+        )
+        subscription = Subscription.objects.get(pk=subscription.pk)
+        with CaptureQueriesContext(connection) as queries:
+            invoice, created = create_invoice_for_subscription(subscription)
+        self.assertTrue(created)
+        self.assertFalse(
+            [query for query in queries if "core_subscriptionplan" in query["sql"]]
+        )
+        self.assertEqual(invoice.amount, Decimal("100.00"))
+
+    def test_uncommitted_bump_is_private_to_its_request(self):
+        # A request on another thread starts from an empty context.
+        other_request = contextvars.Context()
+        with self.captureOnCommitCallbacks(execute=True):
+            versions.bump(PLAN_VERSION_KEY)
+            local = versions.get_version(PLAN_VERSION_KEY)
+            self.assertTrue(local.startswith("local-"))
+            self.assertEqual(other_request.run(versions.get_version, PLAN_VERSION_KEY), "0")
+            # Another request starting does not drop this one's bump.
+            other_request.run(versions.reset)
+            self.assertEqual(versions.get_version(PLAN_VERSION_KEY), local)
+
+        other_request.run(versions.reset)
+        self.assertEqual(other_request.run(versions.get_version, PLAN_VERSION_KEY), "1")
+
+    def test_changes_from_another_process_are_seen_at_the_next_request(self):
+        # Another process writes without this one's signals and moves the
+        # counter in the database when it commits.
+        SubscriptionPlan.objects.filter(pk=self.basic.pk).update(price_monthly=Decimal("15.00"))
+        premium = SubscriptionPlan.objects.bulk_create(
+            [SubscriptionPlan(name="Premium", price_monthly=20.00, price_annual=200.00)]
+        )[0]
+        CacheVersion.objects.create(key=PLAN_VERSION_KEY, version=7)
+
+        self.assertEqual(
+            plan_price(self.basic.pk, Subscription.BillingCycle.MONTHLY), Decimal("10.00")
+        )
+        versions.reset()
+        self.assertEqual(
+            plan_price(self.basic.pk, Subscription.BillingCycle.MONTHLY), Decimal("15.00")
+        )
+        form = SubscriptionForm({
+            "client": self.company.pk,
+            "plan": premium.pk,
+            "billing_cycle": Subscription.BillingCycle.MONTHLY,
+            "start_date": timezone.now().date(),
+            "status": Subscription.Status.ACTIVE,
+        })
+        self.assertTrue(form.is_valid(), form.errors)
@@ -0,0 +1,179 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from kill_bill.core.forms import BankStatementForm
+from kill_bill.core.models import (
+    BankStatementLine,
+    Client,
+    Invoice,
+    Payment,
+    Subscription,
+    SubscriptionPlan,
+)
+from kill_bill.core.reconciliation import StatementError, parse_statement, reconcile_statement
+
+
+class ReconciliationTest(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.plan = SubscriptionPlan.objects.create(
+            name="Test Plan",
+            price_monthly=10.00,
+            price_annual=100.00
+        )
+        self.acme = self.make_client("Acme Corp")
+        self.globex = self.make_client("Globex")
+        self.acme_invoice = self.make_invoice(self.acme, 100)
+        self.globex_invoice = self.make_invoice(self.globex, 250)
+        self.globex_other = self.make_invoice(self.globex, 75)
+        self.globex_duplicate = self.make_invoice(self.globex, 75)
+
+    def make_client(self, name):
+        client = Client.objects.create(
+            company_name=name,
+            contact_person="John Doe",
+            email="john@example.com",
+            phone="1234567890"
+        )
+        subscription = Subscription.objects.create(
+            client=client,
+            plan=self.plan,
+            billing_cycle=Subscription.BillingCycle.ANNUAL,
+            start_date=self.today
+        )
+        client.subscription = subscription
+        return client
+
+    def make_invoice(self, client, amount):
+        # Each billing period of a subscription has one invoice.
+        periods = client.subscription.invoices.count()
+        return Invoice.objects.create(
+            subscription=client.subscription,
+            amount=amount,
+            due_date=self.today + timedelta(days=14 + periods),
+        )
+
+    def csv(self, *lines):
+        return ["date,amount,reference,payer", *lines]
+
+    def line_statuses(self, statement):
+        return dict(statement.lines.values_list("line_number", "status"))
+
+    def test_parse_statement_errors(self):
+        with self.assertRaises(StatementError):
+            parse_statement(["date,amount", "2025-01-01,10"])
+        with self.assertRaises(StatementError):
+            parse_statement(self.csv("not-a-date,10,x,y"))
+        with self.assertRaises(StatementError):
+            parse_statement(self.csv("2025-01-01,abc,x,y"))
+
+    def test_matches_by_reference_then_amount_and_payer(self):
+        rows = parse_statement(self.csv(
+            f"{self.today},100.00,Payment {self.acme_invoice.invoice_number},ACME CORP",
+            f"{self.today},250,Transfer,globex",
+            f"{self.today},75,Transfer,Globex",
+            f"{self.today},999,Unknown,Nobody",
+        ))
+
+        with self.assertNumQueries(10):
+            statement = reconcile_statement("statement.csv", rows)
+
+        self.assertEqual(self.line_statuses(statement), {
+            2: BankStatementLine.Status.MATCHED,
+            3: BankStatementLine.Status.MATCHED,
+            4: BankStatementLine.Status.AMBIGUOUS,
+            5: BankStatementLine.Status.UNMATCHED,
+        })
+        ambiguous = statement.lines.get(line_number=4)
+        self.assertEqual(
+            set(ambiguous.candidates.values_list("pk", flat=True)),
+            {self.globex_other.pk, self.globex_duplicate.pk},
+        )
+
+        for invoice in (self.acme_invoice, self.globex_invoice):
+            invoice.refresh_from_db()
+            self.assertEqual(invoice.status, Invoice.Status.PAID)
+        self.assertEqual(Payment.objects.count(), 2)
+        self.acme.refresh_from_db()
+        self.assertEqual(self.acme.lifetime_paid, Decimal("100"))
+        self.assertEqual(self.acme.outstanding_balance, Decimal("0"))
+
+    def test_reference_with_wrong_amount_needs_review(self):
+        rows = parse_statement(self.csv(
+            f"{self.today},90,{self.acme_invoice.invoice_number},Acme Corp",
+        ))
+        statement = reconcile_statement("statement.csv", rows)
+        self.assertEqual(self.line_statuses(statement), {2: BankStatementLine.Status.AMBIGUOUS})
+        self.assertEqual(Payment.objects.count(), 0)
+
+    def test_invoice_is_only_matched_once(self):
+        rows = parse_statement(self.csv(
+            f"{self.today},100,{self.acme_invoice.invoice_number},",
+            f"{self.today},100,{self.acme_invoice.invoice_number},",
+        ))
+        statement = reconcile_statement("statement.csv", rows)
+        self.assertEqual(self.line_statuses(statement), {
+            2: BankStatementLine.Status.MATCHED,
+            3: BankStatementLine.Status.UNMATCHED,
+        })
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_upload_form_reads_quoted_newlines(self):
+        upload = SimpleUploadedFile(
+            "statement.csv",
+            "\r\n".join(self.csv(
+                f'{self.today},100,"Invoice for\nMarch",Acme Corp',
+                f"{self.today},75,Transfer,Globex",
+            )).encode(),
+        )
+        form = BankStatementForm(files={"statement": upload})
+        self.assertTrue(form.is_valid(), form.errors)
+        rows = form.cleaned_data["rows"]
+        self.assertEqual([row.reference for row in rows], ["Invoice for\nMarch", "Transfer"])
+        self.assertEqual(form.cleaned_data["statement"].name, "statement.csv")
+
+        empty = BankStatementForm(
+            files={"statement": SimpleUploadedFile("empty.csv", b"date,amount,reference\n")}
+        )
+        self.assertEqual(empty.errors["statement"], ["Statement has no lines"])
+
+    def test_review_screen_resolves_lines(self):
+        user = get_user_model().objects.create_user("staff", password="secret")
+        self.client.force_login(user)
+        upload = SimpleUploadedFile(
+            "statement.csv",
+            "\n".join(self.csv(
+                f"{self.today},75,Transfer,Globex",
+                f"{self.today},250,Wire,Someone else",
+                f"{self.today},5,Fee,Bank",
+            )).encode(),
+        )
+        response = self.client.post(reverse("reconciliation_upload"), {"statement": upload})
+        statement_url = response["Location"]
+        lines = {line.line_number: line for line in BankStatementLine.objects.all()}
+
+        response = self.client.get(statement_url)
+        self.assertContains(response, self.globex_other.invoice_number)
+
+        self.client.post(statement_url, {
+            f"line-{lines[2].pk}": str(self.globex_other.pk),
+            f"number-{lines[3].pk}": self.globex_invoice.invoice_number.lower(),
+            f"line-{lines[4].pk}": "ignore",
+        })
+
+        statuses = dict(BankStatementLine.objects.values_list("line_number", "status"))
+        self.assertEqual(statuses, {
+            2: BankStatementLine.Status.MATCHED,
+            3: BankStatementLine.Status.MATCHED,
+            4: BankStatementLine.Status.IGNORED,
+        })
+        self.globex_other.refresh_from_db()
+        self.assertEqual(self.globex_other.status, Invoice.Status.PAID)
+        self.globex_duplicate.refresh_from_db()
+        self.assertEqual(self.globex_duplicate.status, Invoice.Status.UNPAID)
@@ -0,0 +1,99 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from kill_bill.core.models import Invoice
+from kill_bill.core.replica import (
+    STICKY_COOKIE_NAME,
+    ReplicaStickinessMiddleware,
+    read_replica,
+)
+from kill_bill.settings import BASE_DIR, parse_database_url
+
+
+@read_replica
+def read_view(request):
+    return router.db_for_read(Invoice), router.db_for_read(get_user_model())
+
+
+@read_replica
+async def async_read_view(request):
+    return router.db_for_read(Invoice)
+
+
+@mock.patch("kill_bill.core.replica.replica_configured", return_value=True)
+class ReplicaRoutingTest(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_read_view_uses_replica_for_core_models_only(self, _):
+        invoice_db, user_db = read_view(self.factory.get("/invoices/"))
+        self.assertEqual(invoice_db, "replica")
+        self.assertEqual(user_db, "default")
+
+    async def test_async_read_view_uses_replica(self, _):
+        self.assertEqual(await async_read_view(self.factory.get("/")), "replica")
+
+    def test_other_code_reads_from_primary(self, _):
+        read_view(self.factory.get("/invoices/"))
+        self.assertEqual(router.db_for_read(Invoice), "default")
+
+    def test_sticky_cookie_reads_from_primary(self, _):
+        request = self.factory.get("/invoices/")
+        request.COOKIES[STICKY_COOKIE_NAME] = "1"
+        invoice_db, _ = read_view(request)
+        self.assertEqual(invoice_db, "default")
+
+    def test_writes_set_sticky_cookie(self, _):
+        middleware = ReplicaStickinessMiddleware(lambda request: HttpResponse())
+        response = middleware(self.factory.post("/invoices/1/mark-paid/"))
+        self.assertIn(STICKY_COOKIE_NAME, response.cookies)
+        response = middleware(self.factory.get("/invoices/"))
+        self.assertNotIn(STICKY_COOKIE_NAME, response.cookies)
+
+
+class ReplicaNotConfiguredTest(SimpleTestCase):
+    def test_reads_stay_on_primary(self):
+        invoice_db, _ = read_view(RequestFactory().get("/invoices/"))
+        self.assertEqual(invoice_db, "default")
+
+
+class ParseDatabaseUrlTest(SimpleTestCase):
+    def test_postgres_with_persistent_connections(self):
+        config = parse_database_url(
+            "postgresql://user:pw@db.example.com:6543/bill"
+            "?sslmode=require&conn_max_age=600&conn_health_checks=true"
+        )
+        self.assertEqual(config["ENGINE"], "django.db.backends.postgresql")
+        self.assertEqual(config["PORT"], 6543)
+        self.assertEqual(config["CONN_MAX_AGE"], 600)
+        self.assertTrue(config["CONN_HEALTH_CHECKS"])
+        self.assertEqual(config["OPTIONS"], {"sslmode": "require"})
+
+    def test_postgres_with_pool(self):
+        config = parse_database_url(
+            "postgres://user:pw@localhost/bill?pool=true&pool_min_size=2&pool_max_size=8"
+        )
+        self.assertEqual(config["CONN_MAX_AGE"], 0)
+        self.assertEqual(config["OPTIONS"], {"pool": {"min_size": 2, "max_size": 8}})
+
+    def test_pool_and_persistent_connections_conflict(self):
+        with self.assertRaises(ValueError):
+            parse_database_url("postgres://localhost/bill?pool=true&conn_max_age=60")
+
+    def test_sqlite_paths(self):
+        self.assertEqual(
+            parse_database_url("sqlite:///replica.sqlite3")["NAME"],
+            BASE_DIR / "replica.sqlite3",
+        )
+        self.assertEqual(
+            str(parse_database_url("sqlite:////tmp/replica.sqlite3")["NAME"]),
+            "/tmp/replica.sqlite3",
+        )
+
+    def test_unsupported_scheme(self):
+        with self.assertRaises(ValueError):
+            parse_database_url("mysql://localhost/bill")
@@ -0,0 +1,122 @@
+import time
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from kill_bill.core.models import JobLease, JobRun
+from kill_bill.core.scheduler import Job, acquire_lease, run_due_jobs, run_job
+
+JOBS = {"daily_reminders": {"at": "07:00"}}
+
+
+class JobScheduleTest(TestCase):
+    def test_daily_slot_is_local_time(self):
+        job = Job.from_setting("daily_reminders", {"at": "07:00"})
+        now = timezone.make_aware(datetime(2025, 3, 10, 6, 30))
+        slot = job.latest_slot(now)
+        self.assertEqual(timezone.localtime(slot).replace(tzinfo=None), datetime(2025, 3, 9, 7, 0))
+        self.assertEqual(job.next_slot(now), slot + timedelta(days=1))
+
+    def test_interval_slot(self):
+        job = Job.from_setting("daily_reminders", {"every": 15})
+        now = timezone.make_aware(datetime(2025, 3, 10, 6, 37))
+        self.assertEqual(timezone.localtime(job.latest_slot(now)).minute, 30)
+
+    def test_needs_exactly_one_schedule(self):
+        with self.assertRaises(ValueError):
+            Job.from_setting("daily_reminders", {})
+
+
+class JobLeaseTest(TestCase):
+    def test_lease_is_exclusive_until_it_expires(self):
+        self.assertTrue(acquire_lease("job", "node-a", 60))
+        self.assertFalse(acquire_lease("job", "node-b", 60))
+        self.assertTrue(acquire_lease("job", "node-a", 60))
+
+        JobLease.objects.filter(name="job").update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertTrue(acquire_lease("job", "node-b", 60))
+        self.assertEqual(JobLease.objects.get(name="job").owner, "node-b")
+
+
+@override_settings(SCHEDULED_JOBS=JOBS)
+class RunSchedulerTest(TestCase):
+    def setUp(self):
+        self.job = Job.from_setting("daily_reminders", JOBS["daily_reminders"])
+
+    def test_once_runs_due_job_and_records_it(self):
+        out = StringIO()
+        call_command("run_scheduler", once=True, stdout=out)
+
+        run = JobRun.objects.get()
+        self.assertEqual(run.job, "daily_reminders")
+        self.assertEqual(run.status, JobRun.Status.SUCCEEDED)
+        self.assertEqual(run.scheduled_for, self.job.latest_slot(timezone.now()))
+        self.assertIsNotNone(run.duration)
+        self.assertIn("Reminder summary", run.output)
+        self.assertIn("succeeded", out.getvalue())
+
+    def test_slot_runs_once(self):
+        run_due_jobs([self.job], "node-a")
+        self.assertEqual(run_due_jobs([self.job], "node-b"), [])
+        self.assertEqual(JobRun.objects.count(), 1)
+
+    def test_job_held_by_another_node_is_skipped(self):
+        acquire_lease(self.job.name, "node-a", 60)
+        self.assertEqual(run_due_jobs([self.job], "node-b"), [])
+        self.assertFalse(JobRun.objects.exists())
+
+    def test_failed_run_is_recorded(self):
+        with mock.patch(
+            "kill_bill.core.scheduler.call_command", side_effect=RuntimeError("SMTP down")
+        ):
+            [run] = run_due_jobs([self.job], "node-a")
+        self.assertEqual(run.status, JobRun.Status.FAILED)
+        self.assertIn("SMTP down", run.output)
+        # A failed slot is not retried in a loop; the next slot runs as usual.
+        self.assertEqual(run_due_jobs([self.job], "node-a"), [])
+        self.assertFalse(JobLease.objects.filter(expires_at__gt=timezone.now()).exists())
+
+    def test_abandoned_run_is_rerun(self):
+        slot = self.job.latest_slot(timezone.now())
+        JobRun.objects.create(job=self.job.name, scheduled_for=slot, node="dead-node")
+
+        run = run_job(self.job, slot, "node-a")
+        self.assertEqual(run.status, JobRun.Status.SUCCEEDED)
+        self.assertEqual(
+            JobRun.objects.get(node="dead-node").status, JobRun.Status.ABANDONED
+        )
+
+    def test_catches_up_latest_missed_slot(self):
+        now = timezone.now()
+        yesterday = self.job.latest_slot(now) - timedelta(days=1)
+        JobRun.objects.create(
+            job=self.job.name,
+            scheduled_for=yesterday - timedelta(days=3),
+            status=JobRun.Status.SUCCEEDED,
+            node="node-a",
+        )
+        # The scheduler was down for several days; only the latest slot runs.
+        [run] = run_due_jobs([self.job], "node-a", now=now)
+        self.assertEqual(run.scheduled_for, self.job.latest_slot(now))
+        self.assertEqual(JobRun.objects.count(), 2)
+
+
+class LeaseRenewalTest(TransactionTestCase):
+    def test_job_outlasting_its_lease_keeps_it(self):
+        job = Job.from_setting("daily_reminders", {"at": "07:00", "lease_seconds": 1})
+        taken = []
+
+        def slow_command(*args, **kwargs):
+            time.sleep(2)
+            taken.append(acquire_lease(job.name, "node-b", 1))
+
+        with mock.patch("kill_bill.core.scheduler.call_command", side_effect=slow_command):
+            [run] = run_due_jobs([job], "node-a")
+
+        self.assertEqual(taken, [False])
+        self.assertEqual(run.status, JobRun.Status.SUCCEEDED)
+        self.assertFalse(JobRun.objects.filter(status=JobRun.Status.ABANDONED).exists())
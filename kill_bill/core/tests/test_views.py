@@ -0,0 +1,220 @@
+import os
+import tempfile
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from kill_bill.core.forms import InvoiceForm, PaymentForm
+from kill_bill.core.fragments import stamp_key
+from kill_bill.core.models import (
+    CacheVersion,
+    Client,
+    Invoice,
+    Payment,
+    Subscription,
+    SubscriptionPlan,
+)
+from kill_bill.core.utils import mark_invoices_paid
+
+
+class AsyncViewTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("staff", password="secret")
+        self.company = Client.objects.create(
+            company_name="Test Company",
+            contact_person="John Doe",
+            email="john@example.com",
+            phone="1234567890"
+        )
+        self.plan = SubscriptionPlan.objects.create(
+            name="Test Plan",
+            price_monthly=10.00,
+            price_annual=100.00
+        )
+        today = timezone.now().date()
+        self.subscription = Subscription.objects.create(
+            client=self.company,
+            plan=self.plan,
+            billing_cycle=Subscription.BillingCycle.MONTHLY,
+            start_date=today - timedelta(days=20)
+        )
+        Invoice.objects.create(
+            subscription=self.subscription,
+            amount=10,
+            issue_date=today - timedelta(days=20),
+            due_date=today - timedelta(days=5),
+        )
+        Payment.objects.create(
+            subscription=self.subscription,
+            amount=10,
+            payment_date=today,
+            payment_method=Payment.Method.BANK_TRANSFER,
+        )
+
+    def pages(self):
+        return [
+            reverse("dashboard"),
+            reverse("reminders"),
+            reverse("client_detail", args=[self.company.pk]),
+            reverse("subscription_detail", args=[self.subscription.pk]),
+        ]
+
+    def test_pages_require_login(self):
+        for url in self.pages():
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 302, url)
+
+    def test_pages_render(self):
+        self.client.force_login(self.user)
+        for url in self.pages():
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertContains(response, "Test Company")
+
+    def test_dashboard_context(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("dashboard"))
+        self.assertEqual(response.context["active_subscriptions"], 1)
+        self.assertEqual(response.context["expiring_count"], 1)
+        self.assertEqual(response.context["overdue_total"], 1)
+        self.assertEqual(response.context["overdue_sum"], 10)
+
+    async def test_pages_render_async(self):
+        await self.async_client.aforce_login(self.user)
+        for url in self.pages():
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+
+    def test_missing_objects_404(self):
+        self.client.force_login(self.user)
+        self.assertEqual(
+            self.client.get(reverse("client_detail", args=[999])).status_code, 404
+        )
+        self.assertEqual(
+            self.client.get(reverse("subscription_detail", args=[999])).status_code, 404
+        )
+
+
+class AutocompleteTest(TestCase):
+    def setUp(self):
+        AsyncViewTest.setUp(self)
+        self.client.force_login(self.user)
+        self.other = Client.objects.create(
+            company_name="acme Corp", contact_person="Jane", email="jane@example.com", phone="1"
+        )
+        Client.objects.bulk_create(
+            Client(company_name=f"Bulk {i:03}", contact_person="-", email=f"{i}@example.com", phone="1")
+            for i in range(30)
+        )
+
+    def search(self, name, **params):
+        response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, 200)
+        return [result["text"] for result in response.json()["results"]]
+
+    def test_clients_match_prefix_ignoring_case(self):
+        self.assertEqual(self.search("autocomplete_clients", q="ACME"), ["acme Corp"])
+        self.assertEqual(self.search("autocomplete_clients", q="test c"), ["Test Company"])
+        self.assertEqual(self.search("autocomplete_clients", q="corp"), [])
+        results = self.search("autocomplete_clients", q="bulk")
+        self.assertEqual(results, [f"Bulk {i:03}" for i in range(20)])
+
+    def test_subscriptions_filter_by_client(self):
+        Subscription.objects.create(
+            client=self.other,
+            plan=self.plan,
+            billing_cycle=Subscription.BillingCycle.MONTHLY,
+            start_date=timezone.now().date(),
+        )
+        self.assertEqual(len(self.search("autocomplete_subscriptions")), 2)
+        results = self.search("autocomplete_subscriptions", client=self.company.pk)
+        self.assertEqual(results, [str(self.subscription)])
+        self.assertEqual(self.search("autocomplete_subscriptions", q="acme", client=self.company.pk), [])
+
+    def test_requires_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse("autocomplete_clients")).status_code, 302)
+
+    def test_forms_render_only_the_selected_choice(self):
+        form = PaymentForm(initial={"client": self.company.pk, "subscription": self.subscription.pk})
+        with CaptureQueriesContext(connection) as queries:
+            html = form.as_p()
+        self.assertNotIn("Bulk", html)
+        self.assertIn("Test Company", html)
+        self.assertIn(f'data-autocomplete-url="{reverse("autocomplete_clients")}"', html)
+        self.assertIn('data-autocomplete-forward="client"', html)
+        self.assertLessEqual(len(queries), 4)
+        self.assertEqual(InvoiceForm().as_p().count("<option"), 1)
+
+    def test_validation_still_checks_the_queryset(self):
+        form = PaymentForm(data={
+            "client": self.other.pk,
+            "subscription": self.subscription.pk,
+            "amount": 10,
+            "payment_date": timezone.now().date(),
+            "payment_method": Payment.Method.BANK_TRANSFER,
+            "status": Payment.Status.RECEIVED,
+        })
+        self.assertFalse(form.is_valid())
+        self.assertIn("subscription", form.errors)
+
+
+class FragmentCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        AsyncViewTest.setUp(self)
+        self.client.force_login(self.user)
+
+    def get(self, name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name))
+        return response, len(queries)
+
+    def test_unchanged_tables_are_served_from_cache(self):
+        for name, rows in (("dashboard", "overdue_invoices"), ("reminders", "overdue")):
+            first, first_queries = self.get(name)
+            second, second_queries = self.get(name)
+            self.assertEqual(len(first.context[rows]), 1)
+            self.assertEqual(second.context[rows], [])
+            self.assertLess(second_queries, first_queries)
+            self.assertContains(second, "Test Company")
+
+    def test_saves_and_set_based_writes_invalidate(self):
+        self.get("dashboard")
+        self.company.company_name = "Renamed Company"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.company.save()
+        self.assertContains(self.get("dashboard")[0], "Renamed Company")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            mark_invoices_paid(Invoice.objects.values_list("pk", flat=True))
+        response = self.get("dashboard")[0]
+        self.assertContains(response, "No overdue invoices.")
+        self.assertContains(self.get("reminders")[0], "No overdue invoices.")
+
+    def test_changes_from_another_process_are_seen_at_the_next_request(self):
+        self.get("dashboard")
+        # Another process renames the client and moves the counter on commit.
+        Client.objects.filter(pk=self.company.pk).update(company_name="Renamed Company")
+        self.assertNotContains(self.get("dashboard")[0], "Renamed Company")
+        CacheVersion.objects.create(key=stamp_key(Client), version=1)
+        self.assertContains(self.get("dashboard")[0], "Renamed Company")
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.path.join(tempfile.gettempdir(), "kill-bill-test-cache"),
+        }
+    }
+)
+class FileBasedFragmentCacheTest(FragmentCacheTest):
+    pass
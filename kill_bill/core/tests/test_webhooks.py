@@ -0,0 +1,240 @@
+import json
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from kill_bill.core import versions
+from kill_bill.core.fragments import stamp_key
+from kill_bill.core.models import (
+    CacheVersion,
+    Client,
+    Invoice,
+    Subscription,
+    SubscriptionPlan,
+    WebhookDelivery,
+    WebhookEndpoint,
+    WebhookEvent,
+)
+from kill_bill.core.utils import (
+    create_invoice_for_subscription,
+    mark_invoices_overdue,
+    mark_invoices_paid,
+)
+from kill_bill.core.webhooks import (
+    ENDPOINTS_VERSION_KEY,
+    dispatch_webhooks,
+    invalidate_endpoints,
+    record_events,
+    verify_signature,
+)
+
+
+class StubReceiver:
+    """Local HTTP server recording the webhooks posted to it."""
+
+    def __init__(self, statuses=()):
+        self.requests = []
+        self.statuses = list(statuses)
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                receiver.requests.append((dict(self.headers), body))
+                status = receiver.statuses.pop(0) if receiver.statuses else 200
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/hooks"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class WebhookTest(TestCase):
+    def setUp(self):
+        self.addCleanup(invalidate_endpoints)
+        self.receiver = StubReceiver()
+        self.addCleanup(self.receiver.close)
+        self.endpoint = WebhookEndpoint.objects.create(url=self.receiver.url)
+        self.plan = SubscriptionPlan.objects.create(
+            name="Test Plan",
+            price_monthly=10.00,
+            price_annual=100.00
+        )
+        self.company = Client.objects.create(
+            company_name="Test Company",
+            contact_person="John Doe",
+            email="john@example.com",
+            phone="1234567890"
+        )
+
+    def make_subscription(self):
+        return Subscription.objects.create(
+            client=self.company,
+            plan=self.plan,
+            billing_cycle=Subscription.BillingCycle.MONTHLY,
+            start_date=timezone.now().date()
+        )
+
+    def received(self):
+        return [json.loads(body) for _, body in self.receiver.requests]
+
+    def test_events_are_recorded_without_sending(self):
+        invoice, _ = create_invoice_for_subscription(self.make_subscription())
+        mark_invoices_paid([invoice.pk])
+
+        self.assertEqual(
+            list(WebhookEvent.objects.values_list("type", flat=True)),
+            [
+                WebhookEvent.Type.SUBSCRIPTION_CREATED,
+                WebhookEvent.Type.INVOICE_CREATED,
+                WebhookEvent.Type.INVOICE_PAID,
+                WebhookEvent.Type.PAYMENT_RECEIVED,
+            ],
+        )
+        self.assertEqual(
+            WebhookDelivery.objects.filter(status=WebhookDelivery.Status.PENDING).count(), 4
+        )
+        self.assertEqual(self.receiver.requests, [])
+        self.assertEqual(WebhookEvent.objects.get(type="invoice.paid").data["status"], "paid")
+
+    def test_nothing_recorded_without_endpoints(self):
+        self.endpoint.delete()
+        subscription = self.make_subscription()
+        create_invoice_for_subscription(subscription)
+        self.assertFalse(WebhookEvent.objects.exists())
+        with self.assertNumQueries(0):
+            record_events(WebhookEvent.Type.SUBSCRIPTION_CREATED, [subscription])
+
+    def test_endpoint_changes_from_another_process(self):
+        subscription = self.make_subscription()
+        WebhookEvent.objects.all().delete()
+        # Another process disables the endpoint and moves the counter on commit.
+        WebhookEndpoint.objects.filter(pk=self.endpoint.pk).update(is_active=False)
+        CacheVersion.objects.create(key=ENDPOINTS_VERSION_KEY, version=3)
+        versions.reset()
+        record_events(WebhookEvent.Type.SUBSCRIPTION_CREATED, [subscription])
+        self.assertFalse(WebhookDelivery.objects.exists())
+
+        second = WebhookEndpoint.objects.bulk_create([WebhookEndpoint(url=self.receiver.url)])[0]
+        CacheVersion.objects.filter(key=ENDPOINTS_VERSION_KEY).update(version=4)
+        versions.reset()
+        record_events(WebhookEvent.Type.SUBSCRIPTION_CREATED, [subscription])
+        self.assertEqual(
+            list(WebhookDelivery.objects.values_list("endpoint", flat=True)), [second.pk]
+        )
+
+    def test_endpoint_event_filter(self):
+        self.endpoint.events = [WebhookEvent.Type.INVOICE_PAID]
+        self.endpoint.save()
+        invoice, _ = create_invoice_for_subscription(self.make_subscription())
+        mark_invoices_paid([invoice.pk])
+        self.assertEqual(
+            list(WebhookDelivery.objects.values_list("event__type", flat=True)),
+            [WebhookEvent.Type.INVOICE_PAID],
+        )
+
+    def test_dispatch_signs_and_keeps_order(self):
+        subscription = self.make_subscription()
+        create_invoice_for_subscription(subscription)
+
+        counts = dispatch_webhooks(concurrency=2)
+
+        self.assertEqual(counts, {"delivered": 2, "retrying": 0, "failed": 0})
+        self.assertEqual(
+            [event["type"] for event in self.received()],
+            ["subscription.created", "invoice.created"],
+        )
+        headers, body = self.receiver.requests[0]
+        self.assertTrue(
+            verify_signature(self.endpoint.secret, headers["X-KillBill-Signature"], body)
+        )
+        self.assertFalse(verify_signature("wrong", headers["X-KillBill-Signature"], body))
+        self.assertEqual(self.received()[0]["data"]["id"], subscription.pk)
+        self.assertFalse(
+            WebhookDelivery.objects.exclude(status=WebhookDelivery.Status.DELIVERED).exists()
+        )
+
+    def test_failure_holds_back_later_events_until_retried(self):
+        self.receiver.statuses = [500]
+        create_invoice_for_subscription(self.make_subscription())
+
+        self.assertEqual(dispatch_webhooks(), {"delivered": 0, "retrying": 1, "failed": 0})
+        self.assertEqual(len(self.receiver.requests), 1)
+        first = WebhookDelivery.objects.first()
+        self.assertEqual((first.attempts, first.last_status_code), (1, 500))
+        self.assertGreater(first.next_attempt_at, timezone.now())
+
+        # Not due yet: nothing is sent, not even the next event.
+        self.assertEqual(dispatch_webhooks()["delivered"], 0)
+        self.assertEqual(len(self.receiver.requests), 1)
+
+        WebhookDelivery.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(dispatch_webhooks()["delivered"], 2)
+        self.assertEqual(
+            [event["type"] for event in self.received()],
+            ["subscription.created", "subscription.created", "invoice.created"],
+        )
+        deliveries = [headers["X-KillBill-Delivery"] for headers, _ in self.receiver.requests]
+        self.assertEqual(deliveries[0], deliveries[1])
+
+    def test_command_records_lapsed_statuses(self):
+        subscription = self.make_subscription()
+        invoice, _ = create_invoice_for_subscription(subscription)
+        yesterday = timezone.now().date() - timedelta(days=1)
+        Invoice.objects.filter(pk=invoice.pk).update(
+            status=Invoice.Status.UNPAID, due_date=yesterday
+        )
+        Subscription.objects.filter(pk=subscription.pk).update(end_date=yesterday)
+
+        out = StringIO()
+        call_command("record_lapsed_statuses", stdout=out)
+        self.assertIn("Marked 1 invoices overdue and 1 subscriptions expired", out.getvalue())
+        self.assertEqual(self.received(), [])
+
+        call_command("dispatch_webhooks", stdout=StringIO())
+        self.assertEqual(
+            [event["type"] for event in self.received()],
+            ["subscription.created", "invoice.created", "invoice.overdue", "subscription.expired"],
+        )
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.status, Subscription.Status.EXPIRED)
+
+    def test_nothing_lapsed_leaves_invoice_stamp_alone(self):
+        invoice, _ = create_invoice_for_subscription(self.make_subscription())
+        stamp = CacheVersion.objects.filter(key=stamp_key(Invoice))
+        before = list(stamp.values_list("version", flat=True))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(mark_invoices_overdue([invoice.pk]), [])
+
+        self.assertEqual(list(stamp.values_list("version", flat=True)), before)
+        self.assertFalse(WebhookEvent.objects.filter(type=WebhookEvent.Type.INVOICE_OVERDUE).exists())
+
+    def test_paying_through_a_save_records_the_event_once(self):
+        invoice, _ = create_invoice_for_subscription(self.make_subscription())
+        invoice = Invoice.objects.get(pk=invoice.pk)
+
+        invoice.status = Invoice.Status.PAID
+        invoice.save()
+        invoice.save()
+        Invoice.objects.get(pk=invoice.pk).save()
+
+        self.assertEqual(
+            WebhookEvent.objects.filter(type=WebhookEvent.Type.INVOICE_PAID).count(), 1
+        )
@@ -1,7 +1,7 @@
 from django.urls import path
 from django.contrib.auth.views import LogoutView
 
-from . import views
+from . import api, views
 
 urlpatterns = [
     path("", views.dashboard, name="dashboard"),
@@ -23,10 +23,26 @@ urlpatterns = [
     path("emails/", views.email_log_list, name="email_log_list"),
     path("invoices/", views.invoice_list, name="invoice_list"),
     path("invoices/new/", views.invoice_create, name="invoice_create"),
+    path("invoices/bulk/", views.invoice_bulk_action, name="invoice_bulk_action"),
+    path("api/invoices/bulk/", views.invoice_bulk_api, name="invoice_bulk_api"),
+    path("api/v1/<str:resource>/", api.collection, name="api_collection"),
+    path("api/v1/<str:resource>/<int:pk>/", api.detail, name="api_detail"),
     path("invoices/<int:pk>/", views.invoice_detail, name="invoice_detail"),
     path("invoices/<int:pk>/print/", views.invoice_print, name="invoice_print"),
     path("invoices/<int:pk>/mark-paid/", views.invoice_mark_paid, name="invoice_mark_paid"),
     path("reminders/", views.reminders, name="reminders"),
+    path("reconciliation/", views.reconciliation_upload, name="reconciliation_upload"),
+    path(
+        "reconciliation/<int:pk>/",
+        views.reconciliation_review,
+        name="reconciliation_review",
+    ),
+    path("autocomplete/clients/", views.autocomplete_clients, name="autocomplete_clients"),
+    path(
+        "autocomplete/subscriptions/",
+        views.autocomplete_subscriptions,
+        name="autocomplete_subscriptions",
+    ),
     path("plans/", views.plan_list, name="plan_list"),
     path("plans/new/", views.plan_create, name="plan_create"),
     path("plans/<int:pk>/", views.plan_detail, name="plan_detail"),
@@ -1,7 +1,16 @@
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import timedelta
+from functools import partial
 
+import django
 from django.conf import settings
 from django.core.mail import send_mail
+from django.db import IntegrityError, connections, transaction
+from django.db.models import Q
+from django.db.models.functions import Upper
+from django.db.models.lookups import GreaterThanOrEqual, LessThan, StartsWith
 from django.template.loader import render_to_string
 from django.utils import timezone
 
@@ -10,12 +19,73 @@ import logging
 logger = logging.getLogger(__name__)
 
 
-def send_and_log_email(subject, message, recipient_list, html_message=None):
+def prefix_filter(field: str, term: str) -> Q:
+    """
+    Rows whose ``field`` starts with ``term``, ignoring case.
+
+    The range on UPPER(field) lets the database walk an index on that
+    expression (see Client.Meta.indexes) instead of scanning with LIKE;
+    the startswith check keeps the result exact under any collation.
+    """
+    key = Upper(field)
+    term = term.upper()
+    upper_bound = term[:-1] + chr(ord(term[-1]) + 1)
+    return Q(GreaterThanOrEqual(key, term), LessThan(key, upper_bound), StartsWith(key, term))
+
+
+def prefix_search(queryset, field: str, term: str):
+    """
+    ``queryset`` narrowed by ``prefix_filter`` (when ``term`` is given) and
+    ordered by ``field``.
+    """
+    queryset = queryset.order_by(Upper(field), "pk")
+    term = term.strip()
+    return queryset.filter(prefix_filter(field, term)) if term else queryset
+
+
+SUBSCRIPTION_CREATED_SUBJECT = "Welcome to Kill Bill - Subscription Created"
+SUBSCRIPTION_EXPIRED_SUBJECT = "Subscription Expired"
+INVOICE_SUBJECT = "Invoice {number}: Subscription Renewal Due"
+INVOICE_SUBJECT_RE = re.compile(r"^Invoice (?P<number>\S+): Subscription Renewal Due$")
+
+
+def email_log_fields(message_type, subscription=None, invoice=None) -> dict:
+    """
+    EmailLog fields linking an email to what it is about, for the
+    ``log_fields`` argument of the sending functions. Only ids are read, so
+    no query is made.
+    """
+    if invoice is not None and subscription is None:
+        subscription = invoice.subscription
+    return {
+        "message_type": message_type,
+        "client_id": subscription.client_id if subscription is not None else None,
+        "subscription_id": subscription.pk if subscription is not None else None,
+        "invoice_id": invoice.pk if invoice is not None else None,
+    }
+
+
+def send_and_log_email(subject, message, recipient_list, html_message=None, log_fields=None):
     """
     Sends an email and logs the result in the EmailLog model.
     """
     from .models import EmailLog
 
+    logs = deliver_email(
+        subject, message, recipient_list, html_message=html_message, log_fields=log_fields
+    )
+    EmailLog.objects.bulk_create(logs)
+
+
+def deliver_email(subject, message, recipient_list, html_message=None, log_fields=None) -> list:
+    """
+    Sends an email and returns the (unsaved) EmailLog rows describing the
+    outcome, one per recipient, carrying ``log_fields`` (see
+    ``email_log_fields``). Never touches the database, so it is safe to
+    call from worker threads.
+    """
+    from .models import EmailLog
+
     status = EmailLog.Status.SENT
     error_message = None
 
@@ -34,110 +104,372 @@ def send_and_log_email(subject, message, recipient_list, html_message=None):
         logger.error(f"Failed to send email to {recipient_list}: {e}")
 
     # Log for each recipient
-    for recipient in recipient_list:
-        EmailLog.objects.create(
+    return [
+        EmailLog(
             recipient=recipient,
             subject=subject,
             status=status,
-            error_message=error_message
+            error_message=error_message,
+            **(log_fields or {}),
         )
+        for recipient in recipient_list
+    ]
+
+
+def render_email(subject, template_base, context, recipient_list, log_fields=None) -> dict:
+    """
+    Render the html/txt pair for ``template_base`` into keyword arguments
+    for ``deliver_email``.
+    """
+    return {
+        "subject": subject,
+        "message": render_to_string(f"{template_base}.txt", context),
+        "recipient_list": recipient_list,
+        "html_message": render_to_string(f"{template_base}.html", context),
+        "log_fields": log_fields,
+    }
+
+
+def send_emails_concurrently(jobs, concurrency: int) -> list:
+    """
+    Render and send emails through a bounded thread pool.
+
+    ``jobs`` is a sequence of zero-argument callables returning the keyword
+    arguments for ``deliver_email`` (see ``render_email``). Workers only render
+    and talk to the mail server; the EmailLog rows they produce are written in
+    one batch from the calling thread once every job has finished.
+
+    Returns a list of booleans, in the same order as ``jobs``, telling whether
+    each email was rendered and handed to the mail backend.
+    """
+    from .models import EmailLog
+
+    def run(job):
+        try:
+            payload = job()
+        except Exception as e:
+            logger.error(f"Failed to render email: {e}")
+            return False, []
+        finally:
+            # Rendering should not hit the database, but never leak a
+            # connection opened by a worker thread if it does.
+            connections.close_all()
+        return True, deliver_email(**payload)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        outcomes = list(executor.map(run, jobs))
+
+    EmailLog.objects.bulk_create([log for _, logs in outcomes for log in logs])
+    return [sent for sent, _ in outcomes]
+
 
+# Subscriptions read per query, emails sent per thread-pool batch and
+# subscriptions per worker partition when streaming a billing run.
+STREAM_BATCH_SIZE = 100
 
-def process_expiring_subscriptions(days_before_expiry: int) -> dict:
+
+def process_expiring_subscriptions(
+    days_before_expiry: int, concurrency: int = 1, incremental: bool = False, workers: int = 1
+) -> dict:
     """
     Find all subscriptions expiring within the specified number of days,
     create invoices if needed, and send invoice emails.
-    
-    Returns a summary dict with counts of invoices created and emails sent.
+
+    Runs ``iter_expiring_subscriptions`` to completion. Returns a summary
+    dict with counts of invoices created and emails sent, and every outcome
+    in ``details``.
     """
-    from .models import Invoice, Subscription
+    results = empty_results()
+    results["incremental"] = expiry_watermark(incremental) is not None
+    results["details"] = []
+    for outcome in iter_expiring_subscriptions(
+        days_before_expiry, concurrency=concurrency, incremental=incremental, workers=workers
+    ):
+        tally_outcome(results, outcome)
+        results["details"].append(outcome)
+    return results
 
-    today = timezone.now().date()
+
+def iter_expiring_subscriptions(
+    days_before_expiry: int, concurrency: int = 1, incremental: bool = False, workers: int = 1
+):
+    """
+    Create invoices for, and email, subscriptions expiring within the
+    specified number of days, yielding one outcome dict per subscription
+    (``subscription``, ``client``, ``invoice``, ``action``, ``email_due``,
+    ``email_sent``) as soon as it is handled. Subscriptions are read in
+    chunks and nothing is kept once yielded, so memory does not grow with
+    the run.
+
+    With ``concurrency`` above 1 invoices are still created one at a time,
+    but their emails are rendered and sent through a thread pool of that
+    size, ``STREAM_BATCH_SIZE`` subscriptions at a time. Outcomes keep
+    subscription order either way.
+
+    With ``workers`` above 1 the subscriptions are split into id ranges of
+    ``STREAM_BATCH_SIZE``, processed by that many processes (each with its
+    own ``concurrency`` email threads); outcomes come back in id order.
+
+    Every run records how far it got on ``SiteConfiguration``. With
+    ``incremental`` only subscriptions that entered the window since the
+    last run, or were saved since it started, are looked at; the rest were
+    handled then. Without a previous run the whole window is scanned. The
+    record only moves once the generator is exhausted, so a run that crashed
+    is simply run again; invoices it already created are skipped, and those
+    it had not emailed yet are emailed.
+    """
+    from .models import SiteConfiguration
+
+    started_at = timezone.now()
+    today = started_at.date()
     expiring_date = today + timedelta(days=days_before_expiry)
+    since = expiry_watermark(incremental)
+    subscriptions = expiring_subscriptions(today, expiring_date, since)
+
+    if workers > 1:
+        ids = list(subscriptions.order_by("pk").values_list("pk", flat=True))
+        parts = max(workers, -(-len(ids) // STREAM_BATCH_SIZE))
+        partitions = [
+            (today, expiring_date, since, first, last, concurrency)
+            for first, last in id_ranges(ids, parts)
+        ]
+        # Children open their own connections; never share the parent's.
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=django.setup,
+        ) as executor:
+            for outcomes in executor.map(process_partition, partitions):
+                yield from outcomes
+    else:
+        yield from process_subscriptions(subscriptions, concurrency)
+
+    SiteConfiguration.objects.update(
+        expiry_scanned_through=expiring_date, expiry_scanned_at=started_at
+    )
+
+
+def expiry_watermark(incremental: bool = True):
+    """
+    ``(scanned_through, scanned_at)`` of the last completed run, or None if
+    the whole window should be scanned.
+    """
+    from .models import SiteConfiguration
+
+    config = SiteConfiguration.get_config()
+    if not incremental or config.expiry_scanned_at is None:
+        return None
+    return config.expiry_scanned_through, config.expiry_scanned_at
+
+
+def expiring_subscriptions(today, expiring_date, since=None):
+    """
+    Active subscriptions ending after ``today`` and by ``expiring_date``.
+    ``since`` is the ``(scanned_through, scanned_at)`` watermark of an
+    earlier run; only subscriptions that run did not cover are returned.
+    """
+    from .models import Subscription
 
     # Find subscriptions expiring within the configured days (or less)
-    expiring_subscriptions = Subscription.objects.filter(
+    subscriptions = Subscription.objects.filter(
         end_date__gt=today,  # Not yet expired
         end_date__lte=expiring_date,  # Expiring within configured days or less
         status=Subscription.Status.ACTIVE,
     ).select_related("client", "plan")
+    if since:
+        scanned_through, scanned_at = since
+        subscriptions = subscriptions.filter(
+            Q(end_date__gt=scanned_through) | Q(updated_at__gte=scanned_at)
+        )
+    return subscriptions
+
+
+def id_ranges(ids: list, parts: int) -> list:
+    """Split sorted ``ids`` into at most ``parts`` (first, last) ranges of similar size."""
+    size = max(1, -(-len(ids) // max(1, parts)))
+    chunks = [ids[start:start + size] for start in range(0, len(ids), size)]
+    return [(chunk[0], chunk[-1]) for chunk in chunks]
 
-    results = {
-        "subscriptions_found": expiring_subscriptions.count(),
+
+def process_partition(partition: tuple) -> list:
+    """Worker process entry point: process one id range of expiring subscriptions."""
+    today, expiring_date, since, first, last, concurrency = partition
+    subscriptions = expiring_subscriptions(today, expiring_date, since).filter(
+        pk__gte=first, pk__lte=last
+    )
+    return list(process_subscriptions(subscriptions, concurrency))
+
+
+def empty_results() -> dict:
+    return {
+        "subscriptions_found": 0,
         "invoices_created": 0,
         "invoices_existing": 0,
         "emails_sent": 0,
         "emails_failed": 0,
-        "details": [],
     }
 
-    for subscription in expiring_subscriptions:
-        invoice, created = create_invoice_for_subscription(subscription)
-        
-        if created:
-            results["invoices_created"] += 1
-            # Send email for newly created invoices
-            email_sent = send_invoice_email(subscription, invoice)
-            if email_sent:
-                results["emails_sent"] += 1
-            else:
-                results["emails_failed"] += 1
-            
-            results["details"].append({
-                "client": subscription.client.company_name,
-                "invoice": invoice.invoice_number,
-                "action": "created",
-                "email_sent": email_sent,
-            })
-        else:
-            results["invoices_existing"] += 1
-            results["details"].append({
-                "client": subscription.client.company_name,
-                "invoice": invoice.invoice_number,
-                "action": "already_exists",
-                "email_sent": False,
-            })
 
+def tally_outcome(results: dict, outcome: dict) -> dict:
+    """Add one subscription outcome to the summary counts in ``results``."""
+    results["subscriptions_found"] += 1
+    if outcome["action"] == "created":
+        results["invoices_created"] += 1
+    else:
+        results["invoices_existing"] += 1
+    if outcome["email_due"]:
+        results["emails_sent" if outcome["email_sent"] else "emails_failed"] += 1
     return results
 
 
+def process_subscriptions(subscriptions, concurrency: int = 1):
+    """
+    Create the invoice for, and email, each of ``subscriptions`` that needs
+    one, yielding an outcome dict per subscription in order.
+
+    Invoices are committed before their email goes out. One whose email an
+    earlier run never sent (``Invoice.email_pending``) is emailed again; one
+    created since this run started belongs to a run still going and is left
+    to it.
+    """
+    started_at = timezone.now()
+    batch = []
+    for subscription in subscriptions.iterator(chunk_size=STREAM_BATCH_SIZE):
+        invoice, created = create_invoice_for_subscription(subscription)
+        outcome = {
+            "subscription": subscription.pk,
+            "client": subscription.client.company_name,
+            "invoice": invoice.invoice_number,
+            "action": "created" if created else "already_exists",
+            "email_due": created or (invoice.email_pending and invoice.created_at < started_at),
+            "email_sent": False,
+        }
+        if concurrency > 1:
+            batch.append((outcome, subscription, invoice))
+            if len(batch) == STREAM_BATCH_SIZE:
+                yield from _send_batch(batch, concurrency)
+                batch = []
+            continue
+        if outcome["email_due"]:
+            outcome["email_sent"] = send_invoice_email(subscription, invoice)
+            if outcome["email_sent"]:
+                clear_email_pending([invoice.pk])
+        yield outcome
+
+    yield from _send_batch(batch, concurrency)
+
+
+def _send_batch(batch: list, concurrency: int):
+    """Send a batch's new invoice emails through the thread pool, then yield its outcomes."""
+    pending = [item for item in batch if item[0]["email_due"]]
+    if pending:
+        logo_data_uri = invoice_email_logo()
+        outcomes = send_emails_concurrently(
+            [
+                partial(render_invoice_email, subscription, invoice, logo_data_uri)
+                for _, subscription, invoice in pending
+            ],
+            concurrency,
+        )
+        for (outcome, _, _), email_sent in zip(pending, outcomes):
+            outcome["email_sent"] = email_sent
+        clear_email_pending(
+            [invoice.pk for (_, _, invoice), sent in zip(pending, outcomes) if sent]
+        )
+    for outcome, _, _ in batch:
+        yield outcome
+
+
+def clear_email_pending(invoice_ids):
+    """Record that the emails of ``invoice_ids`` have been sent."""
+    from .models import Invoice
+
+    Invoice.objects.filter(pk__in=invoice_ids, email_pending=True).update(email_pending=False)
+
+
+INVOICE_NUMBER_ATTEMPTS = 10
+
+
 def create_invoice_for_subscription(subscription) -> tuple:
     """
     Create an invoice for the subscription if one doesn't already exist
     for the current billing period (matching due_date = end_date).
-    
+
+    The insert relies on the unique (subscription, due_date) constraint
+    instead of checking first, so concurrent runs over the same
+    subscriptions create each invoice once.
+
     Returns (invoice, created) tuple.
     """
-    from .models import Invoice
+    from .fragments import touch
+    from .models import Invoice, WebhookEvent
+    from .plans import plan_price
+    from .webhooks import record_events
 
-    # Check if invoice already exists for this billing period
-    existing_invoice = Invoice.objects.filter(
-        subscription=subscription,
-        due_date=subscription.end_date,
-    ).first()
+    amount = plan_price(subscription.plan_id, subscription.billing_cycle)
+    period = Invoice.objects.filter(subscription=subscription, due_date=subscription.end_date)
 
-    if existing_invoice:
-        return existing_invoice, False
+    # ON CONFLICT DO NOTHING also swallows a clash on invoice_number, when
+    # another worker took the same number first; try again with the next one.
+    for _ in range(INVOICE_NUMBER_ATTEMPTS):
+        invoice = Invoice(
+            subscription=subscription,
+            invoice_number=Invoice.generate_invoice_number(),
+            amount=amount,
+            issue_date=timezone.now().date(),
+            due_date=subscription.end_date,
+            status=Invoice.Status.UNPAID,
+            email_pending=True,
+        )
+        invoice.status = invoice.compute_status()
+        with transaction.atomic():
+            Invoice.objects.bulk_create([invoice], ignore_conflicts=True)
+            existing = period.first()
+            created = existing is not None and existing.invoice_number == invoice.invoice_number
+            if created:
+                # bulk_create skips Invoice.save(), which keeps these current.
+                existing.billing_clients().refresh_billing_counters()
+                touch(Invoice)
+                record_events(WebhookEvent.Type.INVOICE_CREATED, [existing])
+        if existing is not None:
+            return existing, created
 
-    # Calculate amount based on billing cycle
-    from .models import Subscription
-    
-    plan = subscription.plan
-    if subscription.billing_cycle == Subscription.BillingCycle.MONTHLY:
-        amount = plan.price_monthly
-    else:
-        amount = plan.price_annual
-
-    # Create new invoice
-    invoice = Invoice.objects.create(
-        subscription=subscription,
-        amount=amount,
-        issue_date=timezone.now().date(),
-        due_date=subscription.end_date,
-        status=Invoice.Status.UNPAID,
+    raise IntegrityError(
+        f"Could not allocate an invoice number for subscription {subscription.pk}"
     )
 
-    return invoice, True
+
+def invoice_email_logo() -> str:
+    """The configured logo as an inline data URI for invoice emails, or ""."""
+    from .models import InvoiceConfiguration
+
+    return InvoiceConfiguration.get_config().logo_data_uri
+
+
+def render_invoice_email(subscription, invoice, logo_data_uri=None) -> dict:
+    """
+    Render the invoice reminder email into ``deliver_email`` arguments.
+    Pass ``logo_data_uri`` (see ``invoice_email_logo``) when rendering many
+    emails, or off the main thread, to skip the configuration lookup.
+    """
+    from .models import EmailLog
+
+    if logo_data_uri is None:
+        logo_data_uri = invoice_email_logo()
+    return render_email(
+        subject=INVOICE_SUBJECT.format(number=invoice.invoice_number),
+        template_base="emails/invoice_reminder",
+        context={
+            "subscription": subscription,
+            "invoice": invoice,
+            "logo_data_uri": logo_data_uri,
+        },
+        recipient_list=[subscription.client.email],
+        log_fields=email_log_fields(
+            EmailLog.MessageType.INVOICE_REMINDER, subscription=subscription, invoice=invoice
+        ),
+    )
 
 
 def send_invoice_email(subscription, invoice) -> bool:
@@ -146,17 +478,285 @@ def send_invoice_email(subscription, invoice) -> bool:
     Returns True if email was sent successfully, False otherwise.
     """
     try:
-        context = {"subscription": subscription, "invoice": invoice}
-        html_message = render_to_string("emails/invoice_reminder.html", context)
-        plain_message = render_to_string("emails/invoice_reminder.txt", context)
-
-        send_and_log_email(
-            subject=f"Invoice {invoice.invoice_number}: Subscription Renewal Due",
-            message=plain_message,
-            recipient_list=[subscription.client.email],
-            html_message=html_message,
-        )
+        send_and_log_email(**render_invoice_email(subscription, invoice))
         return True
     except Exception as e:
         logger.error(f"Failed to send invoice email to {subscription.client.email}: {e}")
         return False
+
+
+INVOICE_BULK_ACTIONS = {
+    "mark_paid": "Mark paid",
+    "resend": "Resend invoice email",
+    "mark_overdue": "Mark overdue",
+}
+RESEND_CONCURRENCY = 4
+
+
+def mark_invoices_paid(invoice_ids) -> list:
+    """
+    Mark invoices paid and record a received bank transfer for each, with
+    one UPDATE and one bulk INSERT inside a single transaction. Invoices
+    that are already paid are left alone, so repeating a call is harmless.
+
+    Returns the ids of the invoices paid by this call.
+    """
+    from .fragments import touch
+    from .models import Client, Invoice, Payment, Subscription, WebhookEvent
+    from .webhooks import record_events
+
+    now = timezone.now()
+    with transaction.atomic():
+        unpaid = list(
+            Invoice.objects.select_for_update()
+            .filter(pk__in=invoice_ids)
+            .exclude(status=Invoice.Status.PAID)
+            .order_by("pk")
+            .values_list("pk", "subscription_id", "amount")
+        )
+        if not unpaid:
+            return []
+        paid_ids = [pk for pk, _, _ in unpaid]
+        Invoice.objects.filter(pk__in=paid_ids).update(
+            status=Invoice.Status.PAID, last_reminder_sent_at=now, updated_at=now
+        )
+        payments = Payment.objects.bulk_create(
+            [
+                Payment(
+                    subscription_id=subscription_id,
+                    amount=amount,
+                    payment_date=now.date(),
+                    payment_method=Payment.Method.BANK_TRANSFER,
+                    status=Payment.Status.RECEIVED,
+                )
+                for _, subscription_id, amount in unpaid
+            ]
+        )
+        Client.objects.filter(
+            pk__in=Subscription.objects.filter(
+                pk__in={subscription_id for _, subscription_id, _ in unpaid}
+            ).values("client_id")
+        ).refresh_billing_counters()
+        touch(Invoice)
+        record_events(WebhookEvent.Type.INVOICE_PAID, Invoice.objects.filter(pk__in=paid_ids))
+        record_events(WebhookEvent.Type.PAYMENT_RECEIVED, payments)
+    return paid_ids
+
+
+def mark_invoices_overdue(invoice_ids) -> list:
+    """
+    Mark unpaid invoices whose due date has passed as overdue in one UPDATE.
+    Invoices that are paid, already overdue or not yet due are left alone.
+
+    Returns the ids of the invoices updated by this call.
+    """
+    from .fragments import touch
+    from .models import Invoice, WebhookEvent
+    from .webhooks import record_events
+
+    with transaction.atomic():
+        overdue_ids = list(
+            Invoice.objects.select_for_update()
+            .filter(pk__in=invoice_ids, status=Invoice.Status.UNPAID)
+            .filter_effective_status(Invoice.Status.OVERDUE)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+        if not overdue_ids:
+            return []
+        Invoice.objects.filter(pk__in=overdue_ids).update(
+            status=Invoice.Status.OVERDUE, updated_at=timezone.now()
+        )
+        touch(Invoice)
+        record_events(WebhookEvent.Type.INVOICE_OVERDUE, Invoice.objects.filter(pk__in=overdue_ids))
+    return overdue_ids
+
+
+def expire_subscriptions() -> list:
+    """
+    Store the expired status of active subscriptions whose end date has
+    passed, in one UPDATE, and refresh their clients' counters.
+
+    Returns the ids of the subscriptions updated by this call.
+    """
+    from .fragments import touch
+    from .models import Client, Subscription, WebhookEvent
+    from .webhooks import record_events
+
+    with transaction.atomic():
+        expired_ids = list(
+            Subscription.objects.select_for_update()
+            .filter(status=Subscription.Status.ACTIVE)
+            .filter_effective_status(Subscription.Status.EXPIRED)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        )
+        if not expired_ids:
+            return []
+        Subscription.objects.filter(pk__in=expired_ids).update(
+            status=Subscription.Status.EXPIRED, updated_at=timezone.now()
+        )
+        Client.objects.filter(
+            pk__in=Subscription.objects.filter(pk__in=expired_ids).values("client_id")
+        ).refresh_billing_counters()
+        touch(Subscription)
+        record_events(
+            WebhookEvent.Type.SUBSCRIPTION_EXPIRED, Subscription.objects.filter(pk__in=expired_ids)
+        )
+    return expired_ids
+
+
+def resend_invoice_emails(invoice_ids) -> list:
+    """
+    Email unpaid and overdue invoices to their clients again and stamp
+    ``last_reminder_sent_at``. Paid invoices are skipped.
+
+    Returns the ids of the invoices whose email was sent.
+    """
+    from .models import Invoice
+
+    invoices = list(
+        Invoice.objects.filter(pk__in=invoice_ids)
+        .exclude(status=Invoice.Status.PAID)
+        .select_related("subscription__client", "subscription__plan")
+        .order_by("pk")
+    )
+    logo_data_uri = invoice_email_logo()
+    outcomes = send_emails_concurrently(
+        [
+            partial(render_invoice_email, invoice.subscription, invoice, logo_data_uri)
+            for invoice in invoices
+        ],
+        RESEND_CONCURRENCY,
+    )
+    sent_ids = [invoice.pk for invoice, sent in zip(invoices, outcomes) if sent]
+    now = timezone.now()
+    Invoice.objects.filter(pk__in=sent_ids).update(
+        last_reminder_sent_at=now, email_pending=False, updated_at=now
+    )
+    return sent_ids
+
+
+def run_invoice_bulk_action(action: str, invoice_ids) -> dict:
+    """
+    Apply one of ``INVOICE_BULK_ACTIONS`` to the given invoices.
+
+    Returns ``{"action", "updated", "skipped"}`` where ``updated`` lists the
+    invoices the action changed and ``skipped`` the rest.
+    """
+    handlers = {
+        "mark_paid": mark_invoices_paid,
+        "resend": resend_invoice_emails,
+        "mark_overdue": mark_invoices_overdue,
+    }
+    if action not in handlers:
+        raise ValueError(f"Unknown invoice action: {action}")
+    invoice_ids = sorted(set(invoice_ids))
+    updated = handlers[action](invoice_ids)
+    return {
+        "action": action,
+        "updated": updated,
+        "skipped": sorted(set(invoice_ids) - set(updated)),
+    }
+
+
+EMAIL_BACKFILL_BATCH_SIZE = 1000
+
+
+def _email_log_links(logs) -> dict:
+    """
+    ``{log pk: email_log_fields(...)}`` for the logs in ``logs`` whose
+    subject identifies what they were about, with three queries per batch.
+
+    Invoice reminders name their invoice. Welcome and expiry emails only
+    name the client, by recipient address: they are matched to the
+    client's latest subscription created by then, and to the subscription
+    that ended the day before, respectively.
+    """
+    from .models import Client, EmailLog, Invoice, Subscription
+
+    numbers = {}
+    for log in logs:
+        match = INVOICE_SUBJECT_RE.match(log.subject)
+        if match:
+            numbers[log.pk] = match["number"]
+    invoices = {
+        invoice.invoice_number: invoice
+        for invoice in Invoice.objects.filter(invoice_number__in=numbers.values())
+        .select_related("subscription")
+        .only("invoice_number", "subscription__client")
+    }
+
+    subject_types = {
+        SUBSCRIPTION_CREATED_SUBJECT: EmailLog.MessageType.SUBSCRIPTION_CREATED,
+        SUBSCRIPTION_EXPIRED_SUBJECT: EmailLog.MessageType.SUBSCRIPTION_EXPIRED,
+    }
+    by_recipient = [log for log in logs if log.subject in subject_types]
+    clients = {}
+    for client_id, email in Client.objects.filter(
+        email__in={log.recipient for log in by_recipient}
+    ).values_list("pk", "email"):
+        # An address shared by several clients does not identify one.
+        clients[email] = None if email in clients else client_id
+    subscriptions = {}
+    for subscription in Subscription.objects.filter(
+        client_id__in={pk for pk in clients.values() if pk}
+    ).only("client_id", "created_at", "end_date").order_by("created_at"):
+        subscriptions.setdefault(subscription.client_id, []).append(subscription)
+
+    links = {}
+    for log in logs:
+        invoice = invoices.get(numbers.get(log.pk))
+        if invoice is not None:
+            links[log.pk] = email_log_fields(EmailLog.MessageType.INVOICE_REMINDER, invoice=invoice)
+            continue
+        client_id = clients.get(log.recipient) if log.subject in subject_types else None
+        if client_id is None:
+            continue
+        message_type = subject_types[log.subject]
+        candidates = subscriptions.get(client_id, [])
+        if message_type == EmailLog.MessageType.SUBSCRIPTION_CREATED:
+            candidates = [sub for sub in candidates if sub.created_at <= log.created_at][-1:]
+        else:
+            ended = timezone.localdate(log.created_at) - timedelta(days=1)
+            candidates = [sub for sub in candidates if sub.end_date == ended][:1]
+        subscription = candidates[0] if candidates else None
+        links[log.pk] = {
+            **email_log_fields(message_type, subscription=subscription),
+            "client_id": client_id,
+        }
+    return links
+
+
+def backfill_email_links(batch_size: int = EMAIL_BACKFILL_BATCH_SIZE) -> int:
+    """
+    Fill in the message type, client, subscription and invoice of EmailLog
+    rows written before they were recorded, by parsing their subjects.
+
+    Walks the unlinked rows in primary key order, ``batch_size`` at a time,
+    with one UPDATE per batch, so it can be stopped and rerun at any point.
+    Rows whose subject matches nothing are left as they are.
+
+    Returns the number of rows linked.
+    """
+    from .models import EmailLog
+
+    unlinked = EmailLog.objects.filter(
+        message_type=EmailLog.MessageType.OTHER, client__isnull=True
+    ).only("subject", "recipient", "created_at").order_by("pk")
+    linked = 0
+    last_pk = 0
+    while True:
+        logs = list(unlinked.filter(pk__gt=last_pk)[:batch_size])
+        if not logs:
+            return linked
+        last_pk = logs[-1].pk
+        links = _email_log_links(logs)
+        updates = []
+        for log in logs:
+            if log.pk in links:
+                for field, value in links[log.pk].items():
+                    setattr(log, field, value)
+                updates.append(log)
+        EmailLog.objects.bulk_update(updates, ["message_type", "client", "subscription", "invoice"])
+        linked += len(updates)
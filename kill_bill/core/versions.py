@@ -0,0 +1,99 @@
+"""
+Version counters for the in-process caches, kept in the database.
+
+Processes keep plans, webhook endpoints and page fragments in memory. Each
+cache has a ``CacheVersion`` row that writers move on when their
+transaction commits, and a process reloads its copy once the counter no
+longer matches the one the copy was built from. The counters cannot live
+in the Django cache: unless a shared backend is configured that is private
+to each process too, and the scheduler or another worker would never see
+a change.
+
+A process reads the counters at most once per request or scheduled job
+(``reset`` runs at the start of each), in one query however many caches
+the page uses. A write is seen straight away by the request that made it,
+and by others once it commits.
+"""
+
+from contextvars import ContextVar
+from uuid import uuid4
+
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+from django.db.models import F, Subquery, Value
+from django.db.models.functions import Coalesce
+
+# Counters read by the current request or job, and its own uncommitted
+# bumps. Kept per thread (and per task under ASGI), so no other request
+# builds a cache entry under a bump it cannot see yet, or forgets it.
+_seen: ContextVar[dict] = ContextVar("cache_versions_seen")
+
+
+def _seen_versions() -> dict:
+    try:
+        return _seen.get()
+    except LookupError:
+        seen = {}
+        _seen.set(seen)
+        return seen
+
+
+def reset(**kwargs):
+    """Forget the counters read so far, so the next lookup reads them again."""
+    _seen.set({})
+
+
+def get_versions(*keys) -> dict:
+    """``{key: version}`` for ``keys``, reading the ones not seen yet in one query."""
+    from .models import CacheVersion
+
+    seen = _seen_versions()
+    versions = {key: seen.get(key) for key in keys}
+    missing = [key for key, version in versions.items() if version is None]
+    if missing:
+        rows = dict(
+            CacheVersion.objects.using(DEFAULT_DB_ALIAS)
+            .filter(key__in=missing)
+            .values_list("key", "version")
+        )
+        for key in missing:
+            versions[key] = seen.setdefault(key, str(rows.get(key, 0)))
+    return versions
+
+
+def get_version(key: str) -> str:
+    return get_versions(key)[key]
+
+
+def version_expression(key: str):
+    """The stored counter of ``key`` as an expression, to fold into another query."""
+    from .models import CacheVersion
+
+    return Coalesce(Subquery(CacheVersion.objects.filter(key=key).values("version")), Value(0))
+
+
+def _increment(keys, using):
+    from .models import CacheVersion
+
+    versions = CacheVersion.objects.using(using)
+    for key in keys:
+        if versions.filter(key=key).update(version=F("version") + 1):
+            continue
+        try:
+            with transaction.atomic(using=using):
+                versions.create(key=key, version=1)
+        except IntegrityError:
+            versions.filter(key=key).update(version=F("version") + 1)
+
+
+def bump(*keys, using: str = DEFAULT_DB_ALIAS):
+    """
+    Move the counters of ``keys`` on: for the current request straight
+    away, so the writing transaction sees its own change, and in the
+    database once the transaction commits, so no other request reloads rows
+    it cannot see yet.
+    """
+    local = f"local-{uuid4().hex}"
+    seen = _seen_versions()
+    for key in keys:
+        seen[key] = local
+    transaction.on_commit(lambda: _increment(keys, using), using=using)
@@ -1,58 +1,113 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import json
 from datetime import timedelta
 
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.views import LoginView
-from django.db import models
-from django.http import HttpResponseRedirect
-from django.shortcuts import get_object_or_404, redirect, render
+from django.db import IntegrityError, models, transaction
+from django.db.models import OuterRef, Subquery
+from django.http import Http404, HttpResponseRedirect, JsonResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils import timezone
+from django.utils.http import urlencode
+from django.views.decorators.http import require_POST
 
-from .forms import ClientForm, InvoiceConfigurationForm, InvoiceForm, PaymentForm, SiteConfigurationForm, SubscriptionForm, SubscriptionPlanForm
-from .models import Client, Invoice, InvoiceConfiguration, Payment, SiteConfiguration, Subscription, SubscriptionPlan, get_reminder_invoices
+from .conditional import conditional_page, related_changes
+from .fonts import font_stylesheet_urls
+from .fragments import FRAGMENT_TIMEOUT, afragment_cached, fragment_key, fragment_queryset
+from .forms import BankStatementForm, ClientForm, InvoiceConfigurationForm, InvoiceForm, PaymentForm, SiteConfigurationForm, SubscriptionForm, SubscriptionPlanForm
+from .models import BankStatement, BankStatementLine, Client, EmailLog, IdempotencyKey, Invoice, InvoiceConfiguration, Payment, SiteConfiguration, Subscription, SubscriptionPlan, get_reminder_invoices
+from .plans import attach_plans, get_plan, get_plans, plans_version_expression
+from .replica import read_replica
+from .utils import INVOICE_BULK_ACTIONS, prefix_search
+
+
+IDEMPOTENCY_KEY_TIMEOUT = 60 * 60 * 24
+
+# Most recent emails shown on the client and invoice pages.
+EMAIL_PANEL_LIMIT = 10
+
+CLIENT_SORT_FIELDS = {
+    "company_name",
+    "-outstanding_balance",
+    "-active_subscription_count",
+    "-lifetime_paid",
+}
 
 
 class AdminLoginView(LoginView):
     template_name = "auth/login.html"
 
 
+async def _alist(queryset) -> list:
+    """Evaluate a queryset with the async ORM so templates never hit the database."""
+    return [obj async for obj in queryset]
+
+
 @login_required
-def dashboard(request):
+@read_replica
+async def dashboard(request):
     today = timezone.now().date()
-    active_subscriptions = Subscription.objects.filter(
-        status=Subscription.Status.ACTIVE
-    ).count()
-    expiring_soon_qs = Subscription.objects.filter(
-        status=Subscription.Status.ACTIVE,
-        end_date__range=(today, today + timedelta(days=30)),
+    active_qs = Subscription.objects.filter_effective_status(Subscription.Status.ACTIVE)
+    expiring_soon_qs = active_qs.filter(end_date__lte=today + timedelta(days=30))
+    overdue_invoices_qs = Invoice.objects.filter_effective_status(Invoice.Status.OVERDUE)
+
+    tables_key = await sync_to_async(fragment_key)(Subscription, Client, SubscriptionPlan, Invoice)
+    tables = []
+    if not await afragment_cached("dashboard_tables", tables_key):
+        tables = [
+            _alist(fragment_queryset(expiring_soon_qs.select_related("client", "plan"))),
+            _alist(fragment_queryset(overdue_invoices_qs.select_related("subscription__client"))),
+        ]
+
+    (
+        active_subscriptions,
+        expiring_count,
+        overdue_stats,
+        *tables,
+    ) = await asyncio.gather(
+        active_qs.acount(),
+        expiring_soon_qs.acount(),
+        overdue_invoices_qs.aaggregate(count=models.Count("id"), total=models.Sum("amount")),
+        *tables,
     )
-    expiring_count = expiring_soon_qs.count()
-    overdue_invoices_qs = Invoice.objects.filter(status=Invoice.Status.OVERDUE)
-    overdue_total = overdue_invoices_qs.count()
-    overdue_sum = overdue_invoices_qs.aggregate(total=models.Sum("amount"))["total"] or 0
+    expiring_soon, overdue_invoices = tables or ([], [])
 
     context = {
         "active_subscriptions": active_subscriptions,
         "expiring_count": expiring_count,
-        "overdue_total": overdue_total,
-        "overdue_sum": overdue_sum,
-        "expiring_soon": expiring_soon_qs.select_related("client", "plan"),
-        "overdue_invoices": overdue_invoices_qs.select_related("subscription__client"),
+        "overdue_total": overdue_stats["count"],
+        "overdue_sum": overdue_stats["total"] or 0,
+        "expiring_soon": expiring_soon,
+        "overdue_invoices": overdue_invoices,
+        "tables_key": tables_key,
+        "fragment_timeout": FRAGMENT_TIMEOUT,
     }
     return render(request, "dashboard.html", context)
 
 
 @login_required
+@read_replica
 def client_list(request):
     search = request.GET.get("search", "")
+    sort = request.GET.get("sort", "company_name")
+    if sort not in CLIENT_SORT_FIELDS:
+        sort = "company_name"
     clients = Client.objects.all()
     if search:
         clients = clients.filter(company_name__icontains=search)
-    clients = clients.order_by("company_name")
-    return render(request, "clients/list.html", {"clients": clients, "search": search})
+    clients = clients.order_by(sort)
+    return render(
+        request,
+        "clients/list.html",
+        {"clients": clients, "search": search, "sort": sort},
+    )
 
 
 @login_required
@@ -86,37 +141,68 @@ def client_edit(request, pk):
     )
 
 
-@login_required
-def client_detail(request, pk):
-    client = get_object_or_404(
-        Client.objects.prefetch_related("subscriptions", "subscriptions__plan"), pk=pk
+def _client_state(request, pk):
+    changes = {
+        **related_changes("subscriptions", Subscription.objects.filter(client=OuterRef("pk"))),
+        **related_changes("payments", Payment.objects.filter(subscription__client=OuterRef("pk"))),
+        **related_changes("email_logs", EmailLog.objects.filter(client=OuterRef("pk"))),
+        "plans_version": plans_version_expression(),
+    }
+    state = (
+        Client.objects.filter(pk=pk)
+        .annotate(**changes)
+        .values_list(
+            "updated_at",
+            "outstanding_balance",
+            "active_subscription_count",
+            "lifetime_paid",
+            *changes,
+        )
+        .first()
     )
-    subscriptions = client.subscriptions.select_related("plan").all()
-    payments = Payment.objects.filter(subscription__client=client).select_related(
-        "subscription"
+    return state
+
+
+@login_required
+@conditional_page(_client_state)
+async def client_detail(request, pk):
+    client = await aget_object_or_404(Client, pk=pk)
+    subscriptions, payments, email_logs = await asyncio.gather(
+        _alist(client.subscriptions.select_related("plan")),
+        _alist(
+            Payment.objects.filter(subscription__client=client).select_related(
+                "subscription__plan"
+            )
+        ),
+        _alist(client.email_logs.all()[:EMAIL_PANEL_LIMIT]),
     )
     return render(
         request,
         "clients/detail.html",
-        {"client": client, "subscriptions": subscriptions, "payments": payments},
+        {
+            "client": client,
+            "subscriptions": subscriptions,
+            "payments": payments,
+            "email_logs": email_logs,
+        },
     )
 
 
 @login_required
+@read_replica
 def subscription_list(request):
     filter_value = request.GET.get("status")
     today = timezone.now().date()
-    subscriptions = Subscription.objects.select_related("client", "plan")
+    subscriptions = Subscription.objects.with_effective_status().select_related("client")
     if filter_value == "active":
-        subscriptions = subscriptions.filter(status=Subscription.Status.ACTIVE)
+        subscriptions = subscriptions.filter_effective_status(Subscription.Status.ACTIVE)
     elif filter_value == "expiring":
-        subscriptions = subscriptions.filter(
-            status=Subscription.Status.ACTIVE,
-            end_date__range=(today, today + timedelta(days=30)),
-        )
+        subscriptions = subscriptions.filter_effective_status(
+            Subscription.Status.ACTIVE
+        ).filter(end_date__lte=today + timedelta(days=30))
     elif filter_value == "expired":
-        subscriptions = subscriptions.filter(status=Subscription.Status.EXPIRED)
-    subscriptions = subscriptions.order_by("-start_date")
+        subscriptions = subscriptions.filter_effective_status(Subscription.Status.EXPIRED)
+    subscriptions = attach_plans(subscriptions.order_by("-start_date"))
     return render(
         request,
         "subscriptions/list.html",
@@ -141,13 +227,31 @@ def subscription_create(request):
     )
 
 
+def _subscription_state(request, pk):
+    changes = {
+        **related_changes("invoices", Invoice.objects.filter(subscription=OuterRef("pk"))),
+        **related_changes("payments", Payment.objects.filter(subscription=OuterRef("pk"))),
+        "plans_version": plans_version_expression(),
+    }
+    state = (
+        Subscription.objects.filter(pk=pk)
+        .annotate(**changes)
+        .values_list("updated_at", "client__updated_at", *changes)
+        .first()
+    )
+    return state
+
+
 @login_required
-def subscription_detail(request, pk):
-    subscription = get_object_or_404(
+@conditional_page(_subscription_state)
+async def subscription_detail(request, pk):
+    subscription = await aget_object_or_404(
         Subscription.objects.select_related("client", "plan"), pk=pk
     )
-    invoices = subscription.invoices.select_related("subscription__client")
-    payments = subscription.payments.all()
+    invoices, payments = await asyncio.gather(
+        _alist(subscription.invoices.select_related("subscription__client")),
+        _alist(subscription.payments.all()),
+    )
     return render(
         request,
         "subscriptions/detail.html",
@@ -160,6 +264,7 @@ def subscription_detail(request, pk):
 
 
 @login_required
+@read_replica
 def payment_list(request):
     payments = Payment.objects.select_related("subscription__client")
     client_id = request.GET.get("client")
@@ -214,18 +319,21 @@ def payment_create(request):
 
 
 @login_required
+@read_replica
 def invoice_list(request):
     status_filter = request.GET.get("status")
-    invoices = Invoice.objects.select_related("subscription__client")
-    if status_filter in {Invoice.Status.UNPAID, Invoice.Status.PAID, Invoice.Status.OVERDUE}:
-        invoices = invoices.filter(status=status_filter)
-    elif status_filter == "overdue":
-        invoices = invoices.filter(status=Invoice.Status.OVERDUE)
+    invoices = Invoice.objects.with_effective_status().select_related("subscription__client")
+    if status_filter in Invoice.Status.values:
+        invoices = invoices.filter_effective_status(status_filter)
     invoices = invoices.order_by("-issue_date")
     return render(
         request,
         "invoices/list.html",
-        {"invoices": invoices, "status_filter": status_filter},
+        {
+            "invoices": invoices,
+            "status_filter": status_filter,
+            "bulk_actions": INVOICE_BULK_ACTIONS.items(),
+        },
     )
 
 
@@ -254,7 +362,36 @@ def invoice_create(request):
     )
 
 
+def _invoice_state(request, pk, *extra):
+    state = (
+        Invoice.objects.filter(pk=pk)
+        .values_list(
+            "updated_at",
+            "subscription__updated_at",
+            "subscription__client__updated_at",
+            plans_version_expression(),
+            *extra,
+        )
+        .first()
+    )
+    return state
+
+
+def _invoice_detail_state(request, pk):
+    changes = related_changes("email_logs", EmailLog.objects.filter(invoice=OuterRef("pk")))
+    return _invoice_state(request, pk, *changes.values())
+
+
+def _invoice_print_state(request, pk):
+    return _invoice_state(
+        request,
+        pk,
+        Subquery(InvoiceConfiguration.objects.filter(pk=1).values("updated_at")),
+    )
+
+
 @login_required
+@conditional_page(_invoice_print_state)
 def invoice_print(request, pk):
     invoice = get_object_or_404(
         Invoice.objects.select_related("subscription__client", "subscription__plan"), pk=pk
@@ -267,28 +404,22 @@ def invoice_print(request, pk):
 
 
 @login_required
+@conditional_page(_invoice_detail_state)
 def invoice_detail(request, pk):
     invoice = get_object_or_404(
         Invoice.objects.select_related("subscription__client"), pk=pk
     )
-    return render(request, "invoices/detail.html", {"invoice": invoice})
+    email_logs = invoice.email_logs.all()[:EMAIL_PANEL_LIMIT]
+    return render(request, "invoices/detail.html", {"invoice": invoice, "email_logs": email_logs})
 
 
 @login_required
 def invoice_mark_paid(request, pk):
+    from .utils import mark_invoices_paid
+
     invoice = get_object_or_404(Invoice, pk=pk)
     if request.method == "POST":
-        if invoice.status != Invoice.Status.PAID:
-            invoice.status = Invoice.Status.PAID
-            invoice.last_reminder_sent_at = timezone.now()
-            invoice.save()
-            Payment.objects.create(
-                subscription=invoice.subscription,
-                amount=invoice.amount,
-                payment_date=timezone.now().date(),
-                payment_method=Payment.Method.BANK_TRANSFER,
-                status=Payment.Status.RECEIVED,
-            )
+        if mark_invoices_paid([invoice.pk]):
             messages.success(request, "Invoice marked as paid and payment recorded")
         else:
             messages.info(request, "Invoice already marked as paid")
@@ -296,21 +427,247 @@ def invoice_mark_paid(request, pk):
 
 
 @login_required
-def reminders(request):
-    upcoming, overdue = get_reminder_invoices()
+@require_POST
+def invoice_bulk_action(request):
+    from .utils import run_invoice_bulk_action
+
+    action = request.POST.get("action")
+    invoice_ids = [value for value in request.POST.getlist("invoices") if value.isdigit()]
+    if action not in INVOICE_BULK_ACTIONS:
+        messages.error(request, "Choose an action to apply")
+    elif not invoice_ids:
+        messages.error(request, "Select at least one invoice")
+    else:
+        result = run_invoice_bulk_action(action, [int(pk) for pk in invoice_ids])
+        messages.success(
+            request,
+            f"{INVOICE_BULK_ACTIONS[action]}: {len(result['updated'])} invoice(s) updated, "
+            f"{len(result['skipped'])} skipped",
+        )
+    status_filter = request.POST.get("status_filter")
+    url = reverse("invoice_list")
+    if status_filter:
+        url += "?" + urlencode({"status": status_filter})
+    return HttpResponseRedirect(url)
+
+
+@login_required
+@require_POST
+def invoice_bulk_api(request):
+    """
+    JSON bulk invoice actions: ``{"action": "mark_paid", "invoices": [1, 2]}``.
+
+    mark_paid and mark_overdue are idempotent by nature. Send an
+    ``Idempotency-Key`` header to make retries of any action, including
+    resend, return the first response instead of running it again. Reusing
+    a key for a different request is refused with 422, and a retry that
+    arrives while the first request is still running with 409.
+    """
+    from .utils import run_invoice_bulk_action
+
+    try:
+        payload = json.loads(request.body)
+        action = payload["action"]
+        if not isinstance(payload["invoices"], list):
+            raise TypeError("invoices must be a list")
+        invoice_ids = [int(pk) for pk in payload["invoices"]]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse(
+            {"error": 'Expected {"action": ..., "invoices": [ids]}'}, status=400
+        )
+    if action not in INVOICE_BULK_ACTIONS:
+        return JsonResponse(
+            {"error": f"Unknown action, expected one of: {', '.join(INVOICE_BULK_ACTIONS)}"},
+            status=400,
+        )
+
+    idempotency_key = request.headers.get("Idempotency-Key")
+    if not idempotency_key:
+        return JsonResponse(run_invoice_bulk_action(action, invoice_ids))
+    if len(idempotency_key) > IdempotencyKey._meta.get_field("key").max_length:
+        return JsonResponse({"error": "Idempotency-Key is too long"}, status=400)
+
+    IdempotencyKey.objects.filter(
+        created_at__lt=timezone.now() - timedelta(seconds=IDEMPOTENCY_KEY_TIMEOUT)
+    ).delete()
+    # Hash the parsed body, so a retry that serializes it differently matches.
+    body_hash = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+    try:
+        # The unique (user, key) constraint lets one request claim the key.
+        with transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                user=request.user, key=idempotency_key, body_hash=body_hash
+            )
+    except IntegrityError:
+        record = IdempotencyKey.objects.get(user=request.user, key=idempotency_key)
+        if record.body_hash != body_hash:
+            return JsonResponse(
+                {"error": "Idempotency-Key was already used for a different request"},
+                status=422,
+            )
+        if record.response is None:
+            return JsonResponse(
+                {"error": "A request with this Idempotency-Key is still running"}, status=409
+            )
+        return JsonResponse(record.response)
+
+    try:
+        result = run_invoice_bulk_action(action, invoice_ids)
+    except Exception:
+        # Let a retry run the action once more.
+        record.delete()
+        raise
+    record.response = result
+    record.save(update_fields=["response", "updated_at"])
+    return JsonResponse(result)
+
+
+@login_required
+def reconciliation_upload(request):
+    from .reconciliation import reconcile_statement
+
+    if request.method == "POST":
+        form = BankStatementForm(request.POST, request.FILES)
+        if form.is_valid():
+            statement = reconcile_statement(
+                form.cleaned_data["statement"].name, form.cleaned_data["rows"]
+            )
+            matched = statement.lines.filter(status=BankStatementLine.Status.MATCHED).count()
+            messages.success(
+                request,
+                f"Imported {len(form.cleaned_data['rows'])} line(s), {matched} matched and paid",
+            )
+            return redirect("reconciliation_review", pk=statement.pk)
+    else:
+        form = BankStatementForm()
+    statements = BankStatement.objects.annotate(
+        line_count=models.Count("lines"),
+        review_count=models.Count(
+            "lines", filter=models.Q(lines__status=BankStatementLine.Status.AMBIGUOUS)
+        ),
+    )[:20]
+    return render(
+        request,
+        "reconciliation/upload.html",
+        {"form": form, "statements": statements},
+    )
+
+
+@login_required
+def reconciliation_review(request, pk):
+    from .reconciliation import OPEN_STATUSES, apply_matches
+
+    statement = get_object_or_404(BankStatement, pk=pk)
+    pending = statement.lines.filter(
+        status__in=[BankStatementLine.Status.AMBIGUOUS, BankStatementLine.Status.UNMATCHED]
+    )
+
+    if request.method == "POST":
+        pending = list(pending)
+        choices = {line.pk: request.POST.get(f"line-{line.pk}", "") for line in pending}
+        # Unmatched lines can be assigned by typing an invoice number instead
+        numbers = {
+            line.pk: request.POST.get(f"number-{line.pk}", "").strip().upper()
+            for line in pending
+        }
+        open_invoices = dict(
+            Invoice.objects.filter(status__in=OPEN_STATUSES)
+            .filter(
+                models.Q(pk__in=[int(choice) for choice in choices.values() if choice.isdigit()])
+                | models.Q(invoice_number__in=[number for number in numbers.values() if number])
+            )
+            .values_list("pk", "invoice_number")
+        )
+        pks_by_number = {number: pk for pk, number in open_invoices.items()}
+
+        to_apply = []
+        ignored = []
+        for line in pending:
+            choice = choices[line.pk]
+            if choice == "ignore":
+                line.status = BankStatementLine.Status.IGNORED
+                ignored.append(line)
+            elif choice.isdigit() and int(choice) in open_invoices:
+                line.invoice_id = int(choice)
+                to_apply.append(line)
+            elif numbers[line.pk] in pks_by_number:
+                line.invoice_id = pks_by_number[numbers[line.pk]]
+                to_apply.append(line)
+        BankStatementLine.objects.bulk_update(ignored, ["status"])
+        paid = apply_matches(to_apply)
+        messages.success(request, f"Marked {paid} invoice(s) paid, ignored {len(ignored)} line(s)")
+        return redirect("reconciliation_review", pk=statement.pk)
+
+    return render(
+        request,
+        "reconciliation/review.html",
+        {
+            "statement": statement,
+            "pending": pending.prefetch_related("candidates__subscription__client"),
+            "matched": statement.lines.filter(
+                status=BankStatementLine.Status.MATCHED
+            ).select_related("invoice__subscription__client"),
+        },
+    )
+
+
+@login_required
+@read_replica
+async def reminders(request):
+    tables_key = await sync_to_async(fragment_key)(Invoice, Subscription, Client)
+    upcoming, overdue = [], []
+    if not await afragment_cached("reminder_tables", tables_key):
+        upcoming, overdue = get_reminder_invoices()
+        upcoming, overdue = await asyncio.gather(
+            _alist(fragment_queryset(upcoming.select_related("subscription__client"))),
+            _alist(fragment_queryset(overdue.select_related("subscription__client"))),
+        )
     return render(
         request,
         "reminders.html",
         {
-            "upcoming": upcoming.select_related("subscription__client"),
-            "overdue": overdue.select_related("subscription__client"),
+            "upcoming": upcoming,
+            "overdue": overdue,
+            "tables_key": tables_key,
+            "fragment_timeout": FRAGMENT_TIMEOUT,
         },
     )
 
 
+AUTOCOMPLETE_LIMIT = 20
+
+
+@login_required
+@read_replica
+def autocomplete_clients(request):
+    clients = prefix_search(Client.objects.all(), "company_name", request.GET.get("q", ""))
+    results = clients.values_list("pk", "company_name")[:AUTOCOMPLETE_LIMIT]
+    return JsonResponse({"results": [{"id": pk, "text": name} for pk, name in results]})
+
+
+@login_required
+@read_replica
+def autocomplete_subscriptions(request):
+    """Subscriptions by client name prefix; ``client`` limits to one client's active ones."""
+    subscriptions = Subscription.objects.all()
+    client_id = request.GET.get("client", "")
+    if client_id.isdigit():
+        # The same choices PaymentForm offers once a client is picked.
+        subscriptions = subscriptions.filter(
+            client_id=client_id, status=Subscription.Status.ACTIVE
+        )
+    subscriptions = prefix_search(
+        subscriptions.select_related("client"), "client__company_name", request.GET.get("q", "")
+    )
+    results = attach_plans(subscriptions[:AUTOCOMPLETE_LIMIT])
+    return JsonResponse(
+        {"results": [{"id": subscription.pk, "text": str(subscription)} for subscription in results]}
+    )
+
+
 @login_required
 def plan_list(request):
-    plans = SubscriptionPlan.objects.all().order_by("name")
+    plans = list(get_plans().values())
     return render(request, "plans/list.html", {"plans": plans})
 
 
@@ -347,7 +704,9 @@ def plan_edit(request, pk):
 
 @login_required
 def plan_detail(request, pk):
-    plan = get_object_or_404(SubscriptionPlan, pk=pk)
+    plan = get_plan(pk)
+    if plan is None:
+        raise Http404("No SubscriptionPlan matches the given query.")
     subscriptions = Subscription.objects.filter(plan=plan).select_related("client")
     active_count = subscriptions.filter(status=Subscription.Status.ACTIVE).count()
     return render(
@@ -358,6 +717,7 @@ def plan_detail(request, pk):
 
 
 @login_required
+@read_replica
 def email_log_list(request):
     from .models import EmailLog
     email_logs = EmailLog.objects.all()
@@ -384,7 +744,9 @@ def settings_view(request):
                 site_config = site_form.save()
                 
                 # Process expiring subscriptions with the new config
-                results = process_expiring_subscriptions(site_config.invoice_days_before_expiry)
+                results = process_expiring_subscriptions(
+                    site_config.invoice_days_before_expiry, incremental=True
+                )
                 
                 if results["invoices_created"] > 0:
                     messages.success(
@@ -420,4 +782,5 @@ def settings_view(request):
         "invoice_config": invoice_config,
         "results": results,
         "active_tab": active_tab,
+        "font_urls": font_stylesheet_urls(),
     })
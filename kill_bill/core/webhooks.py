@@ -0,0 +1,245 @@
+"""
+Outgoing webhooks for billing events.
+
+Code that changes billing state calls ``record_events`` inside its own
+transaction. That stores a ``WebhookEvent`` plus one pending
+``WebhookDelivery`` per interested endpoint; nothing is sent while the
+triggering request runs.
+
+``dispatch_webhooks`` (the ``dispatch_webhooks`` command, run by the
+scheduler) posts the pending deliveries. Endpoints are handled in
+parallel; each endpoint gets its events one at a time, in order, over one
+connection, signed with its secret. A failed delivery is retried with
+backoff and holds back that endpoint's later events until it gets through
+or is given up. Delivery is at least once: receivers should ignore a
+repeated ``X-KillBill-Delivery`` id.
+"""
+
+import hashlib
+import hmac
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+from urllib.parse import urlsplit
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+from .versions import bump, get_version
+
+ENDPOINTS_VERSION_KEY = "webhook-endpoints"
+
+WEBHOOK_BATCH_SIZE = 100
+WEBHOOK_CONCURRENCY = 4
+WEBHOOK_TIMEOUT = 10
+WEBHOOK_MAX_ATTEMPTS = 10
+WEBHOOK_RETRY_BASE = timedelta(seconds=30)
+WEBHOOK_RETRY_MAX = timedelta(hours=6)
+
+# Fields sent as the event's ``data`` for each kind of object.
+EVENT_FIELDS = {
+    "invoice": ["id", "invoice_number", "subscription", "amount", "issue_date", "due_date", "status"],
+    "subscription": ["id", "client", "plan", "billing_cycle", "start_date", "end_date", "status"],
+    "payment": ["id", "subscription", "amount", "payment_date", "payment_method", "status"],
+}
+
+_lock = threading.Lock()
+_loaded = (None, [])
+
+
+def active_endpoints() -> list:
+    """Active endpoints, cached in process like the plans (see core/plans.py)."""
+    global _loaded
+    version = get_version(ENDPOINTS_VERSION_KEY)
+    if _loaded[0] == version:
+        return _loaded[1]
+
+    from .models import WebhookEndpoint
+
+    with _lock:
+        if _loaded[0] != version:
+            endpoints = list(
+                WebhookEndpoint.objects.using(DEFAULT_DB_ALIAS).filter(is_active=True).order_by("pk")
+            )
+            _loaded = (version, endpoints)
+        return _loaded[1]
+
+
+def invalidate_endpoints(using: str = DEFAULT_DB_ALIAS):
+    """Make every process reload its endpoints, as ``invalidate_plans`` does."""
+    bump(ENDPOINTS_VERSION_KEY, using=using)
+
+
+def event_data(obj) -> dict:
+    """JSON-ready ``EVENT_FIELDS`` of an invoice, subscription or payment."""
+    name = obj._meta.model_name
+    data = {"object": name}
+    for field_name in EVENT_FIELDS[name]:
+        field = obj._meta.get_field(field_name)
+        # to_python() turns the datetime default of a fresh issue_date into a date.
+        data[field_name] = field.to_python(getattr(obj, field.attname))
+    return json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+
+
+def record_events(event_type: str, objects) -> int:
+    """
+    Queue an ``event_type`` event for each of ``objects`` for every active
+    endpoint that wants it. Call inside the transaction making the change.
+    Without such endpoints this does not touch the database.
+    """
+    from .models import WebhookDelivery, WebhookEvent
+
+    endpoints = [endpoint for endpoint in active_endpoints() if endpoint.wants(event_type)]
+    if not endpoints:
+        return 0
+    events = WebhookEvent.objects.bulk_create(
+        [WebhookEvent(type=event_type, data=event_data(obj)) for obj in objects]
+    )
+    WebhookDelivery.objects.bulk_create(
+        [
+            WebhookDelivery(endpoint_id=endpoint.pk, event=event)
+            for event in events
+            for endpoint in endpoints
+        ]
+    )
+    return len(events)
+
+
+def sign(secret: str, timestamp: str, body: bytes) -> str:
+    """``X-KillBill-Signature`` value: HMAC-SHA256 of "<timestamp>.<body>"."""
+    digest = hmac.new(secret.encode(), timestamp.encode() + b"." + body, hashlib.sha256)
+    return f"t={timestamp},v1={digest.hexdigest()}"
+
+
+def verify_signature(secret: str, header: str, body: bytes, tolerance: int = 300) -> bool:
+    """Check a signature header the way a receiver should."""
+    try:
+        parts = dict(part.split("=", 1) for part in header.split(","))
+        timestamp = parts["t"]
+        fresh = abs(time.time() - int(timestamp)) <= tolerance
+    except (KeyError, ValueError):
+        return False
+    return fresh and hmac.compare_digest(sign(secret, timestamp, body), header)
+
+
+def event_body(event) -> bytes:
+    return json.dumps(
+        {"id": event.pk, "type": event.type, "created_at": event.created_at, "data": event.data},
+        cls=DjangoJSONEncoder,
+    ).encode()
+
+
+def post_batch(url: str, secret: str, requests: list) -> list:
+    """
+    POST ``(delivery_id, event_type, body)`` requests to ``url`` in order
+    over one connection, stopping at the first failure. Runs in a worker
+    thread and does not touch the database.
+
+    Returns ``(delivery_id, status_code, error)`` for each request tried.
+    """
+    parts = urlsplit(url)
+    connection_class = HTTPSConnection if parts.scheme == "https" else HTTPConnection
+    connection = connection_class(parts.netloc, timeout=WEBHOOK_TIMEOUT)
+    path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    outcomes = []
+    try:
+        for delivery_id, event_type, body in requests:
+            headers = {
+                "Content-Type": "application/json",
+                "User-Agent": "KillBill-Webhooks/1.0",
+                "X-KillBill-Event": event_type,
+                "X-KillBill-Delivery": str(delivery_id),
+                "X-KillBill-Signature": sign(secret, str(int(time.time())), body),
+            }
+            try:
+                connection.request("POST", path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                status_code = response.status
+                error = "" if 200 <= status_code < 300 else f"HTTP {status_code}"
+            except (OSError, HTTPException) as e:
+                status_code, error = None, str(e) or e.__class__.__name__
+            outcomes.append((delivery_id, status_code, error))
+            if error:
+                break
+    finally:
+        connection.close()
+    return outcomes
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return min(WEBHOOK_RETRY_BASE * 2 ** (attempts - 1), WEBHOOK_RETRY_MAX)
+
+
+def due_batches(batch_size: int) -> list:
+    """For each endpoint whose oldest pending delivery is due, its next deliveries in order."""
+    from .models import WebhookDelivery, WebhookEndpoint
+
+    now = timezone.now()
+    batches = []
+    endpoints = WebhookEndpoint.objects.filter(
+        is_active=True, deliveries__status=WebhookDelivery.Status.PENDING
+    ).distinct()
+    for endpoint in endpoints:
+        deliveries = list(
+            endpoint.deliveries.filter(status=WebhookDelivery.Status.PENDING)
+            .select_related("event")
+            .order_by("pk")[:batch_size]
+        )
+        if deliveries and deliveries[0].next_attempt_at <= now:
+            batches.append((endpoint, deliveries))
+    return batches
+
+
+def dispatch_webhooks(
+    batch_size: int = WEBHOOK_BATCH_SIZE, concurrency: int = WEBHOOK_CONCURRENCY
+) -> dict:
+    """
+    Deliver every pending delivery that is due, ``batch_size`` per endpoint
+    per round and ``concurrency`` endpoints at a time, until none are left.
+
+    Returns counts of deliveries ``delivered``, ``retrying`` and ``failed``.
+    """
+    from .models import WebhookDelivery
+
+    counts = {"delivered": 0, "retrying": 0, "failed": 0}
+    while batches := due_batches(batch_size):
+        deliveries = {}
+        jobs = []
+        for endpoint, batch in batches:
+            deliveries.update((delivery.pk, delivery) for delivery in batch)
+            requests = [
+                (delivery.pk, delivery.event.type, event_body(delivery.event)) for delivery in batch
+            ]
+            jobs.append((endpoint.url, endpoint.secret, requests))
+
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            results = list(executor.map(lambda job: post_batch(*job), jobs))
+
+        now = timezone.now()
+        updated = []
+        for delivery_id, status_code, error in (outcome for result in results for outcome in result):
+            delivery = deliveries[delivery_id]
+            delivery.attempts += 1
+            delivery.last_status_code = status_code
+            delivery.last_error = error[:1000]
+            if not error:
+                delivery.status = WebhookDelivery.Status.DELIVERED
+                delivery.delivered_at = now
+                counts["delivered"] += 1
+            elif delivery.attempts >= WEBHOOK_MAX_ATTEMPTS:
+                delivery.status = WebhookDelivery.Status.FAILED
+                counts["failed"] += 1
+            else:
+                delivery.next_attempt_at = now + retry_delay(delivery.attempts)
+                counts["retrying"] += 1
+            updated.append(delivery)
+        WebhookDelivery.objects.bulk_update(
+            updated,
+            ["status", "attempts", "next_attempt_at", "last_status_code", "last_error", "delivered_at"],
+        )
+    return counts
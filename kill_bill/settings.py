@@ -48,12 +48,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "whitenoise.middleware.WhiteNoiseMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "kill_bill.core.replica.ReplicaStickinessMiddleware",
 ]
 
 ROOT_URLCONF = "kill_bill.urls"
@@ -62,13 +64,23 @@ TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
         "DIRS": [BASE_DIR / "kill_bill" / "templates"],
-        "APP_DIRS": True,
         "OPTIONS": {
             "context_processors": [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
             ],
+            # Same as APP_DIRS, except that HTML email templates are loaded
+            # with their CSS inlined (see core/email_templates.py).
+            "loaders": [
+                (
+                    "django.template.loaders.cached.Loader",
+                    [
+                        "kill_bill.core.email_templates.Loader",
+                        "django.template.loaders.app_directories.Loader",
+                    ],
+                ),
+            ],
         },
     },
 ]
@@ -80,23 +92,66 @@ WSGI_APPLICATION = "kill_bill.wsgi.application"
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
 
+# Connection-management options accepted in the DATABASE_URL query string.
+# Everything else in the query string is passed through as driver OPTIONS.
+#   conn_max_age=<seconds>|none   keep connections open between requests
+#   conn_health_checks=true       check persistent connections before reuse
+#   pool=true                     use a psycopg connection pool (PostgreSQL)
+#   pool_min_size / pool_max_size / pool_timeout   size and tune that pool
+DATABASE_URL_POOL_OPTIONS = {"min_size": int, "max_size": int, "timeout": float}
+
+
+def _parse_bool(value: str) -> bool:
+    return value.lower() in {"1", "true", "yes", "on"}
+
+
 def parse_database_url(database_url: str):
     result = urlparse(database_url)
-    if result.scheme.startswith("postgres"):
-        engine = "django.db.backends.postgresql"
-    else:
-        raise ValueError("Only PostgreSQL databases are supported")
     options = dict(parse_qsl(result.query))
-    return {
-        "ENGINE": engine,
-        "NAME": result.path.lstrip("/"),
-        "USER": result.username,
-        "PASSWORD": result.password,
-        "HOST": result.hostname,
-        "PORT": result.port or "",
-        "OPTIONS": options,
+
+    conn_max_age = options.pop("conn_max_age", "0")
+    conn_health_checks = _parse_bool(options.pop("conn_health_checks", "false"))
+    pool = _parse_bool(options.pop("pool", "false"))
+    pool_options = {
+        name: cast(options.pop(f"pool_{name}"))
+        for name, cast in DATABASE_URL_POOL_OPTIONS.items()
+        if f"pool_{name}" in options
     }
 
+    if result.scheme.startswith("postgres"):
+        config = {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": result.path.lstrip("/"),
+            "USER": result.username,
+            "PASSWORD": result.password,
+            "HOST": result.hostname,
+            "PORT": result.port or "",
+        }
+        if pool or pool_options:
+            options["pool"] = pool_options or True
+    elif result.scheme == "sqlite":
+        # sqlite:///relative/to/project.sqlite3 or sqlite:////absolute/path.sqlite3
+        if pool or pool_options:
+            raise ValueError("Connection pooling is only supported for PostgreSQL")
+        config = {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / result.path[1:],
+        }
+    else:
+        raise ValueError("Only PostgreSQL and SQLite databases are supported")
+
+    if "pool" in options and conn_max_age != "0":
+        raise ValueError("conn_max_age cannot be combined with a connection pool")
+
+    config.update(
+        {
+            "CONN_MAX_AGE": None if conn_max_age.lower() == "none" else int(conn_max_age),
+            "CONN_HEALTH_CHECKS": conn_health_checks,
+            "OPTIONS": options,
+        }
+    )
+    return config
+
 
 DATABASES = {
     "default": {
@@ -109,6 +164,63 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if DATABASE_URL:
     DATABASES["default"] = parse_database_url(DATABASE_URL)
 
+# Optional read replica. Read-only views (see kill_bill.core.replica) send
+# their queries here; everything else, and every write, uses "default".
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+if DATABASE_REPLICA_URL:
+    DATABASES["replica"] = parse_database_url(DATABASE_REPLICA_URL)
+    DATABASES["replica"]["TEST"] = {"MIRROR": "default"}
+
+DATABASE_ROUTERS = ["kill_bill.core.replica.ReplicaRouter"]
+
+# After a write, keep the same browser on the primary for this many seconds
+# so it reads its own writes even if the replica lags behind.
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", 15))
+
+
+# A cache shared by every process and node: redis://host:6379/0 or
+# memcached://host:11211. Without one, each process has its own local-memory
+# cache, which is fine for caches whose versions live in the database (see
+# kill_bill.core.versions) but not for sessions or logins.
+CACHE_URL = os.getenv("CACHE_URL", "")
+if CACHE_URL.startswith(("redis://", "rediss://")):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_URL,
+        }
+    }
+elif CACHE_URL.startswith("memcached://"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.memcached.PyMemcacheCache",
+            "LOCATION": CACHE_URL.removeprefix("memcached://"),
+        }
+    }
+elif CACHE_URL:
+    raise ValueError(f"Unsupported CACHE_URL scheme: {CACHE_URL}")
+
+# With a shared cache, sessions are read from the cache and written through
+# to the database, and the logged-in user is cached too (see
+# kill_bill.core.auth), so a page view normally costs no session or user
+# query. A per-process cache would let a logout or a deactivated user go
+# unnoticed by the other processes, so without one both stay in the
+# database. Where keeping session data in the browser is acceptable,
+# SESSION_ENGINE=django.contrib.sessions.backends.signed_cookies removes the
+# session table from the request path altogether.
+SESSION_ENGINE = os.getenv(
+    "SESSION_ENGINE",
+    "django.contrib.sessions.backends.cached_db"
+    if CACHE_URL
+    else "django.contrib.sessions.backends.db",
+)
+
+AUTHENTICATION_BACKENDS = [
+    "kill_bill.core.auth.CachedModelBackend"
+    if CACHE_URL
+    else "django.contrib.auth.backends.ModelBackend"
+]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -148,6 +260,22 @@ STATIC_URL = "static/"
 STATICFILES_DIRS = [BASE_DIR / "kill_bill" / "static"]
 STATIC_ROOT = BASE_DIR / "staticfiles"
 
+# collectstatic writes content-hashed copies of every file plus gzip and
+# brotli variants; WhiteNoise serves hashed files with far-future cache
+# headers. Development keeps plain names so no collectstatic run is needed.
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": (
+            "django.contrib.staticfiles.storage.StaticFilesStorage"
+            if DEBUG
+            else "whitenoise.storage.CompressedManifestStaticFilesStorage"
+        ),
+    },
+}
+
 # Media files (User uploads)
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
@@ -168,3 +296,13 @@ EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS", "True") == "True"
 EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER", "")
 EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD", "")
 DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "Kill Bill <noreply@killbill.com>")
+
+# Jobs run by `manage.py run_scheduler`: command name -> {"at": "HH:MM"}
+# (daily, local time) or {"every": minutes}, plus optional "args" and
+# "lease_seconds". See kill_bill.core.scheduler.
+SCHEDULED_JOBS = {
+    "send_subscription_emails": {"at": os.getenv("SUBSCRIPTION_EMAILS_AT", "06:00")},
+    "daily_reminders": {"at": os.getenv("DAILY_REMINDERS_AT", "07:00")},
+    "record_lapsed_statuses": {"every": int(os.getenv("RECORD_LAPSED_STATUSES_EVERY", 60))},
+    "dispatch_webhooks": {"every": int(os.getenv("DISPATCH_WEBHOOKS_EVERY", 1))},
+}
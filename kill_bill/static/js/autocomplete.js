@@ -0,0 +1,60 @@
+// Search-as-you-type for <select data-autocomplete-url> (forms.AutocompleteSelect).
+// The select is rendered with only its current choice; typing in the search
+// box above it fetches matching options from the autocomplete endpoint.
+document.addEventListener('DOMContentLoaded', () => {
+    document.querySelectorAll('select[data-autocomplete-url]').forEach(select => {
+        const search = document.createElement('input');
+        search.type = 'search';
+        search.className = 'input mb-2';
+        search.placeholder = 'Type to search…';
+        search.autocomplete = 'off';
+        const wrapper = select.closest('.select') || select;
+        wrapper.parentNode.insertBefore(search, wrapper);
+
+        const forward = (select.dataset.autocompleteForward || '')
+            .split(',')
+            .filter(name => name);
+        let timer = null;
+        let controller = null;
+
+        const load = () => {
+            const params = new URLSearchParams({ q: search.value.trim() });
+            forward.forEach(name => {
+                const other = select.form && select.form.elements[name];
+                if (other && other.value) params.set(name, other.value);
+            });
+            if (controller) controller.abort();
+            controller = new AbortController();
+            fetch(`${select.dataset.autocompleteUrl}?${params}`, {
+                credentials: 'same-origin',
+                signal: controller.signal,
+            })
+                .then(response => response.json())
+                .then(data => {
+                    const selected = select.value;
+                    Array.from(select.options)
+                        .filter(option => option.value && option.value !== selected)
+                        .forEach(option => option.remove());
+                    data.results.forEach(result => {
+                        if (String(result.id) === selected) return;
+                        select.add(new Option(result.text, result.id));
+                    });
+                })
+                .catch(error => {
+                    if (error.name !== 'AbortError') throw error;
+                });
+        };
+
+        search.addEventListener('input', () => {
+            clearTimeout(timer);
+            timer = setTimeout(load, 250);
+        });
+        search.addEventListener('focus', () => {
+            if (select.options.length <= 2) load();
+        }, { once: true });
+        forward.forEach(name => {
+            const other = select.form && select.form.elements[name];
+            if (other) other.addEventListener('change', load);
+        });
+    });
+});